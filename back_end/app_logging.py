@@ -0,0 +1,156 @@
+"""
+Journalisation structurée de l'application, à la place des print().
+
+Chaque module utilise son logger:
+    log = logging.getLogger(__name__)
+    log.info("Demande %s mise à jour: %s", demande_id, statut, extra={"by": email})
+
+Les arguments sont passés à part (jamais de f-string) et les lignes DEBUG
+n'utilisent pas extra: un log.debug désactivé s'arrête à isEnabledFor(), sans
+formatage, sans allocation ni écriture. Les enregistrements retenus sont posés
+dans une file; un thread unique (QueueListener) les formate et les écrit sur
+stdout, hors du chemin de la requête. Si la file est pleine, l'enregistrement
+est abandonné et compté plutôt que de bloquer la requête.
+
+Configuration par variables d'environnement:
+    LOG_LEVEL                niveau par défaut (INFO)
+    LOG_LEVELS               niveaux par module: "routers.demandes=DEBUG,security=WARNING"
+    LOG_FORMAT               json (défaut) ou text
+    LOG_DEBUG_SAMPLE_RATE    part des lignes DEBUG conservées, entre 0 et 1 (1)
+    LOG_QUEUE_SIZE           enregistrements en attente d'écriture (10000)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+# Bibliothèques bavardes au niveau INFO (une ligne par requête HTTP sortante...)
+DEFAULT_LOG_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "multipart": "WARNING", "PIL": "WARNING"}
+
+# Attributs propres à LogRecord: tout le reste vient de extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement: ts, level, logger, msg, champs extra, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Ne garde qu'une part des lignes DEBUG (les autres niveaux passent toujours)"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui abandonne au lieu de bloquer et ne formate pas dans le thread appelant"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Seule la substitution des arguments est faite ici (ils peuvent changer
+        # après l'appel); le formatage JSON/texte a lieu dans le thread d'écriture
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Installer la file et le thread d'écriture sur le logger racine (une seule fois)"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "text":
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    _handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in {**DEFAULT_LOG_LEVELS, **_parse_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Vider la file et arrêter le thread d'écriture"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logging_stats() -> dict:
+    if _handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "level": logging.getLevelName(logging.getLogger().level),
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "debug_sample_rate": LOG_DEBUG_SAMPLE_RATE,
+    }
@@ -0,0 +1,422 @@
+"""
+Lots d'attestations de travail (fin de semestre, fin d'année).
+
+Un lot est créé à partir d'un filtre (rôle, service de fonctionnaires, grade):
+les utilisateurs actifs concernés sont figés dans attestation_job_items à la
+création. Un thread de fond traite les lots en attente par tranches, sur un
+pool de processus (un par cœur par défaut): chaque processus rend et écrit les
+fichiers (attestations.render_attestation_files). Après chaque tranche, l'état
+des lignes, les compteurs du lot et le journal attestation_events sont
+enregistrés dans une seule transaction.
+
+Plusieurs processus serveur (uvicorn --workers, gunicorn -w) ont chacun leur
+runner: un lot est pris par un UPDATE conditionnel (status "pending" -> "running",
+owner = identifiant du runner) dont rowcount désigne le seul gagnant. Le
+propriétaire rafraîchit heartbeat à chaque tranche et chaque enregistrement
+vérifie qu'il l'est toujours. Un lot "running" dont le heartbeat date de plus de
+ATTESTATION_BATCH_STALE_SECONDS est orphelin (processus tué) et peut être repris.
+
+Reprise après un arrêt ou un crash: un arrêt propre rend le lot ("pending"), un
+lot orphelin est repris à l'expiration de son heartbeat; il repart de ses lignes
+encore "pending". Les fichiers déjà écrits sont retrouvés par leur nom (clé de
+cache des attestations) et ne sont pas rendus deux fois.
+Une panne pendant le traitement (processus du pool tué, base verrouillée...)
+ne termine pas le lot: il repasse "pending" et est réessayé avec un délai
+croissant. Après ATTESTATION_BATCH_MAX_ATTEMPTS échecs consécutifs il passe
+"failed", ses lignes restant "pending"; resume_job() le remet en file.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlite_pool import get_sqlite_connection
+from attestations import load_work_attestation_data, render_attestation_files, attestation_event
+from attestation_log import insert_attestation_events
+
+log = logging.getLogger(__name__)
+
+
+def _available_cores() -> int:
+    # Cœurs réellement attribués au processus (taskset, conteneur), sinon ceux de la machine
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# 0 = un processus par cœur disponible
+ATTESTATION_BATCH_WORKERS = int(os.environ.get("ATTESTATION_BATCH_WORKERS", "0")) or _available_cores()
+# Attestations par processus et par tranche (une transaction SQLite par tranche)
+ATTESTATION_BATCH_CHUNK_PER_WORKER = 8
+# Échecs consécutifs d'un lot avant abandon (reprise manuelle);
+# délai avant le premier nouvel essai, doublé à chaque échec
+ATTESTATION_BATCH_MAX_ATTEMPTS = int(os.environ.get("ATTESTATION_BATCH_MAX_ATTEMPTS", "5"))
+ATTESTATION_BATCH_RETRY_SECONDS = float(os.environ.get("ATTESTATION_BATCH_RETRY_SECONDS", "30"))
+ATTESTATION_BATCH_MAX_RETRY_SECONDS = 900
+ATTESTATION_BATCH_POLL_SECONDS = 10
+# Heartbeat au-delà duquel un lot "running" est orphelin: doit dépasser la durée d'une tranche
+ATTESTATION_BATCH_STALE_SECONDS = float(os.environ.get("ATTESTATION_BATCH_STALE_SECONDS", "300"))
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_CANCELLED = "cancelled"
+JOB_FAILED = "failed"
+# Lots relançables par resume_job (un lot terminé seulement s'il a des lignes en échec)
+RESUMABLE_STATUSES = (JOB_FAILED, JOB_CANCELLED, JOB_COMPLETED)
+
+BATCH_ROLES = {"ENSEIGNANT", "FONCTIONNAIRE", "SECRETAIRE", "ADMIN"}
+
+
+def select_batch_users(conn, filters: dict) -> list:
+    """Identifiants des utilisateurs actifs correspondant au filtre (role, service, grade)"""
+    conditions, params = ["u.is_active = 1"], []
+    if filters.get("role"):
+        conditions.append("u.role = ?")
+        params.append(filters["role"])
+    if filters.get("service"):
+        conditions.append("f.service = ?")
+        params.append(filters["service"])
+    if filters.get("grade"):
+        conditions.append("COALESCE(f.grade, e.grade) = ?")
+        params.append(filters["grade"])
+    rows = conn.execute(f'''
+        SELECT DISTINCT u.id
+        FROM users u
+        LEFT JOIN enseignants e ON e.user_id = u.id
+        LEFT JOIN fonctionnaires f ON f.user_id = u.id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY u.id
+    ''', params).fetchall()
+    return [row["id"] for row in rows]
+
+
+def _job_progress(row) -> dict:
+    job = dict(row)
+    job["filters"] = json.loads(job["filters"])
+    processed = job["done"] + job["failed"]
+    job["pending"] = job["total"] - processed
+    job["percent"] = round(100.0 * processed / job["total"], 1) if job["total"] else 100.0
+    job["eta_seconds"] = None
+    if job["status"] == JOB_RUNNING and job["started_at"] and processed:
+        elapsed = (datetime.now() - datetime.fromisoformat(job["started_at"])).total_seconds()
+        job["eta_seconds"] = round(elapsed / processed * job["pending"], 1)
+    return job
+
+
+class AttestationBatchRunner:
+    """Exécution des lots d'attestations dans un thread de fond, rendu sur un pool de processus"""
+
+    def __init__(self, workers: int = ATTESTATION_BATCH_WORKERS):
+        self.workers = max(1, workers)
+        # Propriétaire des lots pris par ce runner (un par processus serveur)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def create_job(self, filters: dict, created_by: str = None) -> dict:
+        """Créer un lot pour les utilisateurs correspondant au filtre; None si aucun utilisateur"""
+        filters = {key: value for key, value in filters.items() if value}
+        conn = get_sqlite_connection(write=True)
+        try:
+            user_ids = select_batch_users(conn, filters)
+            if not user_ids:
+                return None
+            now = datetime.now()
+            cursor = conn.execute('''
+                INSERT INTO attestation_jobs (created_at, created_by, filters, date_emission, status, total)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (now.isoformat(), created_by, json.dumps(filters, ensure_ascii=False),
+                  now.strftime("%d/%m/%Y"), JOB_PENDING, len(user_ids)))
+            job_id = cursor.lastrowid
+            conn.executemany("INSERT INTO attestation_job_items (job_id, user_id) VALUES (?, ?)",
+                             [(job_id, user_id) for user_id in user_ids])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        log.info("Lot %s: %d attestation(s) à produire", job_id, len(user_ids), extra={"filters": filters})
+        self._wake.set()
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: int) -> dict:
+        conn = get_sqlite_connection()
+        try:
+            row = conn.execute("SELECT * FROM attestation_jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return _job_progress(row) if row else None
+
+    def list_jobs(self, limit: int = 20) -> list:
+        conn = get_sqlite_connection()
+        try:
+            rows = conn.execute("SELECT * FROM attestation_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [_job_progress(row) for row in rows]
+
+    def cancel_job(self, job_id: int) -> bool:
+        """Annuler un lot en attente ou en cours (la tranche en cours se termine)"""
+        conn = get_sqlite_connection(write=True)
+        try:
+            cursor = conn.execute('''
+                UPDATE attestation_jobs SET status = ?, finished_at = ?
+                WHERE id = ? AND status IN (?, ?)
+            ''', (JOB_CANCELLED, datetime.now().isoformat(), job_id, JOB_PENDING, JOB_RUNNING))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def resume_job(self, job_id: int) -> bool:
+        """Remettre en file un lot abandonné, annulé ou terminé avec des échecs (lignes en échec comprises)"""
+        conn = get_sqlite_connection(write=True)
+        try:
+            job = conn.execute("SELECT status, failed FROM attestation_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None or job["status"] not in RESUMABLE_STATUSES or (
+                    job["status"] == JOB_COMPLETED and not job["failed"]):
+                return False
+            retried = conn.execute('''
+                UPDATE attestation_job_items SET status = 'pending', error = NULL
+                WHERE job_id = ? AND status = 'failed'
+            ''', (job_id,)).rowcount
+            conn.execute('''
+                UPDATE attestation_jobs
+                SET status = ?, failed = failed - ?, attempts = 0, next_attempt_at = NULL, last_error = NULL,
+                    finished_at = NULL, owner = NULL, heartbeat = NULL
+                WHERE id = ?
+            ''', (JOB_PENDING, retried, job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        log.info("Lot %s remis en file (%d ligne(s) en échec relancée(s))", job_id, retried)
+        self._wake.set()
+        return True
+
+    def _claim_next_job(self):
+        """Prendre un lot: en attente (délai d'essai échu) ou orphelin; None si aucun ou pris par un autre"""
+        now = datetime.now()
+        stale = (now - timedelta(seconds=ATTESTATION_BATCH_STALE_SECONDS)).isoformat()
+        conn = get_sqlite_connection(write=True)
+        try:
+            for candidate in conn.execute('''
+                SELECT id FROM attestation_jobs
+                WHERE (status = ? AND (next_attempt_at IS NULL OR next_attempt_at <= ?))
+                   OR (status = ? AND (heartbeat IS NULL OR heartbeat < ?))
+                ORDER BY id LIMIT 5
+            ''', (JOB_PENDING, now.isoformat(), JOB_RUNNING, stale)).fetchall():
+                # Seul le heartbeat expiré signale un lot "running" abandonné
+                claimed = conn.execute('''
+                    UPDATE attestation_jobs
+                    SET status = ?, owner = ?, heartbeat = ?, started_at = COALESCE(started_at, ?)
+                    WHERE id = ? AND (status = ? OR (status = ? AND (heartbeat IS NULL OR heartbeat < ?)))
+                ''', (JOB_RUNNING, self.owner, now.isoformat(), now.isoformat(),
+                      candidate["id"], JOB_PENDING, JOB_RUNNING, stale)).rowcount
+                if claimed:
+                    job = conn.execute("SELECT * FROM attestation_jobs WHERE id = ?", (candidate["id"],)).fetchone()
+                    conn.commit()
+                    log.info("Lot %s pris par %s", job["id"], self.owner)
+                    return job
+            conn.commit()
+            return None
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _record_failure(self, job, error: Exception):
+        """Échec du traitement (pas d'une attestation): lignes laissées "pending", nouvel essai différé"""
+        attempts = job["attempts"] + 1
+        if attempts >= ATTESTATION_BATCH_MAX_ATTEMPTS:
+            status, next_attempt_at, finished_at = JOB_FAILED, None, datetime.now().isoformat()
+            log.error("Lot %s abandonné après %d échecs consécutifs (reprise: POST /attestations/batch/%s/resume)",
+                      job["id"], attempts, job["id"])
+        else:
+            delay = min(ATTESTATION_BATCH_RETRY_SECONDS * 2 ** (attempts - 1), ATTESTATION_BATCH_MAX_RETRY_SECONDS)
+            next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+            status, finished_at = JOB_PENDING, None
+            log.warning("Lot %s: échec %d/%d, nouvel essai dans %.0f s",
+                        job["id"], attempts, ATTESTATION_BATCH_MAX_ATTEMPTS, delay)
+        conn = get_sqlite_connection(write=True)
+        try:
+            # Le lot est rendu; un lot annulé ou repris par un autre runner entre-temps n'est pas touché
+            conn.execute('''
+                UPDATE attestation_jobs
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, finished_at = ?, owner = NULL
+                WHERE id = ? AND status = ? AND owner = ?
+            ''', (status, attempts, next_attempt_at, f"{type(error).__name__}: {error}", finished_at,
+                  job["id"], JOB_RUNNING, self.owner))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _heartbeat(self, job) -> bool:
+        """Rafraîchir le heartbeat; False si le lot a été annulé ou repris par un autre runner"""
+        conn = get_sqlite_connection(write=True)
+        try:
+            cursor = conn.execute('''
+                UPDATE attestation_jobs SET heartbeat = ? WHERE id = ? AND status = ? AND owner = ?
+            ''', (datetime.now().isoformat(), job["id"], JOB_RUNNING, self.owner))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def _release(self, job):
+        """Arrêt du serveur: le lot repasse "pending" pour un autre runner ou le prochain démarrage"""
+        conn = get_sqlite_connection(write=True)
+        try:
+            conn.execute('''
+                UPDATE attestation_jobs SET status = ?, owner = NULL, heartbeat = NULL
+                WHERE id = ? AND status = ? AND owner = ?
+            ''', (JOB_PENDING, job["id"], JOB_RUNNING, self.owner))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _pending_chunk(self, job, size: int):
+        conn = get_sqlite_connection()
+        try:
+            user_ids = [row["user_id"] for row in conn.execute('''
+                SELECT user_id FROM attestation_job_items
+                WHERE job_id = ? AND status = 'pending'
+                ORDER BY user_id LIMIT ?
+            ''', (job["id"], size))]
+            return user_ids, load_work_attestation_data(conn, user_ids, job["date_emission"])
+        finally:
+            conn.close()
+
+    def _save_chunk(self, job, results, created_by: str) -> bool:
+        """Une transaction par tranche: lignes, compteurs du lot et journal des émissions.
+        False (rien d'enregistré) si le lot n'appartient plus à ce runner"""
+        done = [(data, issued) for data, issued, _ in results if issued is not None]
+        failed = [(data["user_id"], error) for data, issued, error in results if issued is None]
+        conn = get_sqlite_connection(write=True)
+        try:
+            # Une tranche enregistrée remet à zéro le compteur d'échecs consécutifs
+            owned = conn.execute('''
+                UPDATE attestation_jobs
+                SET done = done + ?, failed = failed + ?, attempts = 0, last_error = NULL, heartbeat = ?
+                WHERE id = ? AND status = ? AND owner = ?
+            ''', (len(done), len(failed), datetime.now().isoformat(), job["id"], JOB_RUNNING, self.owner)).rowcount
+            if not owned:
+                conn.rollback()
+                return False
+            conn.executemany('''
+                UPDATE attestation_job_items SET status = 'done', fichier_pdf = ?, error = NULL
+                WHERE job_id = ? AND user_id = ?
+            ''', [(issued["fichier_pdf"], job["id"], data["user_id"]) for data, issued in done])
+            conn.executemany('''
+                UPDATE attestation_job_items SET status = 'failed', error = ?
+                WHERE job_id = ? AND user_id = ?
+            ''', [(error, job["id"], user_id) for user_id, error in failed])
+            insert_attestation_events(conn, [
+                attestation_event(data, issued, {"email": created_by}) for data, issued in done
+            ])
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _process_job(self, job):
+        """Traiter un lot pris par _claim_next_job"""
+        workers = max(1, min(self.workers, job["total"] - job["done"] - job["failed"]))
+        chunk_size = workers * ATTESTATION_BATCH_CHUNK_PER_WORKER
+        log.info("Lot %s: rendu sur %d processus", job["id"], workers)
+        # spawn: pas de fork d'un processus qui a déjà des threads (serveur, pool SQLite)
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            while not self._stop.is_set() and self._heartbeat(job):
+                user_ids, chunk = self._pending_chunk(job, chunk_size)
+                if not user_ids:
+                    break
+                futures = [(data, executor.submit(render_attestation_files, data)) for data in chunk]
+                results = []
+                for data, future in futures:
+                    try:
+                        results.append((data, future.result(), None))
+                    except BrokenProcessPool:
+                        # Panne du pool, pas de l'attestation: les lignes restent "pending"
+                        raise
+                    except Exception as e:
+                        results.append((data, None, str(e)))
+                # Utilisateurs supprimés depuis la création du lot
+                found = {data["user_id"] for data in chunk}
+                results.extend(({"user_id": user_id}, None, "Utilisateur introuvable") for user_id in user_ids
+                               if user_id not in found)
+                if not self._save_chunk(job, results, job["created_by"]):
+                    log.warning("Lot %s annulé ou repris par un autre runner: tranche abandonnée", job["id"])
+                    return
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        if self._stop.is_set():
+            self._release(job)
+            return
+        conn = get_sqlite_connection(write=True)
+        try:
+            conn.execute('''
+                UPDATE attestation_jobs SET status = ?, finished_at = ?
+                WHERE id = ? AND status = ? AND owner = ? AND NOT EXISTS (
+                    SELECT 1 FROM attestation_job_items WHERE job_id = ? AND status = 'pending'
+                )
+            ''', (JOB_COMPLETED, datetime.now().isoformat(), job["id"], JOB_RUNNING, self.owner, job["id"]))
+            conn.commit()
+        finally:
+            conn.close()
+        final = self.get_job(job["id"])
+        log.info("Lot %s %s: %d produite(s), %d en échec", job["id"], final["status"], final["done"], final["failed"])
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            job = None
+            try:
+                job = self._claim_next_job()
+                if job is not None:
+                    self._process_job(job)
+                    continue
+            except Exception as e:
+                log.exception("Erreur du lot %s", job["id"] if job else "?")
+                if job is not None:
+                    try:
+                        self._record_failure(job, e)
+                    except Exception:
+                        log.exception("Lot %s: échec non enregistré", job["id"])
+            # Réveil à la création d'un lot, sinon à intervalle régulier (essais différés)
+            self._wake.wait(ATTESTATION_BATCH_POLL_SECONDS)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attestation-batch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Le lot en cours est rendu ("pending") après la tranche en cours
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+
+attestation_batch_runner = AttestationBatchRunner()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Journal des attestations émises, dans la table SQLite attestation_events.
+
+Remplace uploads/attestations/attestations_log.json, un tableau JSON relu et
+réécrit en entier à chaque attestation. Chaque émission est une ligne insérée
+(des triggers refusent UPDATE et DELETE: journal en ajout seul), indexée par
+demande, email du bénéficiaire et date.
+
+L'ancien fichier JSON (suivi par git) est importé au démarrage sans être
+modifié ni renommé: l'import est marqué dans legacy_imports avec le SHA-256 du
+fichier, les démarrages suivants ne le relisent pas tant que son contenu ne
+change pas. INSERT OR IGNORE et l'index unique rendent tout nouvel import sans
+doublons. Import manuel, depuis back_end/:
+    python attestation_log.py [chemin/vers/attestations_log.json]
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+from sqlite_pool import get_sqlite_connection
+
+LEGACY_LOG_FILE = Path("uploads/attestations/attestations_log.json")
+
+EVENT_COLUMNS = (
+    "created_at", "demande_id", "user_id", "user_email", "user_name", "type_demande", "titre",
+    "fichier_html", "fichier_pdf", "status", "reference", "issued_by",
+)
+_INSERT_EVENT = f'''
+    INSERT OR IGNORE INTO attestation_events ({", ".join(EVENT_COLUMNS)})
+    VALUES ({", ".join("?" for _ in EVENT_COLUMNS)})
+'''
+
+
+def _event_values(entry: dict) -> tuple:
+    # Format du fichier JSON: "timestamp", chemins Windows (uploads\attestations\...)
+    created_at = entry.get("created_at") or entry.get("timestamp") or datetime.now().isoformat()
+    values = {**entry, "created_at": created_at}
+    for key in ("fichier_html", "fichier_pdf"):
+        values[key] = str(values.get(key) or "").replace("\\", "/")
+    return tuple(values.get(column) for column in EVENT_COLUMNS)
+
+
+def insert_attestation_events(conn, entries):
+    """Ajouter des émissions dans la transaction en cours de conn (connexion d'écriture)"""
+    conn.executemany(_INSERT_EVENT, [_event_values(entry) for entry in entries])
+
+
+def record_attestation_event(entry: dict):
+    """Ajouter une émission d'attestation au journal"""
+    conn = get_sqlite_connection(write=True)
+    try:
+        insert_attestation_events(conn, [entry])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def import_legacy_log(path: Path = LEGACY_LOG_FILE) -> int:
+    """Importer l'ancien journal JSON (ignoré s'il a déjà été importé tel quel); retourne le nombre de lignes ajoutées"""
+    path = Path(path)
+    if not path.exists():
+        return 0
+    content = path.read_bytes()
+    sha256 = hashlib.sha256(content).hexdigest()
+    conn = get_sqlite_connection(write=True)
+    try:
+        done = conn.execute("SELECT sha256 FROM legacy_imports WHERE source = ?", (path.as_posix(),)).fetchone()
+        if done is not None and done["sha256"] == sha256:
+            return 0
+        entries = json.loads(content.decode("utf-8") or "[]")
+        before = conn.total_changes
+        # INSERT OR IGNORE + index unique: un import interrompu ou rejoué n'ajoute pas de doublons
+        conn.executemany(_INSERT_EVENT, [_event_values(entry) for entry in entries if isinstance(entry, dict)])
+        imported = conn.total_changes - before
+        conn.execute('''
+            INSERT OR REPLACE INTO legacy_imports (source, sha256, entries, imported_at) VALUES (?, ?, ?, ?)
+        ''', (path.as_posix(), sha256, len(entries), datetime.now().isoformat()))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return imported
+
+
+def query_attestation_events(conn, demande_id: int = None, user_id: int = None, user_email: str = None,
+                             date_debut: str = None, date_fin: str = None,
+                             cursor_key=None, limit: int = 100) -> list:
+    """Émissions les plus récentes d'abord (ORDER BY created_at DESC, id DESC), filtrées"""
+    conditions, params = [], []
+    if demande_id is not None:
+        conditions.append("demande_id = ?")
+        params.append(demande_id)
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if user_email:
+        conditions.append("user_email = ?")
+        params.append(user_email)
+    if date_debut:
+        conditions.append("created_at >= ?")
+        params.append(date_debut)
+    if date_fin:
+        conditions.append("created_at < date(?, '+1 day')")
+        params.append(date_fin)
+    if cursor_key:
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(cursor_key)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = conn.execute(f'''
+        SELECT id, {", ".join(EVENT_COLUMNS)}
+        FROM attestation_events
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    ''', (*params, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    import sys
+
+    from main import apply_migrations
+
+    apply_migrations()
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else LEGACY_LOG_FILE
+    count = import_legacy_log(source)
+    print(f"📜 [ATTESTATIONS] {count} émission(s) importée(s) depuis {source}")
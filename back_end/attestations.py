@@ -0,0 +1,432 @@
+"""
+Génération des attestations (HTML et PDF), avec cache.
+
+Deux sortes d'attestations partagent la même mise en page:
+- "demande": attestation d'une demande approuvée (POST /demandes/{id}/attestation);
+- "travail": attestation de travail d'un membre du personnel, produite en lot
+  (attestation_batch.py).
+
+Les modèles sont compilés une fois au chargement du module (string.Template) et
+leur version est le hash de leur source: modifier un modèle change la version.
+Une attestation est identifiée par (sujet, version des modèles, hash des données
+du bénéficiaire); ses fichiers portent cette clé dans leur nom. Réémettre une
+attestation inchangée réutilise les fichiers existants au lieu de refaire le rendu.
+
+Les fichiers sont écrits dans uploads/attestations/ (HTML) et
+uploads/attestations/pdf/ (PDF); chaque émission est ajoutée au journal
+attestation_events (attestation_log.py).
+"""
+
+import hashlib
+import html
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from string import Template
+
+from cache import TTLCache
+from attestation_log import record_attestation_event
+from simple_pdf import text_pdf
+
+log = logging.getLogger(__name__)
+
+ATTESTATION_DIR = Path("uploads/attestations")
+ATTESTATION_PDF_DIR = ATTESTATION_DIR / "pdf"
+
+ROLE_LABELS = {
+    "ENSEIGNANT": "Enseignant",
+    "FONCTIONNAIRE": "Fonctionnaire",
+    "SECRETAIRE": "Secrétaire",
+    "ADMIN": "Administrateur",
+}
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Attestation - $titre</title>
+    <style>
+        body { font-family: 'Times New Roman', serif; max-width: 800px; margin: 0 auto; padding: 40px; line-height: 1.6; color: #333; background: white; }
+        .header { text-align: center; border-bottom: 3px solid #003366; padding-bottom: 30px; margin-bottom: 40px; }
+        .logo { font-size: 24px; font-weight: bold; color: #003366; margin-bottom: 10px; }
+        .title { font-size: 32px; font-weight: bold; color: #003366; text-transform: uppercase; letter-spacing: 2px; }
+        .content { margin: 40px 0; text-align: justify; }
+        .beneficiaire { background: #f8f9fa; padding: 20px; border-left: 4px solid #003366; margin: 20px 0; }
+        .details { background: #e8f4f8; padding: 15px; border-radius: 5px; margin: 20px 0; }
+        .details p { white-space: pre-line; }
+        .signature { margin-top: 60px; text-align: right; }
+        .footer { margin-top: 40px; text-align: center; font-size: 12px; color: #666; border-top: 1px solid #ddd; padding-top: 20px; }
+        .stamp { border: 2px solid #003366; padding: 10px; display: inline-block; margin-top: 20px; transform: rotate(-5deg); font-weight: bold; color: #003366; }
+        @media print {
+            body { margin: 0; padding: 20px; }
+            .no-print { display: none; }
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <div class="logo">🎓 UNIVERSITÉ</div>
+        <div class="title">ATTESTATION OFFICIELLE</div>
+        <div style="margin-top: 10px; font-size: 14px;">République du Maroc - Ministère de l'Enseignement Supérieur</div>
+    </div>
+
+    <div class="content">
+        <p><strong>Je soussigné(e), Secrétaire de l'Université, certifie et atteste que :</strong></p>
+
+        <div class="beneficiaire">
+            <h3>👤 BÉNÉFICIAIRE</h3>
+            <p><strong>Nom complet :</strong> $nom_complet</p>
+            <p><strong>Email :</strong> $email</p>
+            <p><strong>Fonction :</strong> $fonction</p>
+        </div>
+
+$corps
+
+        <p><strong>Cette attestation est délivrée pour servir et valoir ce que de droit.</strong></p>
+    </div>
+
+    <div class="signature">
+        <p>Fait le $date_jour</p>
+        <div class="stamp">APPROUVÉ<br>Service RH</div>
+        <p style="margin-top: 40px;"><strong>Le Secrétaire</strong><br>
+        <em>Université</em></p>
+    </div>
+
+    <div class="footer">
+        <p>📄 Document généré automatiquement par le Système de Gestion RH</p>
+        <p>🆔 Référence : $reference</p>
+    </div>
+</body>
+</html>
+"""
+
+# Corps de l'attestation selon sa sorte (valeurs déjà échappées, $details: lignes de détail)
+HTML_BODY_TEMPLATES = {
+    "demande": """        <p>A présenté une demande de <strong>$type_demande</strong>
+        intitulée "<em>$titre</em>" qui a été
+        <span style="color: green; font-weight: bold;">✅ APPROUVÉE</span>
+        le $date_approbation.</p>
+
+        <div class="details">
+            <h3>📋 DÉTAILS DE LA DEMANDE</h3>
+$details
+        </div>""",
+    "travail": """        <p>Est employé(e) par l'Université et y exerce à ce jour les fonctions de
+        <strong>$fonction</strong>.</p>
+
+        <div class="details">
+            <h3>📋 SITUATION ADMINISTRATIVE</h3>
+$details
+        </div>""",
+}
+
+# type_demande -> (libellé, [(icône, étiquette, champ)])
+DETAIL_TEMPLATES = {
+    "ATTESTATION": ("📜", "Attestation de travail", [("📝", "Objet", "$description")]),
+    "HEURES_SUP": ("⏰", "Heures supplémentaires", [
+        ("📅", "Période", "Du $date_debut au $date_fin"),
+        ("📝", "Justification", "$description"),
+    ]),
+    "ORDRE_MISSION": ("✈️", "Ordre de mission", [
+        ("📅", "Période", "Du $date_debut au $date_fin"),
+        ("📝", "Objet", "$description"),
+    ]),
+}
+DEFAULT_DETAIL_TEMPLATE = ("📄", "Demande", [("📝", "Description", "$description")])
+# Attestation de travail: lignes vides omises
+WORK_DETAIL_TEMPLATE = ("📜", "Attestation de travail", [
+    ("🎖️", "Grade", "$grade"),
+    ("🏢", "Service", "$service"),
+    ("💼", "Poste", "$poste"),
+    ("📚", "Spécialité", "$specialite"),
+])
+
+TEXT_TEMPLATE = [
+    ("title", "ATTESTATION OFFICIELLE"),
+    ("small", "Université - République du Maroc - Ministère de l'Enseignement Supérieur"),
+    ("body", ""),
+    ("body", "Je soussigné(e), Secrétaire de l'Université, certifie et atteste que :"),
+    ("body", ""),
+    ("heading", "BÉNÉFICIAIRE"),
+    ("body", "Nom complet : $nom_complet"),
+    ("body", "Email : $email"),
+    ("body", "Fonction : $fonction"),
+    ("body", ""),
+    ("corps", ""),
+    ("body", ""),
+    ("body", "Cette attestation est délivrée pour servir et valoir ce que de droit."),
+    ("body", ""),
+    ("body", "Fait le $date_jour"),
+    ("heading", "Le Secrétaire - Université"),
+    ("body", ""),
+    ("small", "Document généré automatiquement par le Système de Gestion RH - Référence : $reference"),
+]
+TEXT_BODY_TEMPLATES = {
+    "demande": [
+        ("body", "A présenté une demande de $type_demande intitulée \"$titre\" "
+                 "qui a été APPROUVÉE le $date_approbation."),
+        ("body", ""),
+        ("heading", "DÉTAILS DE LA DEMANDE"),
+        ("details", ""),
+    ],
+    "travail": [
+        ("body", "Est employé(e) par l'Université et y exerce à ce jour les fonctions de $fonction."),
+        ("body", ""),
+        ("heading", "SITUATION ADMINISTRATIVE"),
+        ("details", ""),
+    ],
+}
+
+
+def _compile_details(template):
+    icon, label, fields = template
+    return icon, label, [(field_icon, name, Template(value)) for field_icon, name, value in fields]
+
+
+def _compile_templates():
+    """Compiler les modèles une fois; la version est le hash de leur source"""
+    source = json.dumps([HTML_TEMPLATE, HTML_BODY_TEMPLATES, DETAIL_TEMPLATES, DEFAULT_DETAIL_TEMPLATE,
+                         WORK_DETAIL_TEMPLATE, TEXT_TEMPLATE, TEXT_BODY_TEMPLATES],
+                        ensure_ascii=False, sort_keys=True)
+    compiled = {
+        "html": Template(HTML_TEMPLATE),
+        "html_bodies": {kind: Template(body) for kind, body in HTML_BODY_TEMPLATES.items()},
+        "details": {
+            type_demande: _compile_details(template)
+            for type_demande, template in {**DETAIL_TEMPLATES, None: DEFAULT_DETAIL_TEMPLATE}.items()
+        },
+        "work_details": _compile_details(WORK_DETAIL_TEMPLATE),
+        "text": [(style, Template(text)) for style, text in TEXT_TEMPLATE],
+        "text_bodies": {
+            kind: [(style, Template(text)) for style, text in lines] for kind, lines in TEXT_BODY_TEMPLATES.items()
+        },
+    }
+    return compiled, hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+
+
+_TEMPLATES, TEMPLATE_VERSION = _compile_templates()
+
+# (sujet, version, hash des données) -> attestation émise
+_issued_cache = TTLCache(maxsize=1024, ttl=3600)
+# Deux émissions simultanées de la même attestation: un seul rendu
+_render_lock = threading.Lock()
+
+
+def _format_date(value) -> str:
+    """JJ/MM/AAAA à partir d'un horodatage SQLite (AAAA-MM-JJ HH:MM:SS) ou ISO"""
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "")).strftime("%d/%m/%Y")
+    except ValueError:
+        return str(value or "")
+
+
+def load_attestation_data(conn, demande_id: int):
+    """Données d'une attestation (demande + bénéficiaire), ou None si la demande n'existe pas"""
+    row = conn.execute("""
+        SELECT d.id, d.user_id, d.type_demande, d.titre, d.description, d.date_debut, d.date_fin, d.statut,
+               COALESCE(d.updated_at, d.created_at) AS date_approbation,
+               u.email, u.nom, u.prenom, u.role
+        FROM demandes d
+        JOIN users u ON u.id = d.user_id
+        WHERE d.id = ?
+    """, (demande_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "kind": "demande",
+        "demande_id": row["id"],
+        "user_id": row["user_id"],
+        "type_demande": row["type_demande"],
+        "titre": row["titre"] or "",
+        "description": row["description"] or "",
+        "date_debut": row["date_debut"] or "",
+        "date_fin": row["date_fin"] or "",
+        "statut": row["statut"],
+        # Date de la décision (et non du rendu): une réémission produit le même document
+        "date_approbation": _format_date(row["date_approbation"]),
+        "email": row["email"],
+        "nom": row["nom"] or "",
+        "prenom": row["prenom"] or "",
+        "fonction": ROLE_LABELS.get(str(row["role"]).upper(), str(row["role"]).capitalize()),
+    }
+
+
+def load_work_attestation_data(conn, user_ids, date_emission: str) -> list:
+    """Données des attestations de travail de plusieurs utilisateurs (une requête)
+
+    date_emission (JJ/MM/AAAA) fait partie des données: un lot relancé le même jour
+    retrouve les mêmes fichiers.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    placeholders = ", ".join("?" for _ in user_ids)
+    rows = conn.execute(f"""
+        SELECT u.id, u.email, u.nom, u.prenom, u.role,
+               COALESCE(f.grade, e.grade) AS grade, f.service, f.poste, e.specialite
+        FROM users u
+        LEFT JOIN enseignants e ON e.user_id = u.id
+        LEFT JOIN fonctionnaires f ON f.user_id = u.id
+        WHERE u.id IN ({placeholders})
+        ORDER BY u.id
+    """, user_ids).fetchall()
+    return [
+        {
+            "kind": "travail",
+            "demande_id": None,
+            "user_id": row["id"],
+            "type_demande": "ATTESTATION",
+            "titre": "Attestation de travail",
+            "date_emission": date_emission,
+            "email": row["email"],
+            "nom": row["nom"] or "",
+            "prenom": row["prenom"] or "",
+            "fonction": ROLE_LABELS.get(str(row["role"]).upper(), str(row["role"]).capitalize()),
+            "grade": row["grade"] or "",
+            "service": row["service"] or "",
+            "poste": row["poste"] or "",
+            "specialite": row["specialite"] or "",
+        }
+        for row in rows
+    ]
+
+
+def data_hash(data: dict) -> str:
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _issue_date(data: dict) -> str:
+    # Date portée par l'attestation: décision sur la demande, ou date d'émission du lot
+    return data["date_approbation"] if data["kind"] == "demande" else data["date_emission"]
+
+
+def attestation_subject(data: dict) -> str:
+    return str(data["demande_id"]) if data["kind"] == "demande" else f"travail_{data['user_id']}"
+
+
+def attestation_reference(data: dict) -> str:
+    try:
+        day = datetime.strptime(_issue_date(data), "%d/%m/%Y").strftime("%Y%m%d")
+    except ValueError:
+        day = "00000000"
+    prefix = data["demande_id"] if data["kind"] == "demande" else f"T{data['user_id']}"
+    return f"ATT-{prefix}-{day}"
+
+
+def render_attestation(data: dict):
+    """(HTML, PDF) d'une attestation à partir des modèles compilés"""
+    values = {
+        **data,
+        "nom_complet": f"{data['prenom']} {data['nom']}".strip(),
+        "reference": attestation_reference(data),
+        "date_jour": _issue_date(data),
+    }
+    if data["kind"] == "demande":
+        icon, label, fields = _TEMPLATES["details"].get(data["type_demande"], _TEMPLATES["details"][None])
+    else:
+        icon, label, fields = _TEMPLATES["work_details"]
+    detail_rows = [(f"{icon} Type", label)] + [
+        (f"{field_icon} {name}", field.safe_substitute(values)) for field_icon, name, field in fields
+    ]
+    if data["kind"] == "travail":
+        detail_rows = [(name, value) for name, value in detail_rows if value.strip()]
+
+    escaped = {key: html.escape(str(value)) for key, value in values.items()}
+    escaped["details"] = "\n".join(
+        f"            <p><strong>{html.escape(name)} :</strong> {html.escape(value)}</p>"
+        for name, value in detail_rows
+    )
+    escaped["corps"] = _TEMPLATES["html_bodies"][data["kind"]].safe_substitute(escaped)
+    html_content = _TEMPLATES["html"].safe_substitute(escaped)
+
+    template_lines = []
+    for style, text in _TEMPLATES["text"]:
+        template_lines.extend(_TEMPLATES["text_bodies"][data["kind"]] if style == "corps" else [(style, text)])
+    lines = []
+    for style, text in template_lines:
+        if style == "details":
+            # Étiquettes sans icônes: hors de l'encodage des polices PDF standard
+            lines.extend(("body", f"{name.split(' ', 1)[1]} : {value}") for name, value in detail_rows)
+        else:
+            lines.append((style, text.safe_substitute(values)))
+    pdf_content = text_pdf(lines, title=f"Attestation {values['reference']}")
+    return html_content, pdf_content
+
+
+def _write_atomic(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}_{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+def render_attestation_files(data: dict) -> dict:
+    """Écrire les fichiers d'une attestation s'ils n'existent pas encore
+
+    Fonction de module (et non méthode) pour pouvoir tourner dans un processus
+    du lot (attestation_batch.py). Retourne les chemins et cached=True si les
+    fichiers existaient déjà.
+    """
+    key = (attestation_subject(data), TEMPLATE_VERSION, data_hash(data))
+    file_key = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:16]
+    base_name = f"attestation_{key[0]}_{''.join(c for c in data['nom'] if c.isalnum()) or 'x'}_{file_key}"
+    html_path = ATTESTATION_DIR / f"{base_name}.html"
+    pdf_path = ATTESTATION_PDF_DIR / f"{base_name}.pdf"
+
+    cached = html_path.exists() and pdf_path.exists()
+    if not cached:
+        html_content, pdf_content = render_attestation(data)
+        _write_atomic(html_path, html_content.encode("utf-8"))
+        _write_atomic(pdf_path, pdf_content)
+    return {
+        "demande_id": data["demande_id"],
+        "user_id": data["user_id"],
+        "reference": attestation_reference(data),
+        "template_version": TEMPLATE_VERSION,
+        "fichier_html": html_path.as_posix(),
+        "fichier_pdf": pdf_path.as_posix(),
+        "cached": cached,
+    }
+
+
+def attestation_event(data: dict, issued: dict, issued_by: dict = None) -> dict:
+    """Ligne du journal attestation_events pour une émission"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "demande_id": data["demande_id"],
+        "user_id": data["user_id"],
+        "user_email": data["email"],
+        "user_name": f"{data['prenom']} {data['nom']}".strip(),
+        "type_demande": data["type_demande"],
+        "titre": data["titre"],
+        "fichier_html": issued["fichier_html"],
+        "fichier_pdf": issued["fichier_pdf"],
+        "status": "cached" if issued["cached"] else "generated",
+        "reference": issued["reference"],
+        "issued_by": (issued_by or {}).get("email"),
+    }
+
+
+def issue_attestation(data: dict, issued_by: dict = None) -> dict:
+    """Émettre une attestation: fichiers en cache ou nouveau rendu, puis journal"""
+    key = (attestation_subject(data), TEMPLATE_VERSION, data_hash(data))
+    issued = _issued_cache.get(key)
+    if issued is not None and Path(issued["fichier_html"]).exists() and Path(issued["fichier_pdf"]).exists():
+        issued = {**issued, "cached": True}
+    else:
+        with _render_lock:
+            issued = render_attestation_files(data)
+        if not issued["cached"]:
+            log.info("Rendu de %s (modèles %s)", issued["fichier_pdf"], TEMPLATE_VERSION)
+        _issued_cache.set(key, issued)
+
+    record_attestation_event(attestation_event(data, issued, issued_by))
+    return issued
+
+
+def get_attestation_cache_stats() -> dict:
+    return {"template_version": TEMPLATE_VERSION, **_issued_cache.stats()}
@@ -46,18 +46,6 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    # Support temporaire pour les test_tokens
-    if token.startswith("test_token_"):
-        parts = token.split("_")
-        if len(parts) >= 4:
-            user_id = int(parts[2])
-            user_role = parts[3]
-            
-            # Récupérer l'utilisateur depuis la base
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                return user
-    
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
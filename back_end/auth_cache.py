@@ -0,0 +1,54 @@
+"""
+Cache token -> utilisateur pour la dépendance d'authentification (security.py).
+
+Évite une requête SELECT sur users à chaque requête authentifiée. Les entrées
+expirent après AUTH_CACHE_TTL secondes et sont invalidées explicitement quand
+l'utilisateur est modifié, désactivé ou supprimé (invalidate_user).
+
+Un JWT reste signé jusqu'à son expiration même si l'utilisateur est supprimé:
+security.py confirme users.is_active et le rôle à chaque résolution hors cache,
+la révocation est donc portée par la base (tous les processus, après un
+redémarrage). Les autres processus gardent au plus AUTH_CACHE_TTL secondes
+leur entrée en cache.
+"""
+
+from cache import TTLCache
+
+AUTH_CACHE_MAXSIZE = 2048
+AUTH_CACHE_TTL = 60.0
+
+# Clé: (scope, token)
+_principal_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL)
+
+
+def get_cached_principal(scope: str, token: str):
+    """Utilisateur résolu pour ce token, ou None s'il n'est pas en cache"""
+    principal = _principal_cache.get((scope, token))
+    # Copie: les appelants ne doivent pas modifier l'entrée partagée
+    return dict(principal) if principal is not None else None
+
+
+def cache_principal(scope: str, token: str, principal: dict, ttl: float = None) -> dict:
+    """Mettre en cache l'utilisateur résolu et le renvoyer"""
+    _principal_cache.set((scope, token), dict(principal), ttl=ttl)
+    return principal
+
+
+def invalidate_user(user_id):
+    """A appeler après modification, désactivation ou suppression d'un utilisateur"""
+    user_id = int(user_id)
+    return _principal_cache.delete_where(lambda principal: principal.get("id") == user_id)
+
+
+def revoke_user(user_id):
+    """A appeler après suppression ou désactivation: les JWT déjà émis sont refusés
+    à leur prochaine résolution (users.is_active vérifié hors cache)"""
+    return invalidate_user(user_id)
+
+
+def clear_auth_cache():
+    _principal_cache.clear()
+
+
+def get_auth_cache_stats() -> dict:
+    return _principal_cache.stats()
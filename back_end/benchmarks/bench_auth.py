@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark du coût d'authentification par requête.
+
+Compare, sur une copie de gestion_db.db:
+- avant: test_token analysé puis SELECT sur users à chaque requête
+  (ancien get_current_user_from_token);
+- JWT sans cache: vérification de signature à chaque requête;
+- après: get_current_principal (JWT signé, token déjà en cache).
+
+Usage (depuis back_end/):
+    python -m benchmarks.bench_auth [--iterations 20000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+
+def legacy_lookup(authorization: str):
+    """Ancienne résolution: parsing du test_token + requête SQL à chaque appel"""
+    from sqlite_pool import get_sqlite_connection
+
+    token = authorization.replace("Bearer ", "")
+    parts = token.split("_")
+    conn = get_sqlite_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ? AND role = ? AND is_active = 1", (parts[2], parts[3].upper()))
+    user_data = cursor.fetchone()
+    conn.close()
+    return dict(user_data)
+
+
+def measure(label: str, func, iterations: int) -> float:
+    func()  # échauffement
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call_us = (time.perf_counter() - started) / iterations * 1_000_000
+    print(f"{label:<34} {per_call_us:>10.2f} µs/requête")
+    return per_call_us
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_auth_"), "auth.db")
+    source = sqlite3.connect("gestion_db.db")
+    target = sqlite3.connect(db_path)
+    source.backup(target)
+    source.close()
+    target.close()
+    os.environ["SQLITE_DB_PATH"] = db_path
+
+    # Importer après avoir positionné SQLITE_DB_PATH
+    import auth_cache
+    from security import PRINCIPAL_SCOPE, create_user_token, get_current_principal, _resolve_jwt
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    user = conn.execute("SELECT * FROM users WHERE is_active = 1 ORDER BY id LIMIT 1").fetchone()
+    conn.close()
+    if user is None:
+        print("❌ Aucun utilisateur actif dans gestion_db.db")
+        return 1
+
+    legacy_header = f"Bearer test_token_{user['id']}_{user['role']}"
+    jwt_token = create_user_token(user)
+    jwt_header = f"Bearer {jwt_token}"
+
+    def jwt_uncached():
+        auth_cache._principal_cache.delete((PRINCIPAL_SCOPE, jwt_token))
+        return _resolve_jwt(jwt_token)
+
+    print(f"Utilisateur: {user['email']} ({user['role']}), {args.iterations} itérations")
+    before = measure("avant (test_token + SELECT)", lambda: legacy_lookup(legacy_header), args.iterations)
+    measure("JWT sans cache (signature + SELECT par id)", jwt_uncached, args.iterations)
+    after = measure("après (get_current_principal)", lambda: get_current_principal(jwt_header), args.iterations)
+
+    print(f"✅ Gain: x{before / after:.1f} ({auth_cache.get_auth_cache_stats()['hit_ratio']:.2%} de hits)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark du coût d'écriture d'une demande dans les stores JSON.
+
+Compare, dans un répertoire temporaire, pour un DEMANDES_DB de N demandes:
+- avant: réécriture complète des fichiers JSON (ancien save_all_data);
+- après: ajout d'une ligne au journal (DataJournal.set), compaction comprise.
+
+Usage (depuis back_end/):
+    python -m benchmarks.bench_data_journal [--demandes 5000] [--writes 200]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from data_journal import DataJournal
+
+
+def make_demande(demande_id: int) -> dict:
+    return {
+        "id": demande_id,
+        "user_id": 3,
+        "type_demande": "ATTESTATION",
+        "titre": f"Demande {demande_id}",
+        "description": "Demande d'attestation de travail",
+        "statut": "EN_ATTENTE",
+        "commentaire_admin": None,
+        "created_at": "2024-01-01T00:00:00",
+        "user": {"id": 3, "email": "enseignant@univ.ma", "nom": "Tazi", "prenom": "Ahmed", "role": "enseignant"},
+    }
+
+
+def full_rewrite(data_dir: Path, demandes: dict, writes: int) -> float:
+    """Ancienne persistance: json.dump(indent=2) de tout le store à chaque écriture"""
+    next_id = len(demandes) + 1
+    started = time.perf_counter()
+    for _ in range(writes):
+        demandes[next_id] = make_demande(next_id)
+        next_id += 1
+        with open(data_dir / "demandes.json", "w", encoding="utf-8") as f:
+            json.dump(demandes, f, ensure_ascii=False, indent=2)
+    return (time.perf_counter() - started) / writes * 1000
+
+
+def journal_append(data_dir: Path, demandes: dict, writes: int) -> float:
+    journal = DataJournal(data_dir, {"demandes": "demandes.json"})
+    journal.load({"demandes": demandes})
+    next_id = len(demandes) + 1
+    started = time.perf_counter()
+    for _ in range(writes):
+        journal.set("demandes", next_id, make_demande(next_id))
+        next_id += 1
+    return (time.perf_counter() - started) / writes * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--demandes", type=int, default=5000, help="taille initiale de DEMANDES_DB")
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+
+    base = {str(i): make_demande(i) for i in range(1, args.demandes + 1)}
+
+    before = full_rewrite(Path(tempfile.mkdtemp(prefix="bench_journal_")), dict(base), args.writes)
+    print(f"{'avant (réécriture complète)':<30} {before:>10.3f} ms/écriture")
+    after = journal_append(Path(tempfile.mkdtemp(prefix="bench_journal_")), dict(base), args.writes)
+    print(f"{'après (journal)':<30} {after:>10.3f} ms/écriture")
+
+    print(f"✅ Gain: x{before / after:.1f} pour {args.demandes} demandes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark du nombre de requêtes SQL de GET /demandes/ selon la taille de page.
+
+Crée une base temporaire avec le schéma de gestion_db.db, y insère des demandes
+avec documents, puis appelle get_demandes() pour plusieurs valeurs de limit en
+comptant les requêtes exécutées. Le nombre de requêtes doit rester constant.
+
+Usage (depuis back_end/):
+    python -m benchmarks.bench_demandes_queries
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+PAGE_SIZES = (10, 50, 100, 500)
+DEMANDES_COUNT = 600
+DOCUMENTS_PER_DEMANDE = 2
+
+
+def create_seeded_database(path: str):
+    """Copier le schéma de gestion_db.db et insérer des données de test"""
+    source = sqlite3.connect("gestion_db.db")
+    schema = [row[0] for row in source.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+    )]
+    source.close()
+
+    conn = sqlite3.connect(path)
+    for statement in schema:
+        conn.execute(statement)
+    conn.execute('''
+        INSERT INTO users (id, email, nom, prenom, hashed_password, role, is_active)
+        VALUES (1, 'admin@bench.ma', 'Admin', 'Bench', 'x', 'ADMIN', 1)
+    ''')
+    conn.executemany('''
+        INSERT INTO demandes (id, user_id, type_demande, titre, statut, created_at)
+        VALUES (?, 1, 'ORDRE_MISSION', ?, 'EN_ATTENTE', datetime('now', ?))
+    ''', [(i, f"Demande {i}", f"-{i} minutes") for i in range(1, DEMANDES_COUNT + 1)])
+    conn.executemany('''
+        INSERT INTO demande_documents (demande_id, filename, original_filename, file_path, file_size, content_type)
+        VALUES (?, ?, ?, ?, 1024, 'application/pdf')
+    ''', [
+        (i, f"doc_{i}_{j}.pdf", f"doc_{j}.pdf", f"uploads/demandes/doc_{i}_{j}.pdf")
+        for i in range(1, DEMANDES_COUNT + 1)
+        for j in range(DOCUMENTS_PER_DEMANDE)
+    ])
+    conn.commit()
+    conn.close()
+
+
+def main() -> int:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_demandes_")
+    db_path = os.path.join(tmp_dir, "bench.db")
+    create_seeded_database(db_path)
+    os.environ["SQLITE_DB_PATH"] = db_path
+
+    # Importer après avoir positionné SQLITE_DB_PATH
+    import sqlite_pool
+    from fastapi import Response
+    from routers.demandes import get_demandes
+    from security import create_user_token, get_current_principal
+
+    statements = []
+    reader = sqlite_pool.pool._get_reader()
+    reader.set_trace_callback(statements.append)
+
+    authorization = "Bearer " + create_user_token(
+        {"id": 1, "email": "admin@bench.ma", "nom": "Admin", "prenom": "Bench", "role": "ADMIN"})
+    # Résoudre le token une fois: seules les requêtes de la liste sont comptées
+    get_current_principal(authorization)
+    results = []
+    for limit in PAGE_SIZES:
+        statements.clear()
+        started = time.perf_counter()
+        demandes = get_demandes(Response(), skip=0, limit=limit, authorization=authorization)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        documents = sum(len(d["documents"]) for d in demandes)
+        results.append((limit, len(demandes), documents, len(statements), elapsed_ms))
+
+    reader.set_trace_callback(None)
+
+    print(f"{'limit':>6} {'demandes':>9} {'documents':>10} {'requêtes':>9} {'ms':>9}")
+    for limit, count, documents, queries, elapsed_ms in results:
+        print(f"{limit:>6} {count:>9} {documents:>10} {queries:>9} {elapsed_ms:>9.2f}")
+
+    query_counts = {queries for _, _, _, queries, _ in results}
+    if len(query_counts) != 1:
+        print("❌ Le nombre de requêtes varie avec la taille de page (N+1)")
+        return 1
+    print(f"✅ Nombre de requêtes constant: {query_counts.pop()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
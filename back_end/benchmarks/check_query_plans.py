@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Vérification EXPLAIN QUERY PLAN des requêtes chaudes.
+
+Copie la base (gestion_db.db par défaut) dans un fichier temporaire, applique
+les migrations, puis vérifie pour chaque requête chaude que le plan utilise
+l'index attendu et ne parcourt pas la table principale en entier.
+Code de sortie 1 en cas de régression.
+
+Usage (depuis back_end/):
+    python -m benchmarks.check_query_plans [--db chemin/vers/base.db]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+from migrations import run_migrations
+
+# (nom, requête, paramètres, index acceptés)
+HOT_QUERIES = [
+    (
+        "GET /demandes/ (admin/secrétaire)",
+        """SELECT d.id, d.titre, u.nom FROM demandes d JOIN users u ON d.user_id = u.id
+           ORDER BY d.created_at DESC, d.id DESC LIMIT ?""",
+        (100,),
+        ("ix_demandes_created_at_id",),
+    ),
+    (
+        "GET /demandes/ page suivante (curseur)",
+        """SELECT d.id, d.titre, u.nom FROM demandes d JOIN users u ON d.user_id = u.id
+           WHERE (d.created_at, d.id) < (?, ?)
+           ORDER BY d.created_at DESC, d.id DESC LIMIT ?""",
+        ("2100-01-01", 1, 100),
+        ("ix_demandes_created_at_id",),
+    ),
+    (
+        "GET /demandes/user/me, /users/{id}/demandes",
+        """SELECT d.id, d.titre FROM demandes d JOIN users u ON d.user_id = u.id
+           WHERE d.user_id = ? ORDER BY d.created_at DESC, d.id DESC LIMIT ?""",
+        (1, 100),
+        ("ix_demandes_user_created_at_id",),
+    ),
+    (
+        "Documents de la page (IN)",
+        """SELECT id, demande_id, filename FROM demande_documents
+           WHERE demande_id IN (?, ?, ?) ORDER BY demande_id, uploaded_at DESC""",
+        (1, 2, 3),
+        ("ix_demande_documents_demande_id",),
+    ),
+    (
+        "Dashboard: demandes par statut",
+        "SELECT statut, COUNT(*) FROM demandes GROUP BY statut",
+        (),
+        ("ix_demandes_statut_created_at",),
+    ),
+    (
+        "Dashboard: utilisateurs actifs par rôle",
+        "SELECT COUNT(*) FROM users WHERE is_active = 1 AND role = ?",
+        ("SECRETAIRE",),
+        ("ix_users_role_active",),
+    ),
+    (
+        "Dashboard: enseignants actifs",
+        """SELECT COUNT(*) FROM users u JOIN enseignants e ON u.id = e.user_id
+           WHERE u.is_active = 1 AND u.role = 'ENSEIGNANT'""",
+        (),
+        ("ix_users_role_active", "ix_users_role_nom_prenom"),
+    ),
+    (
+        "GET /users (actifs triés par nom)",
+        """SELECT u.id, u.nom, u.prenom FROM users u
+           LEFT JOIN enseignants e ON u.id = e.user_id
+           LEFT JOIN fonctionnaires f ON u.id = f.user_id
+           WHERE u.is_active = 1 ORDER BY u.nom, u.prenom, u.id LIMIT ?""",
+        (100,),
+        ("ix_users_active_nom_prenom_id",),
+    ),
+    (
+        "GET /users/enseignants",
+        """SELECT e.id, u.nom, u.prenom FROM enseignants e JOIN users u ON e.user_id = u.id
+           WHERE u.role = 'ENSEIGNANT' ORDER BY u.nom, u.prenom""",
+        (),
+        ("ix_users_role_nom_prenom",),
+    ),
+    (
+        "Nettoyage des uploads: fichiers encore référencés",
+        """SELECT photo AS ref FROM enseignants WHERE photo IN (?, ?)
+           UNION SELECT photo FROM fonctionnaires WHERE photo IN (?, ?)
+           UNION SELECT file_path FROM demande_documents WHERE file_path IN (?, ?)""",
+        ("/uploads/images/a.jpg", "uploads/images/a.jpg") * 3,
+        ("ix_enseignants_photo", "ix_fonctionnaires_photo", "ix_demande_documents_file_path"),
+    ),
+    (
+        "Export ZIP des documents sur une période",
+        """SELECT demande_id, filename, original_filename, file_path FROM demande_documents
+           WHERE uploaded_at >= ? AND uploaded_at < date(?, '+1 day') ORDER BY demande_id, uploaded_at""",
+        ("2025-06-01", "2025-06-30"),
+        ("ix_demande_documents_uploaded_at",),
+    ),
+    (
+        "GET /attestations/events?demande_id=",
+        """SELECT * FROM attestation_events WHERE demande_id = ?
+           ORDER BY created_at DESC, id DESC LIMIT ?""",
+        (20, 100),
+        ("ix_attestation_events_demande",),
+    ),
+    (
+        "GET /attestations/events?user_email=&date_debut=",
+        """SELECT * FROM attestation_events WHERE user_email = ? AND created_at >= ?
+           ORDER BY created_at DESC, id DESC LIMIT ?""",
+        ("mariam@univ.ma", "2025-06-01", 100),
+        ("ix_attestation_events_email",),
+    ),
+    (
+        "Lot d'attestations: tranche suivante",
+        """SELECT user_id FROM attestation_job_items
+           WHERE job_id = ? AND status = 'pending' ORDER BY user_id LIMIT ?""",
+        (1, 64),
+        ("ix_attestation_job_items_status",),
+    ),
+    (
+        "POST /auth/login",
+        "SELECT * FROM users WHERE email = ? AND is_active = 1",
+        ("admin@univ.ma",),
+        ("sqlite_autoindex_users_1",),
+    ),
+]
+
+
+def explain(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_plans(conn) -> list:
+    """Retourne la liste des régressions (nom, plan)"""
+    failures = []
+    for name, sql, params, indexes in HOT_QUERIES:
+        plan = explain(conn, sql, params)
+        uses_index = any(index in detail for detail in plan for index in indexes)
+        full_scan = any(detail.startswith("SCAN ") and " USING " not in detail for detail in plan)
+        status = "✅" if uses_index and not full_scan else "❌"
+        print(f"{status} {name}")
+        for detail in plan:
+            print(f"      {detail}")
+        if status == "❌":
+            failures.append((name, plan))
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="gestion_db.db", help="base à analyser (copiée, jamais modifiée)")
+    args = parser.parse_args()
+
+    tmp_path = os.path.join(tempfile.mkdtemp(prefix="query_plans_"), "plans.db")
+    source = sqlite3.connect(args.db)
+    target = sqlite3.connect(tmp_path)
+    source.backup(target)
+    source.close()
+
+    run_migrations(target)
+    failures = check_plans(target)
+    target.close()
+
+    if failures:
+        print(f"❌ {len(failures)} requête(s) sans l'index attendu")
+        return 1
+    print("✅ Tous les plans utilisent les index attendus")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Générateur de données synthétiques pour les tests de montée en charge.
+
+Crée une nouvelle base SQLite avec le schéma de gestion_db.db (plus les
+migrations) et la remplit, à graine fixe, avec des données de la forme des
+nôtres:
+- utilisateurs des quatre rôles (UserRole), très majoritairement enseignants
+  et fonctionnaires, avec leur profil (enseignants / fonctionnaires);
+- demandes réparties par type (DemandeType) selon le rôle, et par statut
+  (DemandeStatus) selon leur âge: les récentes sont en attente, les anciennes
+  traitées; quelques utilisateurs font beaucoup de demandes;
+- documents rattachés aux ordres de mission et heures supplémentaires (seuls
+  types qui acceptent des pièces jointes), pointant vers des fichiers factices
+  écrits dans uploads/generated/ à côté de la base.
+
+Les lignes sont insérées par executemany, par lots de --batch-size dans de
+grandes transactions, journal désactivé pendant le chargement; les index des
+migrations sont créés après l'insertion.
+
+Usage (depuis back_end/):
+    python -m benchmarks.generate_data --db /tmp/scale.db [--users 10000]
+        [--demandes 500000] [--documents 200000] [--seed 42] [--force]
+"""
+
+import argparse
+import hashlib
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACK_END_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PASSWORD = "bench"
+# Date de la demande la plus récente: fixe, pour des données identiques d'une exécution à l'autre
+DEFAULT_END_DATE = "2025-07-01"
+DEFAULT_DISTINCT_FILES = 1000
+GENERATED_FILES_DIR = "uploads/generated"
+
+ROLE_WEIGHTS = (("ADMIN", 0.002), ("SECRETAIRE", 0.008), ("ENSEIGNANT", 0.45), ("FONCTIONNAIRE", 0.54))
+# Types de demandes par rôle (HEURES_SUP: enseignants seulement)
+DEMANDE_TYPE_WEIGHTS = {
+    "ENSEIGNANT": (("ATTESTATION", 30), ("ORDRE_MISSION", 30), ("HEURES_SUP", 25), ("CONGE", 10), ("ABSENCE", 5)),
+    "FONCTIONNAIRE": (("ATTESTATION", 35), ("CONGE", 35), ("ABSENCE", 15), ("ORDRE_MISSION", 15)),
+}
+# Part des demandes encore en attente selon leur âge (jours); les autres sont traitées
+PENDING_BY_AGE = ((7, 0.8), (30, 0.4), (90, 0.1), (None, 0.02))
+APPROVAL_RATE = 0.8
+DOCUMENT_TYPES = ("ORDRE_MISSION", "HEURES_SUP")
+# (extension, type MIME, poids)
+DOCUMENT_FORMATS = ((".pdf", "application/pdf", 80), (".jpg", "image/jpeg", 15), (".png", "image/png", 5))
+
+NOMS = ("Alaoui", "Bennani", "Tazi", "Karam", "El Idrissi", "Berrada", "Chraibi", "Fassi", "Lahlou", "Benjelloun",
+        "Amrani", "Ouazzani", "Skalli", "Sqalli", "Guerraf", "Leroy", "Martin", "Bernard", "Haddad", "Naciri")
+PRENOMS = ("Ahmed", "Aicha", "Mohamed", "Fatima", "Youssef", "Khadija", "Omar", "Salma", "Karim", "Mariam",
+           "Hamza", "Imane", "Mehdi", "Sara", "Anas", "Nadia", "Pierre", "Claire", "Yassine", "Hajar")
+VILLES = ("Rabat", "Casablanca", "Fès", "Tanger", "Marrakech", "Meknès", "Oujda", "Agadir", "Tétouan", "Al Hoceima")
+SPECIALITES = ("Informatique", "Mathématiques", "Physique", "Chimie", "Économie", "Droit", "Français", "Anglais",
+               "Biologie", "Gestion")
+GRADES_ENSEIGNANT = ("Professeur", "Professeur Associé", "Professeur Habilité",
+                     "Professeur de l'Enseignement Supérieur")
+SERVICES = ("Ressources Humaines", "Scolarité", "Comptabilité", "Service Financier", "Bibliothèque", "Informatique")
+POSTES = ("Gestionnaire RH", "Agent administratif", "Comptable", "Technicien", "Chef de service", "Secrétaire")
+GRADES_FONCTIONNAIRE = ("Catégorie A", "Catégorie B", "Catégorie C", "Administrateur", "Technicien")
+MOTIFS = ("formation", "colloque", "jury de soutenance", "réunion", "encadrement", "séminaire")
+
+
+def _weighted(rng, weights, count: int):
+    values, value_weights = zip(*weights)
+    return rng.choices(values, value_weights, k=count)
+
+
+def _batches(rows, size: int):
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _insert(conn, sql: str, rows, batch_size: int) -> int:
+    """executemany par lots, un commit par lot (grandes transactions, mémoire bornée)"""
+    count = 0
+    for batch in _batches(rows, batch_size):
+        conn.executemany(sql, batch)
+        conn.commit()
+        count += len(batch)
+    return count
+
+
+def write_dummy_files(root: str, count: int, seed: int) -> list:
+    """Fichiers factices sous root/uploads/generated; retourne [(chemin relatif, taille, type MIME)]"""
+    rng = random.Random(seed)
+    directory = os.path.join(root, GENERATED_FILES_DIR)
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    format_weights = [((extension, content_type), weight) for extension, content_type, weight in DOCUMENT_FORMATS]
+    formats = _weighted(rng, format_weights, count)
+    for n, (extension, content_type) in enumerate(formats):
+        size = rng.randrange(4 * 1024, 64 * 1024)
+        relative_path = f"{GENERATED_FILES_DIR}/doc_{n:05d}{extension}"
+        with open(os.path.join(root, relative_path), "wb") as dummy:
+            dummy.write(rng.randbytes(size))
+        files.append((relative_path, size, content_type))
+    return files
+
+
+def _users(rng, count: int, password_hash: str, end_date: datetime):
+    roles = _weighted(rng, ROLE_WEIGHTS, count)
+    # Au moins un utilisateur actif de chaque rôle, en tête (ids 1 à 4)
+    roles[:4] = ["ADMIN", "SECRETAIRE", "ENSEIGNANT", "FONCTIONNAIRE"]
+    for user_id, role in enumerate(roles, start=1):
+        nom, prenom = rng.choice(NOMS), rng.choice(PRENOMS)
+        email = f"{prenom}.{nom}.{user_id}@univ.ma".lower().replace(" ", "")
+        created = end_date - timedelta(days=rng.randrange(5 * 365))
+        yield (
+            user_id, email, nom, prenom, f"06{rng.randrange(10 ** 8):08d}", rng.choice(VILLES),
+            f"{chr(65 + user_id % 26)}{chr(65 + user_id // 26 % 26)}{user_id:06d}", password_hash, role,
+            1 if user_id <= 4 or rng.random() < 0.97 else 0, created.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+
+
+def _demande_text(rng, demande_type: str):
+    """(titre, description) dans le format des formulaires de l'application"""
+    if demande_type == "ORDRE_MISSION":
+        motif = rng.choice(MOTIFS)
+        return (f"Ordre de mission - {motif}",
+                f"Objet: {motif}\nDestination: {rng.choice(VILLES)}\nMotif: {motif}\nFrais inclus: Aucun")
+    if demande_type == "HEURES_SUP":
+        hours = rng.randrange(4, 48)
+        return (f"Demande d'heures supplémentaires - {hours}h",
+                f"Nombre d'heures: {hours}h\nMotif: {rng.choice(MOTIFS)}")
+    if demande_type == "CONGE":
+        return "Congé annuel", "Demande de congé annuel"
+    if demande_type == "ABSENCE":
+        return "Absence médicale", "Absence pour raisons médicales"
+    return "Attestation de travail", "Demande d'attestation de travail pour démarches administratives"
+
+
+def _demandes(rng, count: int, requesters: list, end_date: datetime, days: int, with_documents: list):
+    """Demandes par ordre chronologique; with_documents reçoit (id, date) des demandes à pièces jointes"""
+    # Activité très inégale: quelques utilisateurs font l'essentiel des demandes
+    activity = list(itertools.accumulate(rng.paretovariate(2.5) for _ in requesters))
+    authors = rng.choices(requesters, cum_weights=activity, k=count)
+    ages = sorted((rng.random() * days for _ in range(count)), reverse=True)
+    type_choices = {role: (tuple(value for value, _ in weights), list(itertools.accumulate(w for _, w in weights)))
+                    for role, weights in DEMANDE_TYPE_WEIGHTS.items()}
+    for demande_id, ((user_id, role), age) in enumerate(zip(authors, ages), start=1):
+        types, cum_weights = type_choices[role]
+        demande_type = rng.choices(types, cum_weights=cum_weights)[0]
+        created = end_date - timedelta(days=age)
+        pending = next(rate for limit, rate in PENDING_BY_AGE if limit is None or age < limit)
+        if rng.random() < pending:
+            statut, commentaire, updated = "EN_ATTENTE", None, None
+        else:
+            approved = rng.random() < APPROVAL_RATE
+            statut = "APPROUVEE" if approved else "REJETEE"
+            commentaire = f"Demande {'approuvée' if approved else 'rejetée'} par le secrétaire"
+            updated = (created + timedelta(hours=rng.randrange(1, 120))).strftime("%Y-%m-%d %H:%M:%S")
+        date_debut = date_fin = None
+        if demande_type != "ATTESTATION":
+            debut = created + timedelta(days=rng.randrange(1, 30))
+            date_debut = debut.strftime("%Y-%m-%d")
+            date_fin = (debut + timedelta(days=rng.randrange(0, 15))).strftime("%Y-%m-%d")
+        titre, description = _demande_text(rng, demande_type)
+        if demande_type in DOCUMENT_TYPES:
+            with_documents.append((demande_id, created))
+        yield (demande_id, user_id, demande_type, titre, description, date_debut, date_fin, statut, commentaire,
+               created.strftime("%Y-%m-%d %H:%M:%S"), updated)
+
+
+def _documents(rng, count: int, with_documents: list, files: list):
+    for document_id in range(1, count + 1):
+        demande_id, created = rng.choice(with_documents)
+        file_path, size, content_type = rng.choice(files)
+        extension = os.path.splitext(file_path)[1]
+        uploaded = created + timedelta(minutes=rng.randrange(1, 600))
+        yield (document_id, demande_id, os.path.basename(file_path), f"piece_{document_id}{extension}", file_path,
+               size, content_type, uploaded.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def generate(db_path: str, users: int = 10_000, demandes: int = 500_000, documents: int = 200_000,
+             seed: int = 42, files_root: str = None, distinct_files: int = DEFAULT_DISTINCT_FILES,
+             batch_size: int = 50_000, password: str = DEFAULT_PASSWORD, end_date: str = DEFAULT_END_DATE,
+             days: int = 3 * 365) -> dict:
+    """Créer db_path (qui ne doit pas exister) et le remplir; retourne le nombre de lignes par table"""
+    from migrations import run_migrations
+
+    rng = random.Random(seed)
+    end = datetime.fromisoformat(end_date)
+    files_root = files_root or os.path.dirname(os.path.abspath(db_path))
+
+    source = sqlite3.connect(os.path.join(BACK_END_DIR, "gestion_db.db"))
+    schema = [row[0] for row in source.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+    )]
+    source.close()
+
+    conn = sqlite3.connect(db_path)
+    # Chargement initial: pas de journal ni de fsync (base jetable en cas d'échec)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    for statement in schema:
+        conn.execute(statement)
+
+    counts = {}
+    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    user_rows = list(_users(rng, users, password_hash, end))
+    counts["users"] = _insert(conn, '''
+        INSERT INTO users (id, email, nom, prenom, telephone, adresse, cin, hashed_password, role, is_active,
+                           created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', user_rows, batch_size)
+    counts["enseignants"] = _insert(conn, "INSERT INTO enseignants (user_id, specialite, grade) VALUES (?, ?, ?)", (
+        (row[0], rng.choice(SPECIALITES), rng.choice(GRADES_ENSEIGNANT))
+        for row in user_rows if row[8] == "ENSEIGNANT"
+    ), batch_size)
+    counts["fonctionnaires"] = _insert(conn, """
+        INSERT INTO fonctionnaires (user_id, service, poste, grade) VALUES (?, ?, ?, ?)
+    """, (
+        (row[0], rng.choice(SERVICES), rng.choice(POSTES), rng.choice(GRADES_FONCTIONNAIRE))
+        for row in user_rows if row[8] == "FONCTIONNAIRE"
+    ), batch_size)
+
+    requesters = [(row[0], row[8]) for row in user_rows if row[8] in DEMANDE_TYPE_WEIGHTS and row[9]]
+    with_documents = []
+    counts["demandes"] = _insert(conn, '''
+        INSERT INTO demandes (id, user_id, type_demande, titre, description, date_debut, date_fin, statut,
+                              commentaire_admin, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', _demandes(rng, demandes, requesters, end, days, with_documents), batch_size)
+
+    counts["demande_documents"] = 0
+    if documents and with_documents:
+        files = write_dummy_files(files_root, distinct_files, seed)
+        counts["demande_documents"] = _insert(conn, '''
+            INSERT INTO demande_documents (id, demande_id, filename, original_filename, file_path, file_size,
+                                           content_type, uploaded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _documents(rng, documents, with_documents, files), batch_size)
+
+    # Index des migrations créés après l'insertion (plus rapide qu'une mise à jour ligne à ligne)
+    run_migrations(conn)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", required=True, help="base à créer")
+    parser.add_argument("--force", action="store_true", help="remplacer la base si elle existe")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--demandes", type=int, default=500_000)
+    parser.add_argument("--documents", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42, help="graine: mêmes paramètres, mêmes données")
+    parser.add_argument("--files-root", help="répertoire des fichiers factices (défaut: celui de la base)")
+    parser.add_argument("--distinct-files", type=int, default=DEFAULT_DISTINCT_FILES,
+                        help="fichiers factices partagés par les documents")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="lignes par executemany et par transaction")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="mot de passe de tous les utilisateurs")
+    parser.add_argument("--end-date", default=DEFAULT_END_DATE, help="date des demandes les plus récentes")
+    parser.add_argument("--days", type=int, default=3 * 365, help="période couverte par les demandes (jours)")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    if db_path == os.path.join(BACK_END_DIR, "gestion_db.db"):
+        parser.error("refus d'écrire dans la base de l'application")
+    if os.path.exists(db_path):
+        if not args.force:
+            parser.error(f"{db_path} existe déjà (--force pour la remplacer)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    started = time.perf_counter()
+    counts = generate(db_path, args.users, args.demandes, args.documents, args.seed, args.files_root,
+                      args.distinct_files, args.batch_size, args.password, args.end_date, args.days)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {db_path} générée en {elapsed:.1f} s")
+    for table, count in counts.items():
+        print(f"   {table:<18} {count:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
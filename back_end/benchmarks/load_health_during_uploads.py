@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test de charge: latence de /health pendant des uploads de photos concurrents.
+
+Démarre l'application avec uvicorn dans un répertoire temporaire (copie de
+gestion_db.db, .env et data/), mesure la latence de /health au repos, puis
+pendant que plusieurs clients envoient en boucle de grosses photos à
+POST /users/enseignants/{id}/upload-photo (redimensionnement Pillow).
+Le p99 de /health doit rester du même ordre qu'au repos.
+
+Usage (depuis back_end/):
+    python -m benchmarks.load_health_during_uploads [--uploaders 4] [--probes 400]
+"""
+
+import argparse
+import io
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+BACK_END_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(label: str, latencies_ms):
+    print(f"{label:<22} p50={percentile(latencies_ms, 50):7.2f} ms  "
+          f"p99={percentile(latencies_ms, 99):7.2f} ms  max={max(latencies_ms):7.2f} ms  "
+          f"(n={len(latencies_ms)})")
+    return percentile(latencies_ms, 99)
+
+
+def make_photo(width: int = 2400, height: int = 1800) -> bytes:
+    """Photo JPEG bruitée (peu compressible, donc coûteuse à redimensionner)"""
+    from PIL import Image
+
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = io.BytesIO()
+    noise.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_workdir() -> str:
+    workdir = tempfile.mkdtemp(prefix="load_health_")
+    source = sqlite3.connect(os.path.join(BACK_END_DIR, "gestion_db.db"))
+    target = sqlite3.connect(os.path.join(workdir, "gestion_db.db"))
+    source.backup(target)
+    source.close()
+    target.close()
+    shutil.copy(os.path.join(BACK_END_DIR, ".env"), workdir)
+    shutil.copytree(os.path.join(BACK_END_DIR, "data"), os.path.join(workdir, "data"))
+    return workdir
+
+
+def probe_health(client, count: int, pause: float = 0.005):
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        client.get("/health").raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(pause)
+    return latencies
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uploaders", type=int, default=4, help="clients d'upload concurrents")
+    parser.add_argument("--probes", type=int, default=400, help="requêtes /health par phase")
+    parser.add_argument("--max-ratio", type=float, default=5.0,
+                        help="p99 sous charge / p99 au repos toléré (plancher de 30 ms)")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    os.environ["SQLITE_DB_PATH"] = os.path.join(workdir, "gestion_db.db")
+    sys.path.insert(0, BACK_END_DIR)
+
+    # Importer après avoir positionné le répertoire de travail et SQLITE_DB_PATH
+    import httpx
+    import uvicorn
+    import main as app_module
+    from security import create_user_token
+
+    conn = sqlite3.connect("gestion_db.db")
+    conn.row_factory = sqlite3.Row
+    admin = conn.execute("SELECT * FROM users WHERE role = 'ADMIN' AND is_active = 1 LIMIT 1").fetchone()
+    enseignant = conn.execute("SELECT id FROM enseignants ORDER BY id LIMIT 1").fetchone()
+    conn.close()
+    if admin is None or enseignant is None:
+        print("❌ Il faut un admin actif et un enseignant dans gestion_db.db")
+        return 1
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{port}"
+    headers = {"Authorization": f"Bearer {create_user_token(admin)}"}
+    photo = make_photo()
+    upload_url = f"/users/enseignants/{enseignant['id']}/upload-photo"
+    print(f"Photo de test: {len(photo) / 1024 / 1024:.1f} Mo, {args.uploaders} clients d'upload")
+
+    stop = threading.Event()
+    uploads = []
+    errors = []
+
+    def uploader():
+        with httpx.Client(base_url=base_url, headers=headers, timeout=60) as client:
+            while not stop.is_set():
+                # Octets de fin aléatoires (ignorés par les décodeurs JPEG): contenu unique,
+                # sinon le stockage par contenu évite le redimensionnement dès le 2e envoi
+                unique_photo = photo + os.urandom(16)
+                response = client.post(upload_url, files={"file": ("photo.jpg", unique_photo, "image/jpeg")})
+                (uploads if response.status_code == 200 else errors).append(response.status_code)
+
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        probe_health(client, 20)  # échauffement
+        idle_p99 = summarize("/health au repos", probe_health(client, args.probes))
+
+        threads = [threading.Thread(target=uploader) for _ in range(args.uploaders)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+        loaded_p99 = summarize("/health sous uploads", probe_health(client, args.probes))
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    server.should_exit = True
+    print(f"Uploads réussis: {len(uploads)}, erreurs: {len(errors)}")
+
+    limit = max(idle_p99 * args.max_ratio, 30.0)
+    if errors or loaded_p99 > limit:
+        print(f"❌ p99 sous charge {loaded_p99:.2f} ms > {limit:.2f} ms (ou uploads en erreur)")
+        return 1
+    print(f"✅ p99 de /health stable: {loaded_p99:.2f} ms (limite {limit:.2f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Stockage des fichiers uploadés par contenu (SHA-256) avec comptage de références.
+
+- un fichier = un blob uploads/blobs/<2 premiers hex>/<sha256><extension>,
+  servi tel quel par le montage statique /uploads;
+- table blobs: sha256, path, size, ref_count (nombre de lignes qui pointent
+  vers le blob: demande_documents.file_path, enseignants.photo, fonctionnaires.photo);
+- table blob_sources: blob produit à partir d'un upload brut pour une
+  variante donnée (ex: photo redimensionnée), pour ne pas refaire le traitement.
+
+Un contenu déjà connu ne coûte qu'un hachage: le fichier temporaire est jeté et
+le ref_count incrémenté. Les références sont prises et rendues dans la même
+transaction d'écriture que la ligne qui pointe vers le blob; les blobs à
+ref_count 0 sont supprimés par purge_unreferenced_blobs().
+
+Migration des fichiers existants vers les blobs (depuis back_end/):
+    python blob_store.py
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+from sqlite_pool import get_sqlite_connection
+from upload_streaming import hash_file, stream_upload_to_temp
+
+BLOB_ROOT = Path("uploads/blobs")
+BLOB_TMP_DIR = BLOB_ROOT / "tmp"
+
+# Colonnes qui référencent des fichiers: (table, colonne)
+FILE_REFERENCES = (
+    ("demande_documents", "file_path"),
+    ("enseignants", "photo"),
+    ("fonctionnaires", "photo"),
+)
+
+
+def blob_path(sha256: str, extension: str) -> Path:
+    return BLOB_ROOT / sha256[:2] / f"{sha256}{extension.lower()}"
+
+
+def _normalize(path: str) -> str:
+    # Les colonnes photo contiennent des URLs (/uploads/...), file_path un chemin relatif
+    # (séparateurs Windows s'il a été enregistré sous Windows)
+    return Path(str(path).replace("\\", "/").lstrip("/")).as_posix()
+
+
+def receive_upload(upload, max_size: int):
+    """Copier un upload dans un fichier temporaire du stockage; retourne (chemin, taille, sha256)"""
+    return stream_upload_to_temp(upload, BLOB_TMP_DIR, max_size)
+
+
+def new_temp_path(extension: str = "") -> Path:
+    BLOB_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    return BLOB_TMP_DIR / f".derived_{os.urandom(8).hex()}{extension}"
+
+
+def discard_temp(tmp_path):
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def add_blob_reference(conn, tmp_path, sha256: str, size: int, extension: str) -> str:
+    """Placer le fichier temporaire comme blob (ou le jeter si déjà connu) et prendre une référence.
+
+    conn est la connexion d'écriture: la référence est validée avec la transaction de l'appelant.
+    """
+    row = conn.execute("SELECT path FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    if row is not None:
+        path = Path(row["path"])
+        if path.exists():
+            discard_temp(tmp_path)
+        else:
+            # Fichier perdu: le nouvel upload le restaure
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, path)
+        conn.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = ?", (sha256,))
+        return row["path"]
+
+    path = blob_path(sha256, extension)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, path)
+    conn.execute(
+        "INSERT INTO blobs (sha256, path, size, ref_count) VALUES (?, ?, ?, 1)",
+        (sha256, path.as_posix(), size)
+    )
+    return path.as_posix()
+
+
+def find_derived_blob(conn, source_sha256: str, variant: str):
+    """Blob déjà produit à partir du même upload brut pour cette variante, ou None"""
+    return conn.execute('''
+        SELECT b.sha256, b.path FROM blob_sources s
+        JOIN blobs b ON b.sha256 = s.sha256
+        WHERE s.source_sha256 = ? AND s.variant = ?
+    ''', (source_sha256, variant)).fetchone()
+
+
+def add_derived_blob_reference(conn, source_sha256: str, variant: str, tmp_path=None, extension: str = ""):
+    """Prendre une référence sur la variante d'un upload brut.
+
+    Sans tmp_path: réutilise la variante existante (retourne None si inconnue).
+    Avec tmp_path (variante fraîchement produite): la stocke et mémorise sa source.
+    """
+    if tmp_path is None:
+        row = find_derived_blob(conn, source_sha256, variant)
+        if row is None or not Path(row["path"]).exists():
+            return None
+        conn.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = ?", (row["sha256"],))
+        return row["path"]
+
+    size, sha256 = hash_file(tmp_path)
+    path = add_blob_reference(conn, tmp_path, sha256, size, extension)
+    conn.execute(
+        "INSERT OR REPLACE INTO blob_sources (source_sha256, variant, sha256) VALUES (?, ?, ?)",
+        (source_sha256, variant, sha256)
+    )
+    return path
+
+
+def release_file(conn, path, remove_legacy: bool = True):
+    """Rendre la référence d'une ligne sur un fichier.
+
+    Blob: ref_count - 1 (le fichier reste jusqu'à purge_unreferenced_blobs).
+    Ancien fichier hors blobs: supprimé directement, comme avant (si remove_legacy).
+    """
+    if not path:
+        return
+    normalized = _normalize(path)
+    cursor = conn.execute(
+        "UPDATE blobs SET ref_count = MAX(ref_count - 1, 0) WHERE path = ?", (normalized,)
+    )
+    if remove_legacy and cursor.rowcount == 0 and not normalized.startswith(BLOB_ROOT.as_posix() + "/"):
+        try:
+            os.remove(normalized)
+        except OSError:
+            pass
+
+
+def retain_file(conn, path):
+    """Prendre une référence supplémentaire sur un blob existant (sans effet hors blobs)"""
+    if path:
+        conn.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE path = ?", (_normalize(path),))
+
+
+def replace_file_reference(conn, old_path, new_path):
+    """Colonne fichier modifiée par l'API (ex: photo envoyée dans un PUT): ajuster les ref_count"""
+    if _normalize(old_path or "") == _normalize(new_path or ""):
+        return
+    retain_file(conn, new_path)
+    release_file(conn, old_path, remove_legacy=False)
+
+
+def receive_derived_upload(upload, max_size: int, variant: str, process) -> dict:
+    """Recevoir un upload et produire sa variante (process(chemin) la transforme sur place).
+
+    Si la variante de ce contenu existe déjà, process n'est pas appelé: seul le hachage est payé.
+    À appeler hors transaction (sur l'exécuteur d'images pour les photos).
+    """
+    tmp_path, _, source_sha256 = receive_upload(upload, max_size)
+    received = {"source_sha256": source_sha256, "variant": variant, "tmp_path": tmp_path,
+                "process": process, "processed": False}
+    conn = get_sqlite_connection()
+    try:
+        known = find_derived_blob(conn, source_sha256, variant)
+    finally:
+        conn.close()
+    if known is None or not Path(known["path"]).exists():
+        try:
+            process(tmp_path)
+        except BaseException:
+            discard_temp(tmp_path)
+            raise
+        received["processed"] = True
+    return received
+
+
+def add_derived_upload_reference(conn, received: dict, extension: str) -> str:
+    """Prendre la référence sur la variante reçue par receive_derived_upload (connexion d'écriture)"""
+    tmp_path = received["tmp_path"]
+    if not received["processed"]:
+        path = add_derived_blob_reference(conn, received["source_sha256"], received["variant"])
+        if path is not None:
+            discard_temp(tmp_path)
+            return path
+        # Variante purgée entre-temps (rare): traitement sous le verrou d'écriture
+        received["process"](tmp_path)
+        received["processed"] = True
+    return add_derived_blob_reference(conn, received["source_sha256"], received["variant"], tmp_path, extension)
+
+
+def purge_unreferenced_blobs() -> int:
+    """Supprimer les blobs sans référence; retourne le nombre de fichiers supprimés"""
+    conn = get_sqlite_connection(write=True)
+    try:
+        rows = conn.execute("SELECT sha256, path FROM blobs WHERE ref_count = 0").fetchall()
+        if not rows:
+            return 0
+        hashes = [(row["sha256"],) for row in rows]
+        conn.executemany("DELETE FROM blob_sources WHERE sha256 = ?", hashes)
+        conn.executemany("DELETE FROM blobs WHERE sha256 = ?", hashes)
+        conn.commit()
+        # Toujours sous le verrou d'écriture: aucun upload ne peut réutiliser ces blobs entre-temps
+        for row in rows:
+            discard_temp(row["path"])
+            try:
+                Path(row["path"]).parent.rmdir()  # dossier de préfixe vide
+            except OSError:
+                pass
+        return len(rows)
+    finally:
+        conn.close()
+
+
+def migrate_existing_files() -> dict:
+    """Déplacer les fichiers référencés hors blobs vers le stockage par contenu"""
+    conn = get_sqlite_connection(write=True)
+    moved, deduplicated, missing = 0, 0, 0
+    legacy_files = []
+    try:
+        for table, column in FILE_REFERENCES:
+            rows = conn.execute(
+                f"SELECT id, {column} AS ref FROM {table} WHERE {column} IS NOT NULL AND {column} != ''"
+            ).fetchall()
+            for row in rows:
+                normalized = _normalize(row["ref"])
+                source = Path(normalized)
+                if normalized.startswith(BLOB_ROOT.as_posix() + "/"):
+                    continue
+                if not source.is_file():
+                    missing += 1
+                    continue
+                size, sha256 = hash_file(source)
+                tmp_path = new_temp_path()
+                shutil.copyfile(source, tmp_path)
+                known = conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+                path = add_blob_reference(conn, tmp_path, sha256, size, source.suffix)
+                # Même forme que la valeur d'origine (URL /uploads/... ou chemin relatif)
+                new_ref = f"/{path}" if str(row["ref"]).startswith("/") else path
+                conn.execute(f"UPDATE {table} SET {column} = ? WHERE id = ?", (new_ref, row["id"]))
+                legacy_files.append(source)
+                if known:
+                    deduplicated += 1
+                else:
+                    moved += 1
+        conn.commit()
+    finally:
+        conn.close()
+
+    for source in set(legacy_files):
+        discard_temp(source)
+    return {"moved": moved, "deduplicated": deduplicated, "missing": missing}
+
+
+if __name__ == "__main__":
+    result = migrate_existing_files()
+    print(f"📦 [BLOBS] {result['moved']} fichier(s) migré(s), {result['deduplicated']} doublon(s) fusionné(s), "
+          f"{result['missing']} référence(s) sans fichier")
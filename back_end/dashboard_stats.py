@@ -0,0 +1,71 @@
+"""
+Statistiques du dashboard: une seule requête agrégée, mise en cache quelques secondes.
+
+Le cache est invalidé par les écritures qui changent les compteurs
+(création/suppression de demandes, changement de statut, création/suppression d'utilisateurs).
+"""
+
+from cache import TTLCache
+from sqlite_pool import get_sqlite_connection
+
+DASHBOARD_STATS_TTL = 10.0
+
+_stats_cache = TTLCache(maxsize=1, ttl=DASHBOARD_STATS_TTL)
+# Incrémenté à chaque invalidation: un calcul commencé avant n'est pas mis en cache
+_generation = 0
+
+# Chaque sous-requête est couverte par un index (migration 2)
+DASHBOARD_STATS_QUERY = '''
+    SELECT
+        (SELECT COUNT(*) FROM users WHERE is_active = 1) AS total_users,
+        (SELECT COUNT(*) FROM users u JOIN enseignants e ON u.id = e.user_id
+          WHERE u.is_active = 1 AND u.role = 'ENSEIGNANT') AS enseignants,
+        (SELECT COUNT(*) FROM users u JOIN fonctionnaires f ON u.id = f.user_id
+          WHERE u.is_active = 1 AND u.role = 'FONCTIONNAIRE') AS fonctionnaires,
+        (SELECT COUNT(*) FROM users WHERE is_active = 1 AND role = 'SECRETAIRE') AS secretaires,
+        (SELECT COUNT(*) FROM users WHERE is_active = 1 AND role = 'ADMIN') AS admins,
+        (SELECT COUNT(*) FROM demandes WHERE statut = 'EN_ATTENTE') AS en_attente,
+        (SELECT COUNT(*) FROM demandes WHERE statut IN ('APPROUVEE', 'REJETEE')) AS traitees
+'''
+
+
+def compute_dashboard_stats() -> dict:
+    """Calculer les statistiques depuis SQLite (un seul aller-retour)"""
+    conn = get_sqlite_connection()
+    try:
+        row = conn.execute(DASHBOARD_STATS_QUERY).fetchone()
+    finally:
+        conn.close()
+
+    # Retourner exactement les champs attendus par le frontend
+    return {
+        "totalUsers": row["total_users"],
+        "enseignants": row["enseignants"],
+        "fonctionnaires": row["fonctionnaires"],
+        "secretaires": row["secretaires"],
+        "admins": row["admins"],
+        "demandesEnAttente": row["en_attente"],
+        "demandesTraitees": row["traitees"]
+    }
+
+
+def get_dashboard_stats() -> dict:
+    """Statistiques du dashboard, servies depuis le cache si elles sont récentes"""
+    stats = _stats_cache.get("stats")
+    if stats is None:
+        generation = _generation
+        stats = compute_dashboard_stats()
+        if generation == _generation:
+            _stats_cache.set("stats", stats)
+    return dict(stats)
+
+
+def invalidate_dashboard_stats():
+    """A appeler après toute écriture qui modifie les compteurs"""
+    global _generation
+    _generation += 1
+    _stats_cache.clear()
+
+
+def get_dashboard_cache_stats() -> dict:
+    return _stats_cache.stats()
@@ -0,0 +1,156 @@
+"""
+Persistance des données JSON en mémoire (TEST_USERS, ENSEIGNANTS_DB, DEMANDES_DB).
+
+Au lieu de réécrire les trois fichiers complets à chaque modification, chaque
+mutation est ajoutée en une ligne au journal (data/journal.jsonl) puis appliquée
+en mémoire, sous le même verrou que la compaction: un snapshot contient toujours
+les mutations dont la ligne est effacée du journal. Les clés sont des str en
+mémoire comme dans les fichiers JSON (store["12"], jamais store[12]). Le journal est compacté périodiquement: chaque store est
+réécrit dans son fichier snapshot (users.json, ...) via un fichier temporaire
+et os.replace (remplacement atomique), puis le journal est vidé.
+
+Au démarrage: lecture des snapshots puis rejeu du journal. Une dernière ligne
+tronquée (arrêt brutal pendant l'écriture) est ignorée.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = "journal.jsonl"
+# Nombre de mutations avant compaction du journal dans les snapshots
+JOURNAL_COMPACT_EVERY = int(os.environ.get("JOURNAL_COMPACT_EVERY", "500"))
+# fsync après chaque ajout: durable même en cas de coupure, mais plus lent
+JOURNAL_FSYNC = os.environ.get("JOURNAL_FSYNC", "0") == "1"
+
+
+def write_json_atomic(path: Path, data):
+    """Écrire un fichier JSON complet sans jamais laisser de fichier à moitié écrit"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class DataJournal:
+    """Journal d'ajout des mutations + snapshots compactés, pour des stores dict"""
+
+    def __init__(self, data_dir: Path, snapshots: dict, compact_every: int = JOURNAL_COMPACT_EVERY):
+        # snapshots: nom du store -> nom du fichier snapshot dans data_dir
+        self.data_dir = Path(data_dir)
+        self.snapshots = snapshots
+        self.compact_every = compact_every
+        self.journal_path = self.data_dir / JOURNAL_FILENAME
+        self._stores = {}
+        self._lock = threading.Lock()
+        self._journal = None
+        self._pending = 0
+
+    def _read_snapshot(self, store: str, default: dict) -> dict:
+        path = self.data_dir / self.snapshots[store]
+        if not path.exists():
+            return default
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            log.error("Error loading %s: %s", path.name, e)
+            return default
+
+    def load(self, defaults: dict) -> dict:
+        """Charger chaque store (snapshot + rejeu du journal) et le rattacher au journal"""
+        stores = {store: self._read_snapshot(store, defaults.get(store, {})) for store in self.snapshots}
+
+        replayed = 0
+        if self.journal_path.exists():
+            valid_end = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        entry = None
+                    if entry is None or not line.endswith(b"\n"):
+                        log.warning("Ligne tronquée ignorée dans %s", self.journal_path.name)
+                        break
+                    valid_end += len(line)
+                    data = stores.get(entry["store"])
+                    if data is None:
+                        continue
+                    if entry["op"] == "set":
+                        data[entry["key"]] = entry["value"]
+                    else:
+                        data.pop(entry["key"], None)
+                    replayed += 1
+            # Couper la ligne tronquée pour que les prochains ajouts restent lisibles
+            if valid_end < self.journal_path.stat().st_size:
+                os.truncate(self.journal_path, valid_end)
+
+        self._stores = stores
+        self._pending = replayed
+        if replayed:
+            log.info("%d mutation(s) rejouée(s)", replayed)
+        return stores
+
+    def _apply(self, entry: dict):
+        """Journaliser puis appliquer une mutation en mémoire, compacter au-delà du seuil (un seul verrou)"""
+        with self._lock:
+            if self._journal is None:
+                self.data_dir.mkdir(parents=True, exist_ok=True)
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._journal.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(self._journal.fileno())
+            data = self._stores[entry["store"]]
+            if entry["op"] == "set":
+                data[entry["key"]] = entry["value"]
+            else:
+                data.pop(entry["key"], None)
+            self._pending += 1
+            if self._pending >= self.compact_every:
+                self._compact_locked()
+
+    def set(self, store: str, key, value):
+        """Enregistrer puis appliquer store[str(key)] = value"""
+        # Clés en str: même forme qu'après un rechargement JSON
+        self._apply({"op": "set", "store": store, "key": str(key), "value": value})
+
+    def delete(self, store: str, key):
+        """Enregistrer puis appliquer la suppression de store[str(key)]"""
+        self._apply({"op": "delete", "store": store, "key": str(key)})
+
+    def compact(self):
+        """Réécrire les snapshots et vider le journal"""
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        # Snapshots d'abord: si l'arrêt survient avant de vider le journal,
+        # le rejeu (idempotent) redonne le même état
+        for store, filename in self.snapshots.items():
+            write_json_atomic(self.data_dir / filename, self._stores[store])
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        empty_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        open(empty_path, "w").close()
+        os.replace(empty_path, self.journal_path)
+        self._pending = 0
+        log.info("Compaction dans %s", ", ".join(self.snapshots.values()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self.journal_path.stat().st_size if self.journal_path.exists() else 0
+            return {
+                "pending_mutations": self._pending,
+                "compact_every": self.compact_every,
+                "journal_bytes": size,
+            }
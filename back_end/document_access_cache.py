@@ -0,0 +1,55 @@
+"""
+Cache des contrôles d'accès pour le téléchargement des documents de demandes.
+
+Un téléchargement repris (Range) ou répété ne refait pas les requêtes SQL:
+- accès: (user_id, rôle, demande_id) -> autorisé, seulement les accès accordés;
+- document: (demande_id, document_id) -> chemin, nom d'origine et type du fichier.
+
+Les entrées expirent après DOCUMENT_ACCESS_CACHE_TTL secondes et sont invalidées
+explicitement à la suppression d'une demande ou d'un document.
+"""
+
+from cache import TTLCache
+
+DOCUMENT_ACCESS_CACHE_MAXSIZE = 4096
+DOCUMENT_ACCESS_CACHE_TTL = 60.0
+
+# Valeur: demande_id (pour l'invalidation par demande)
+_access_cache = TTLCache(maxsize=DOCUMENT_ACCESS_CACHE_MAXSIZE, ttl=DOCUMENT_ACCESS_CACHE_TTL)
+_document_cache = TTLCache(maxsize=DOCUMENT_ACCESS_CACHE_MAXSIZE, ttl=DOCUMENT_ACCESS_CACHE_TTL)
+
+
+def has_cached_access(user: dict, demande_id: int) -> bool:
+    return _access_cache.get((user["id"], user["role"], int(demande_id))) is not None
+
+
+def cache_access(user: dict, demande_id: int):
+    _access_cache.set((user["id"], user["role"], int(demande_id)), int(demande_id))
+
+
+def get_cached_document(demande_id: int, document_id: int):
+    """Document en cache (dict), ou None"""
+    document = _document_cache.get((int(demande_id), int(document_id)))
+    # Copie: les appelants ne doivent pas modifier l'entrée partagée
+    return dict(document) if document is not None else None
+
+
+def cache_document(document: dict) -> dict:
+    _document_cache.set((int(document["demande_id"]), int(document["id"])), dict(document))
+    return document
+
+
+def invalidate_document(demande_id: int, document_id: int):
+    """A appeler après suppression d'un document"""
+    _document_cache.delete((int(demande_id), int(document_id)))
+
+
+def invalidate_demande(demande_id: int):
+    """A appeler après suppression d'une demande (accès et documents)"""
+    demande_id = int(demande_id)
+    _access_cache.delete_where(lambda value: value == demande_id)
+    _document_cache.delete_where(lambda document: document["demande_id"] == demande_id)
+
+
+def get_document_access_cache_stats() -> dict:
+    return {"access": _access_cache.stats(), "documents": _document_cache.stats()}
@@ -0,0 +1,139 @@
+"""
+Diffusion en mémoire des événements de demandes vers les clients SSE (/events).
+
+Chaque connexion est un abonné: une file asyncio bornée et un filtre (les
+ADMIN et SECRETAIRE voient toutes les demandes, les autres seulement les
+leurs). Une connexion inactive ne coûte que sa file et une coroutine en
+attente, sans thread ni tâche supplémentaire.
+
+publish() peut être appelé depuis un endpoint synchrone (pool de threads) ou
+depuis la boucle asyncio. La distribution se fait toujours sur la boucle, en
+une passe sur les abonnés. Un abonné dont la file est pleine est déconnecté:
+à la reconnexion, le client rejoue les événements manqués (Last-Event-ID)
+depuis l'historique, ou recharge ses listes s'ils n'y sont plus.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Événements en attente par connexion avant déconnexion d'un client trop lent
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "256"))
+# Derniers événements gardés pour la reprise après reconnexion (Last-Event-ID)
+EVENT_HISTORY_SIZE = int(os.environ.get("EVENT_HISTORY_SIZE", "1000"))
+
+DEMANDE_CREATED = "demande.created"
+DEMANDE_STATUS_CHANGED = "demande.status_changed"
+DEMANDE_DELETED = "demande.deleted"
+
+# Rôles qui reçoivent les événements de toutes les demandes
+ALL_DEMANDES_ROLES = {"ADMIN", "SECRETAIRE"}
+
+
+class Subscriber:
+    """Une connexion SSE: file d'événements et filtre par utilisateur"""
+
+    __slots__ = ("user_id", "sees_all", "queue", "closed")
+
+    def __init__(self, user_id: int, role: str):
+        self.user_id = user_id
+        self.sees_all = role in ALL_DEMANDES_ROLES
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.closed = False
+
+    def wants(self, event: dict) -> bool:
+        return self.sees_all or event["user_id"] == self.user_id
+
+
+class EventHub:
+    """Abonnés SSE et historique récent des événements"""
+
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE):
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._ids = itertools.count(1)
+        # Préfixe des identifiants: un Last-Event-ID d'avant un redémarrage n'est pas rejouable
+        self._boot = format(int(time.time()), "x")
+        self._lock = threading.Lock()
+        self._loop = None
+        self._published = 0
+        self._dropped = 0
+
+    def subscribe(self, user_id: int, role: str) -> Subscriber:
+        """Nouvel abonné (à appeler depuis la boucle asyncio)"""
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(user_id, role)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.closed = True
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event_type: str, demande: dict):
+        """Publier un événement de demande (thread quelconque); demande doit contenir id et user_id"""
+        with self._lock:
+            seq = next(self._ids)
+            event = {
+                "seq": seq,
+                "id": f"{self._boot}-{seq}",
+                "type": event_type,
+                "user_id": demande.get("user_id"),
+            }
+            data = json.dumps({"type": event_type, "at": datetime.now().isoformat(), "demande": demande},
+                              ensure_ascii=False, default=str)
+            # Trame SSE encodée une fois, partagée par tous les abonnés
+            event["frame"] = f"id: {event['id']}\nevent: {event_type}\ndata: {data}\n\n".encode("utf-8")
+            self._history.append(event)
+            self._published += 1
+        loop = self._loop
+        if loop is None or not self._subscribers or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(event)
+        else:
+            loop.call_soon_threadsafe(self._fanout, event)
+
+    def _fanout(self, event: dict):
+        for subscriber in list(self._subscribers):
+            if not subscriber.wants(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Client trop lent: fermé, il se reconnectera avec Last-Event-ID
+                self._dropped += 1
+                self.unsubscribe(subscriber)
+
+    def replay(self, subscriber: Subscriber, last_event_id: str):
+        """Événements postérieurs à last_event_id; None s'ils ne sont plus dans l'historique"""
+        boot, _, seq = last_event_id.partition("-")
+        if boot != self._boot or not seq.isdigit():
+            return None
+        last_seq = int(seq)
+        with self._lock:
+            history = list(self._history)
+        if history and history[0]["seq"] > last_seq + 1:
+            return None
+        return [event for event in history if event["seq"] > last_seq and subscriber.wants(event)]
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self._published,
+            "dropped_subscribers": self._dropped,
+            "history": len(self._history),
+        }
+
+
+event_hub = EventHub()
+
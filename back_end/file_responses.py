@@ -0,0 +1,236 @@
+"""
+Réponses fichier avec cache HTTP, pour /uploads et /photos.
+
+- ETag fort pour les blobs (le SHA-256 du contenu, lu dans leur nom), ETag faible
+  tiré de la taille et de la date de modification pour les autres fichiers: aucun
+  fichier n'est relu pour calculer son ETag (StaticFiles répond depuis la boucle
+  d'événements);
+- If-None-Match / If-Modified-Since -> 304 sans corps;
+- Cache-Control immutable (1 an) pour les noms qui contiennent un hash de contenu
+  (uploads/blobs/..., et leurs miniatures uploads/thumbs/blobs/...), une journée sinon;
+- Range: une plage d'octets -> 206 (416 si hors du fichier), If-Range respecté;
+  plusieurs plages -> fichier complet.
+
+Les téléchargements de documents (zero_copy=True) envoient le fichier par
+sendfile si le serveur ASGI propose l'extension http.response.zerocopysend;
+sinon (uvicorn, hypercorn) par des lectures en thread, comme FileResponse: la
+boucle d'événements ne copie jamais le contenu du fichier.
+"""
+
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+from starlette.staticfiles import StaticFiles
+
+from upload_streaming import UPLOAD_CHUNK_SIZE
+
+CONTENT_HASH_RE = re.compile(r"(?<![0-9a-f])[0-9a-f]{64}(?![0-9a-f])")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+ZERO_COPY_EXTENSION = "http.response.zerocopysend"
+
+
+def is_content_addressed(path) -> bool:
+    return CONTENT_HASH_RE.search(Path(path).as_posix()) is not None
+
+
+def cache_control_for(path) -> str:
+    return IMMUTABLE_CACHE_CONTROL if is_content_addressed(path) else DEFAULT_CACHE_CONTROL
+
+
+def file_etag(path, stat_result: os.stat_result) -> str:
+    """ETag fort d'un blob (le nom est déjà le SHA-256 du contenu), faible pour les autres fichiers"""
+    path = Path(path)
+    if CONTENT_HASH_RE.fullmatch(path.stem):
+        return f'"{path.stem}"'
+    return weak_etag(stat_result)
+
+
+def weak_etag(stat_result: os.stat_result) -> str:
+    """ETag faible tiré de la taille et de la date de modification (sans lire le fichier)"""
+    return f'W/"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Comparaison faible (RFC 9110): W/"x" correspond à "x"
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    opaque = etag.removeprefix("W/")
+    return "*" in candidates or any(candidate.removeprefix("W/") == opaque for candidate in candidates)
+
+
+def _not_modified(request_headers: Headers, etag: str, stat_result: os.stat_result) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _if_range_matches(if_range: str, etag: str, stat_result: os.stat_result) -> bool:
+    # If-Range exige une comparaison forte: un ETag faible ne valide jamais la plage
+    if_range = if_range.strip()
+    if if_range.startswith(("W/", '"')):
+        return not etag.startswith("W/") and if_range == etag
+    try:
+        return int(stat_result.st_mtime) == parsedate_to_datetime(if_range).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(range_header: str, size: int):
+    """(début, fin) inclus pour une plage "bytes=...", None s'il faut envoyer tout le fichier"""
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+    start_text, _, end_text = spec.partition("-")
+    start_text, end_text = start_text.strip(), end_text.strip()
+    if not start_text:
+        # Suffixe: les N derniers octets
+        if not end_text.isdigit():
+            return None
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    if not start_text.isdigit() or (end_text and not end_text.isdigit()):
+        return None
+    start = int(start_text)
+    if end_text and int(end_text) < start:
+        # Plage invalide (fin avant début): en-tête ignoré, fichier complet (RFC 9110 §14.2)
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    end = min(int(end_text), size - 1) if end_text else size - 1
+    return start, end
+
+
+async def _iter_file_range(path, start: int, length: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class ZeroCopyFileResponse(Response):
+    """Envoi d'une plage d'un fichier par sendfile (extension ASGI), sinon par lectures en thread"""
+
+    def __init__(self, path, start: int, length: int, status_code: int = 200,
+                 headers: dict = None, media_type: str = None, method: str = "GET"):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.send_header_only = method.upper() == "HEAD"
+        self.background = None
+        self.init_headers({**(headers or {}), "content-length": str(length)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if ZERO_COPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                # Le serveur envoie le fichier lui-même (os.sendfile)
+                await send({"type": ZERO_COPY_EXTENSION, "file": f.fileno(),
+                            "offset": self.start, "count": self.length, "more_body": False})
+            return
+        # Pas de mmap ici: copier ses tranches sur la boucle bloque à chaque défaut de page
+        # (fichier hors du cache du noyau). Lectures en thread, au prix d'une copie par tranche
+        async for chunk in _iter_file_range(self.path, self.start, self.length):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def cached_file_response(
+    path,
+    request_headers: Headers,
+    method: str = "GET",
+    stat_result: os.stat_result = None,
+    media_type: str = None,
+    headers: dict = None,
+    filename: str = None,
+    cache_control: str = None,
+    etag: str = None,
+    zero_copy: bool = False,
+) -> Response:
+    """Réponse 200/206/304/416 pour un fichier, avec ETag, Cache-Control et Range"""
+    stat_result = stat_result or os.stat(path)
+    etag = etag or file_etag(path, stat_result)
+    media_type = media_type or mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+    cache_headers = {
+        **(headers or {}),
+        "etag": etag,
+        "cache-control": cache_control or cache_control_for(path),
+        "accept-ranges": "bytes",
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+    if _not_modified(request_headers, etag, stat_result):
+        return Response(status_code=304, headers=cache_headers)
+
+    size = stat_result.st_size
+    byte_range = None
+    if_range = request_headers.get("if-range")
+    if if_range is None or _if_range_matches(if_range, etag, stat_result):
+        try:
+            byte_range = parse_range(request_headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**cache_headers, "content-range": f"bytes */{size}"})
+
+    if filename is not None:
+        # Même Content-Disposition que FileResponse (noms non ASCII encodés)
+        cache_headers["content-disposition"] = FileResponse(
+            path, stat_result=stat_result, filename=filename).headers["content-disposition"]
+
+    if byte_range is None:
+        if zero_copy:
+            return ZeroCopyFileResponse(path, 0, size, headers=cache_headers, media_type=media_type, method=method)
+        return FileResponse(path, stat_result=stat_result, method=method, media_type=media_type,
+                            headers=cache_headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    range_headers = {**cache_headers, "content-range": f"bytes {start}-{end}/{size}",
+                     "content-length": str(length)}
+    if zero_copy:
+        return ZeroCopyFileResponse(path, start, length, status_code=206, headers=range_headers,
+                                    media_type=media_type, method=method)
+    if method.upper() == "HEAD":
+        return Response(status_code=206, headers=range_headers, media_type=media_type)
+    return StreamingResponse(_iter_file_range(path, start, length), status_code=206,
+                             headers=range_headers, media_type=media_type)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles avec ETag, 304, Range et Cache-Control (voir cached_file_response)"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        if status_code != 200:
+            # Pages d'erreur (mode html): comportement standard
+            return super().file_response(full_path, stat_result, scope, status_code)
+        return cached_file_response(full_path, Headers(scope=scope), scope["method"], stat_result)
@@ -0,0 +1,19 @@
+"""
+Exécuteur dédié aux traitements d'image (Pillow: ouverture, redimensionnement, encodage).
+
+Les endpoints d'upload tournent dans le pool de threads de FastAPI; le travail
+Pillow est confié à un petit exécuteur séparé pour qu'un gros redimensionnement
+ne monopolise pas les threads qui servent les requêtes SQLite.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+
+def run_image_task(func, *args, **kwargs):
+    """Exécuter func sur l'exécuteur d'images et attendre son résultat"""
+    return image_executor.submit(func, *args, **kwargs).result()
@@ -0,0 +1,136 @@
+"""
+Miniatures des photos en plusieurs tailles, en WebP et en JPEG.
+
+Pour une photo uploads/<chemin>, les variantes sont rangées côte à côte dans
+uploads/thumbs/<chemin>/<taille>.webp et <taille>.jpg. Elles sont produites à
+l'upload (pregenerate_photo_variants) et, pour les anciennes photos, au premier
+accès via GET /photos/{taille}/{chemin}, qui choisit WebP ou JPEG selon l'en-tête
+Accept du navigateur.
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+
+try:
+    from PIL import Image
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+log = logging.getLogger(__name__)
+
+UPLOAD_ROOT = Path("uploads")
+THUMBS_ROOT = UPLOAD_ROOT / "thumbs"
+
+# Côté maximal en pixels (2x la taille affichée, pour les écrans haute densité)
+PHOTO_SIZES = {
+    "avatar": 64,
+    "list": 96,
+    "profile": 400,
+}
+# format -> (extension, format Pillow, options d'encodage)
+PHOTO_FORMATS = {
+    "webp": ("webp", "WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Formats que Pillow sait réduire (les SVG sont servis tels quels)
+RASTER_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+# Seules sources servies par /photos: les documents (PDF...) des blobs n'en sortent jamais
+PHOTO_SOURCE_EXTENSIONS = RASTER_EXTENSIONS | {".svg"}
+# Dossiers de uploads/ qui ne contiennent pas de photos servies par /photos
+EXCLUDED_SOURCE_DIRS = {"thumbs", "attestations"}
+# Uploads en cours de réception (uploads/blobs/tmp)
+EXCLUDED_SOURCE_PREFIXES = (("blobs", "tmp"),)
+
+
+def resolve_photo_source(photo: str):
+    """Chemin relatif (posix) d'une photo sous uploads/ à partir d'une URL ou d'un chemin, ou None
+    (pas une image, ou hors des dossiers de photos)"""
+    relative = str(photo).replace("\\", "/").lstrip("/")
+    if not relative.startswith(UPLOAD_ROOT.as_posix() + "/"):
+        relative = f"{UPLOAD_ROOT.as_posix()}/{relative}"
+    parts = Path(relative).parts
+    if ".." in parts or len(parts) < 2 or parts[1] in EXCLUDED_SOURCE_DIRS:
+        return None
+    if any(parts[1:1 + len(prefix)] == prefix for prefix in EXCLUDED_SOURCE_PREFIXES):
+        return None
+    if Path(relative).suffix.lower() not in PHOTO_SOURCE_EXTENSIONS:
+        return None
+    return Path(relative).as_posix()
+
+
+def variant_path(source: str, size: str, image_format: str) -> Path:
+    extension = PHOTO_FORMATS[image_format][0]
+    relative = Path(source).relative_to(UPLOAD_ROOT)
+    return THUMBS_ROOT / relative / f"{size}.{extension}"
+
+
+def variant_source(path: str):
+    """Photo d'origine d'une variante uploads/thumbs/<chemin>/<taille>.<ext>, ou None"""
+    prefix = THUMBS_ROOT.as_posix() + "/"
+    if not path.startswith(prefix):
+        return None
+    return (UPLOAD_ROOT / Path(path[len(prefix):]).parent).as_posix()
+
+
+def photo_variant_urls(photo: str) -> dict:
+    """URLs /photos/{taille}/... d'une photo (le format est choisi par l'en-tête Accept)"""
+    source = resolve_photo_source(photo) if photo else None
+    if source is None:
+        return {}
+    return {size: f"/photos/{size}/{source}" for size in PHOTO_SIZES}
+
+
+def select_format(accept: str) -> str:
+    return "webp" if accept and "image/webp" in accept else "jpeg"
+
+
+def _save_atomic(img, path: Path, pillow_format: str, options: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}_{threading.get_ident()}.tmp")
+    img.save(tmp_path, format=pillow_format, **options)
+    os.replace(tmp_path, path)
+
+
+def generate_photo_variants(source: str) -> int:
+    """Produire les variantes manquantes d'une photo; retourne le nombre de fichiers écrits"""
+    if not PILLOW_AVAILABLE or Path(source).suffix.lower() not in RASTER_EXTENSIONS:
+        return 0
+    missing = [
+        (size, image_format)
+        for size in PHOTO_SIZES for image_format in PHOTO_FORMATS
+        if not variant_path(source, size, image_format).exists()
+    ]
+    if not missing:
+        return 0
+
+    written = 0
+    with Image.open(source) as img:
+        img.load()
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            current = Image.new("RGB", rgba.size, (255, 255, 255))
+            current.paste(rgba, mask=rgba.split()[-1])
+        else:
+            current = img.convert("RGB")
+    # Du plus grand au plus petit: chaque taille est réduite à partir de la précédente
+    for size in sorted(PHOTO_SIZES, key=PHOTO_SIZES.get, reverse=True):
+        current.thumbnail((PHOTO_SIZES[size], PHOTO_SIZES[size]), Image.Resampling.LANCZOS)
+        for image_format, (_, pillow_format, options) in PHOTO_FORMATS.items():
+            if (size, image_format) in missing:
+                _save_atomic(current, variant_path(source, size, image_format), pillow_format, options)
+                written += 1
+    return written
+
+
+def pregenerate_photo_variants(photo: str):
+    """Variantes produites à l'upload; un échec n'empêche pas l'upload (repli sur l'accès)"""
+    source = resolve_photo_source(photo) if photo else None
+    if source is None:
+        return
+    try:
+        generate_photo_variants(source)
+    except Exception as e:
+        log.warning("Miniatures non générées pour %s: %s", source, e)
@@ -1,10 +1,11 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, Header, File, UploadFile, Response, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import json
+import logging
 import os
 import shutil
 import uuid
@@ -18,9 +19,39 @@ from sqlalchemy.orm import Session
 from database import SessionLocal, engine
 from models import Base, User, UserRole, Enseignant, Fonctionnaire, Demande, DemandeStatus
 from schemas import EnseignantComplete
+from sqlite_pool import get_sqlite_connection, get_pool_metrics, WriterLeaseTimeout
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, next_cursor
+from migrations import run_migrations
+from dashboard_stats import get_dashboard_stats as get_cached_dashboard_stats, invalidate_dashboard_stats
+from auth_cache import invalidate_user, revoke_user, get_auth_cache_stats
+from document_access_cache import get_document_access_cache_stats
+from attestations import get_attestation_cache_stats
+from attestation_log import import_legacy_log
+from attestation_batch import attestation_batch_runner
+from event_hub import event_hub, DEMANDE_CREATED, DEMANDE_STATUS_CHANGED, DEMANDE_DELETED
+from security import (
+    get_current_principal, require_roles, create_user_token, AUTH_ALLOW_TEST_ACCOUNTS, FALLBACK_TEST_USERS
+)
+from image_tasks import run_image_task
+from data_journal import DataJournal
+from upload_streaming import MAX_PHOTO_SIZE
+from blob_store import (
+    receive_upload, add_blob_reference, receive_derived_upload, add_derived_upload_reference,
+    release_file, retain_file, replace_file_reference, discard_temp, purge_unreferenced_blobs
+)
+from upload_gc import UploadSweeper
+from image_variants import pregenerate_photo_variants, photo_variant_urls
+from file_responses import CachedStaticFiles
+from fastapi.concurrency import run_in_threadpool
+from app_logging import configure_logging, get_logging_stats
+from metrics import MetricsMiddleware, METRICS_TOKEN, render_metrics
+from query_profiler import get_sql_profile, reset_sql_profile, SORT_KEYS as SQL_PROFILE_SORT_KEYS
+
+configure_logging()
+log = logging.getLogger(__name__)
 
 # Import des routeurs
-from routers import enseignant, demandes, users
+from routers import enseignant, demandes, users, photos, attestations, events
 
 # Ajouter un routeur avec le nom singulier pour compatibilité
 from fastapi import APIRouter
@@ -28,10 +59,10 @@ from fastapi import APIRouter
 router_enseignant_singular = APIRouter(prefix="/enseignant", tags=["Enseignant"])
 
 @router_enseignant_singular.get("/profil")
-async def get_profil_singular(authorization: str = Header(None)):
+def get_profil_singular(authorization: str = Header(None)):
     """Endpoint de compatibilité pour /enseignant/profil"""
     from routers.enseignant import get_profile
-    return await get_profile(authorization)
+    return get_profile(authorization)
 
 # Import conditionnel pour Pillow
 try:
@@ -53,52 +84,47 @@ app.add_middleware(
     allow_origins=["*"],  # Allow all origins for testing
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER]
         )
 
+# Connexion d'écriture occupée trop longtemps: 503, le client peut réessayer
+@app.exception_handler(WriterLeaseTimeout)
+async def writer_lease_timeout_handler(request: Request, exc: WriterLeaseTimeout):
+    log.warning("%s %s: %s", request.method, request.url.path, exc)
+    return JSONResponse(status_code=503, content={"detail": "Base de données occupée, réessayez"},
+                        headers={"Retry-After": "1"})
+
+# Latence, octets et requêtes SQL par route (ajouté en dernier: englobe toute la pile)
+app.add_middleware(MetricsMiddleware)
+
 # Inclure les routeurs
 app.include_router(enseignant.router)
 app.include_router(demandes.router)  # Réactivé pour les demandes
 # app.include_router(users.router, prefix="/api/users", tags=["users"])  # Désactivé pour éviter conflit
 app.include_router(router_enseignant_singular)
+app.include_router(photos.router)
+app.include_router(attestations.router)
+app.include_router(events.router)
 
 # Créer le dossier pour les images
 UPLOAD_DIR = Path("uploads/images")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # Monter le dossier static pour servir les images
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", CachedStaticFiles(directory="uploads"), name="uploads")
 
 # Data persistence functions
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 
-def load_data_from_file(filename: str, default_data: dict):
-    """Load data from JSON file or return default if file doesn't exist"""
-    file_path = DATA_DIR / filename
-    if file_path.exists():
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading {filename}: {e}")
-            return default_data
-    return default_data
-
-def save_data_to_file(filename: str, data: dict):
-    """Save data to JSON file"""
-    file_path = DATA_DIR / filename
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving {filename}: {e}")
-
-def save_all_data():
-    """Save all data to files"""
-    save_data_to_file("users.json", TEST_USERS)
-    save_data_to_file("enseignants.json", ENSEIGNANTS_DB)
-    save_data_to_file("demandes.json", DEMANDES_DB)
+# Journal d'ajout: chaque mutation est une ligne de data/journal.jsonl,
+# compactée périodiquement dans users.json, enseignants.json et demandes.json
+data_journal = DataJournal(DATA_DIR, {
+    "users": "users.json",
+    "enseignants": "enseignants.json",
+    "demandes": "demandes.json",
+})
 
 # Simple token response model
 class Token(BaseModel):
@@ -237,9 +263,10 @@ DEFAULT_TEST_USERS = {
 }
 
 # Load data from files or use defaults
-TEST_USERS = load_data_from_file("users.json", DEFAULT_TEST_USERS.copy())
-ENSEIGNANTS_DB = load_data_from_file("enseignants.json", {})
-DEMANDES_DB = load_data_from_file("demandes.json", {})
+_stores = data_journal.load({"users": DEFAULT_TEST_USERS.copy()})
+TEST_USERS = _stores["users"]
+ENSEIGNANTS_DB = _stores["enseignants"]
+DEMANDES_DB = _stores["demandes"]
 
 # Initialize counters based on existing data
 def initialize_counters():
@@ -462,7 +489,7 @@ def initialize_test_demandes():
     ]
 
     for demande in test_demandes:
-        DEMANDES_DB[demande["id"]] = demande
+        DEMANDES_DB[str(demande["id"])] = demande
         if demande["id"] >= demande_id_counter:
             demande_id_counter = demande["id"] + 1
 
@@ -502,8 +529,22 @@ def initialize_test_fonctionnaires():
 # Initialiser les données de test pour les fonctionnaires
 initialize_test_fonctionnaires()
 
-# Fonction pour sauvegarder et redimensionner l'image
-def save_and_resize_image(file: UploadFile, max_size: tuple = (300, 300)) -> str:
+# Redimensionner une image sur place (format d'origine conservé, le fichier temporaire n'a pas d'extension)
+def resize_image_file(file_path: Path, max_size: tuple = (300, 300)):
+    if not PILLOW_AVAILABLE:
+        return
+    try:
+        with Image.open(file_path) as img:
+            image_format = img.format
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            img.save(file_path, format=image_format, optimize=True, quality=85)
+    except Exception:
+        pass  # Continuer sans redimensionnement
+
+# Fonction pour recevoir et redimensionner l'image (stockage par contenu, voir blob_store)
+def save_and_resize_image(file: UploadFile, max_size: tuple = (300, 300)) -> dict:
     if not file.filename:
         raise HTTPException(status_code=400, detail="Nom de fichier manquant")
 
@@ -511,31 +552,73 @@ def save_and_resize_image(file: UploadFile, max_size: tuple = (300, 300)) -> str
     if file_extension not in ["jpg", "jpeg", "png", "gif"]:
         raise HTTPException(status_code=400, detail="Format non supporté. Utilisez JPG, PNG ou GIF")
 
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-
     try:
-        # Sauvegarder l'image
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Redimensionner si Pillow disponible
-        if PILLOW_AVAILABLE:
-            try:
-                with Image.open(file_path) as img:
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        img = img.convert('RGB')
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                    img.save(file_path, optimize=True, quality=85)
-            except Exception:
-                pass  # Continuer sans redimensionnement
-
-        return f"/uploads/images/{unique_filename}"
-
+        received = receive_derived_upload(
+            file, MAX_PHOTO_SIZE, f"photo_{max_size[0]}x{max_size[1]}",
+            lambda path: resize_image_file(path, max_size)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        if file_path.exists():
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    received["extension"] = f".{file_extension}"
+    return received
+
+# Migrations du schéma SQLite (index, tables techniques)
+@app.on_event("startup")
+def apply_migrations():
+    conn = get_sqlite_connection(write=True)
+    try:
+        run_migrations(conn)
+    finally:
+        conn.close()
+
+# Blobs dont plus aucune ligne ne référence le contenu
+@app.on_event("startup")
+def purge_blobs():
+    purged = purge_unreferenced_blobs()
+    if purged:
+        log.info("%d blob(s) sans référence supprimé(s)", purged)
+
+# Import unique de l'ancien journal uploads/attestations/attestations_log.json
+@app.on_event("startup")
+def import_attestation_log():
+    imported = import_legacy_log()
+    if imported:
+        log.info("%d émission(s) importée(s) depuis attestations_log.json", imported)
+
+# Lots d'attestations: reprise des lots interrompus, puis traitement des nouveaux
+@app.on_event("startup")
+def start_attestation_batches():
+    attestation_batch_runner.start()
+
+@app.on_event("shutdown")
+def stop_attestation_batches():
+    attestation_batch_runner.stop()
+
+# Documents des demandes en mémoire (noms de fichiers relatifs à uploads/)
+def json_store_document_references():
+    for demande in list(DEMANDES_DB.values()):
+        for filename in demande.get("documents") or []:
+            if isinstance(filename, str):
+                yield f"uploads/{filename}"
+
+# Nettoyage planifié des fichiers uploadés orphelins (voir upload_gc.py)
+upload_sweeper = UploadSweeper(extra_references=json_store_document_references)
+
+@app.on_event("startup")
+def start_upload_sweeper():
+    upload_sweeper.start()
+
+@app.on_event("shutdown")
+def stop_upload_sweeper():
+    upload_sweeper.stop()
+
+# Compaction du journal à l'arrêt: le prochain démarrage n'a rien à rejouer
+@app.on_event("shutdown")
+def compact_data_journal():
+    if data_journal.stats()["pending_mutations"]:
+        data_journal.compact()
 
 # Root endpoint
 @app.get("/")
@@ -554,7 +637,7 @@ async def test():
 
 # Login endpoint for authentication
 @app.post("/auth/login", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     # Import hashlib pour vérifier les mots de passe
     import hashlib
     
@@ -573,23 +656,23 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             
             if user_data['hashed_password'] == password_hash:
                 conn.close()
-                print(f"✅ Authentification réussie pour {form_data.username} (ID: {user_data['id']}, Role: {user_data['role']})")
+                log.info("Authentification réussie", extra={"user_id": user_data["id"], "role": user_data["role"]})
                 return {
-                    "access_token": f"test_token_{user_data['id']}_{user_data['role']}",
+                    "access_token": create_user_token(user_data),
                     "token_type": "bearer"
                 }
             else:
-                print(f"❌ Mot de passe incorrect pour {form_data.username}")
+                log.warning("Mot de passe incorrect", extra={"email": form_data.username})
         else:
-            print(f"❌ Utilisateur {form_data.username} non trouvé ou inactif")
+            log.info("Utilisateur non trouvé ou inactif", extra={"email": form_data.username})
         
         conn.close()
 
     except Exception as e:
-        print(f"Erreur lors de la vérification dans la base de données: {e}")
+        log.error("Erreur lors de la vérification dans la base de données: %s", e)
 
-    # Fallback vers les TEST_USERS pour la compatibilité
-    user = TEST_USERS.get(form_data.username)
+    # Fallback vers les TEST_USERS (développement seulement, AUTH_ALLOW_TEST_ACCOUNTS)
+    user = TEST_USERS.get(form_data.username) if AUTH_ALLOW_TEST_ACCOUNTS else None
     if not user or user["password"] != form_data.password:
         raise HTTPException(
             status_code=401,
@@ -597,65 +680,52 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-    # Retourner un token simple (pour les tests)
     return {
-        "access_token": f"test_token_{user['id']}_{user['role']}",
+        "access_token": create_user_token(user),
         "token_type": "bearer"
     }
 
 # Get current user info endpoint
 @app.get("/auth/me")  # Retiré response_model=User temporairement
-async def read_users_me(authorization: str = Header(None)):
-    # Extraire les informations du token
-    if authorization and authorization.startswith("Bearer "):
-        token = authorization.replace("Bearer ", "")
-
-        # Le token a le format: test_token_{user_id}_{role}
-        if token.startswith("test_token_"):
-            parts = token.split("_")
-            if len(parts) >= 3:
-                user_id = parts[2]
-                role = parts[3] if len(parts) > 3 else ""
-
-                # Vérifier d'abord dans la base de données SQLite
-                try:
-                    conn = get_sqlite_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT * FROM users WHERE id = ? AND role = ? AND is_active = 1",
-                                 (user_id, role.upper()))
-                    user_data = cursor.fetchone()
-                    conn.close()
+def read_users_me(current_user: dict = Depends(get_current_principal)):
+    # Le token ne porte que l'identité: compléter le profil depuis la base SQLite
+    try:
+        conn = get_sqlite_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE id = ? AND role = ? AND is_active = 1",
+                     (current_user["id"], current_user["role"]))
+        user_data = cursor.fetchone()
+        conn.close()
+
+        if user_data:
+            return {
+                "id": user_data["id"],
+                "email": user_data["email"],
+                "nom": user_data["nom"],
+                "prenom": user_data["prenom"],
+                "telephone": user_data["telephone"] or "",
+                "adresse": user_data["adresse"] or "",
+                "cin": user_data["cin"] or "",
+                "role": user_data["role"].lower(),
+                "is_active": bool(user_data["is_active"]),
+                "created_at": user_data["created_at"] or "2025-01-01T00:00:00",
+                "updated_at": user_data["updated_at"] or None
+            }
+
+    except Exception as e:
+        log.error("Erreur lors de la vérification dans la base de données: %s", e)
+
+    # Fallback vers les comptes de test (développement seulement, AUTH_ALLOW_TEST_ACCOUNTS)
+    if AUTH_ALLOW_TEST_ACCOUNTS and current_user["id"] in FALLBACK_TEST_USERS:
+        return {
+            "id": current_user["id"],
+            "email": current_user["email"],
+            "nom": current_user["nom"],
+            "prenom": current_user["prenom"],
+            "role": current_user["role"].lower()
+        }
 
-                    if user_data:
-                        return {
-                            "id": user_data["id"],
-                            "email": user_data["email"],
-                            "nom": user_data["nom"],
-                            "prenom": user_data["prenom"],
-                            "telephone": user_data["telephone"] or "",
-                            "adresse": user_data["adresse"] or "",
-                            "cin": user_data["cin"] or "",
-                            "role": user_data["role"].lower(),
-                            "is_active": bool(user_data["is_active"]),
-                            "created_at": user_data["created_at"] or "2025-01-01T00:00:00",
-                            "updated_at": user_data["updated_at"] or None
-                        }
-
-                except Exception as e:
-                    print(f"Erreur lors de la vérification dans la base de données: {e}")
-
-                # Fallback vers les TEST_USERS pour la compatibilité
-                for email, user_data in TEST_USERS.items():
-                    if str(user_data["id"]) == user_id and user_data["role"] == role:
-                        return {
-                            "id": user_data["id"],
-                            "email": user_data["email"],
-                            "nom": user_data["nom"],
-                            "prenom": user_data["prenom"],
-                            "role": user_data["role"]
-                        }
-
-    # Si le token n'est pas valide, retourner une erreur au lieu de l'admin par défaut
+    # Si l'utilisateur n'existe plus, retourner une erreur au lieu de l'admin par défaut
     raise HTTPException(
         status_code=401,
         detail="Token invalide ou manquant",
@@ -677,23 +747,14 @@ async def get_test_users():
 
 # Créer un enseignant (endpoint pour admin)
 @app.post("/users/enseignants")
-async def create_enseignant(
+def create_enseignant(
     enseignant_data: dict,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Droits admin requis"))
 ):
     """Créer un nouvel enseignant dans la base de données SQLite"""
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Vérifier si c'est un admin (simplifié)
-    if not ("admin" in token.lower() or token.startswith("test_token_")):
-        raise HTTPException(status_code=403, detail="Droits admin requis")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Extraire les données utilisateur
@@ -745,6 +806,7 @@ async def create_enseignant(
         enseignant_id = cursor.lastrowid
 
         conn.commit()
+        invalidate_dashboard_stats()
         conn.close()
 
         return {
@@ -760,70 +822,16 @@ async def create_enseignant(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création: {str(e)}")
+    finally:
+        conn.close()
 
     return enseignant_response
 
 # Récupérer tous les enseignants (endpoint pour admin)
 @app.get("/users/enseignants")
-async def get_all_enseignants(
-    authorization: str = Header(None)
+def get_all_enseignants(
+    current_user: dict = Depends(require_roles("ADMIN", "ENSEIGNANT", detail="Accès refusé. Connexion requise."))
 ):
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-    print(f"🔍 [GET ENSEIGNANTS] Token reçu: {token[:30]}...")
-
-    # Vérifier si c'est un admin ou un enseignant connecté
-    admin_user = None
-    current_user_id = None
-    user_role = None
-    
-    if token.startswith("test_token_"):
-        # Logique pour les tokens de test
-        parts = token.split("_")
-        print(f"🔍 [GET ENSEIGNANTS] Token test parts: {parts}")
-        if len(parts) >= 3:
-            current_user_id = parts[2] if parts[2].isdigit() else None
-        if len(parts) >= 4:
-            user_role = parts[3].upper()
-            
-        if user_role == "ADMIN":
-            admin_user = {"role": "admin"}
-            print(f"✅ [GET ENSEIGNANTS] Token admin test validé")
-        elif user_role == "ENSEIGNANT":
-            admin_user = {"role": "enseignant", "user_id": current_user_id}
-            print(f"✅ [GET ENSEIGNANTS] Token enseignant test validé")
-        elif any("admin" in part.lower() for part in parts):
-            admin_user = {"role": "admin"}
-            print(f"✅ [GET ENSEIGNANTS] Token admin test validé (fallback)")
-    else:
-        # Logique pour les vrais tokens JWT
-        try:
-            from auth import decode_jwt_token
-            payload = decode_jwt_token(token)
-            user_role = payload.get("role")
-            current_user_id = payload.get("user_id")
-            
-            print(f"🔍 [GET ENSEIGNANTS] JWT décodé - Role: {user_role}, User ID: {current_user_id}")
-            
-            if user_role == "ADMIN":
-                admin_user = {"role": "admin", "user_id": current_user_id}
-                print(f"✅ [GET ENSEIGNANTS] Token JWT admin validé")
-            elif user_role == "ENSEIGNANT":
-                admin_user = {"role": "enseignant", "user_id": current_user_id}
-                print(f"✅ [GET ENSEIGNANTS] Token JWT enseignant validé")
-            else:
-                print(f"❌ [GET ENSEIGNANTS] Role insuffisant: {user_role}")
-                
-        except Exception as jwt_error:
-            print(f"❌ [GET ENSEIGNANTS] Erreur décodage JWT: {jwt_error}")
-
-    if not admin_user:
-        print(f"❌ [GET ENSEIGNANTS] Accès refusé pour token: {token[:30]}")
-        raise HTTPException(status_code=403, detail="Accès refusé. Connexion requise.")
-
     # Récupérer tous les enseignants depuis SQLite directement
     try:
         conn = get_sqlite_connection()
@@ -868,9 +876,9 @@ async def get_all_enseignants(
             enseignants.append(enseignant)
 
         # Si c'est un enseignant, ne retourner que ses propres données
-        if admin_user.get("role") == "enseignant" and current_user_id:
-            enseignants = [ens for ens in enseignants if str(ens["user_id"]) == str(current_user_id)]
-            print(f"🔍 [GET ENSEIGNANTS] Filtrage pour enseignant {current_user_id}: {len(enseignants)} résultats")
+        if current_user["role"] == "ENSEIGNANT":
+            enseignants = [ens for ens in enseignants if ens["user_id"] == current_user["id"]]
+            log.debug("Filtrage pour enseignant %s: %d résultats", current_user["id"], len(enseignants))
 
         conn.close()
         return enseignants
@@ -880,24 +888,15 @@ async def get_all_enseignants(
 
 # Modifier un enseignant (endpoint pour admin)
 @app.put("/users/enseignants/{enseignant_id}")
-async def update_enseignant(
+def update_enseignant(
     enseignant_id: int,
     enseignant_data: dict,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Droits admin requis"))
 ):
     """Modifier un enseignant existant dans la base de données SQLite"""
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Vérifier si c'est un admin (simplifié)
-    if not ("admin" in token.lower() or token.startswith("test_token_")):
-        raise HTTPException(status_code=403, detail="Droits admin requis")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Vérifier que l'enseignant existe et récupérer les données actuelles
@@ -961,7 +960,7 @@ async def update_enseignant(
             password_hash = hashlib.sha256(new_password.encode()).hexdigest()
             user_updates.append("hashed_password = ?")
             user_params.append(password_hash)
-            print(f"🔑 Mot de passe mis à jour pour {enseignant_data.get('email', 'enseignant')}")
+            log.info("Mot de passe mis à jour", extra={"email": enseignant_data.get("email")})
 
         # Mettre à jour les données utilisateur seulement si il y a des changements
         if user_updates:
@@ -996,6 +995,7 @@ async def update_enseignant(
             ''', enseignant_params)
 
         conn.commit()
+        invalidate_user(user_id)
 
         # Récupérer l'enseignant modifié pour le retourner
         cursor.execute('''
@@ -1037,26 +1037,19 @@ async def update_enseignant(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la modification: {str(e)}")
+    finally:
+        conn.close()
 
 # Supprimer un enseignant (endpoint pour admin)
 @app.delete("/users/enseignants/{enseignant_id}")
-async def delete_enseignant(
+def delete_enseignant(
     enseignant_id: int,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Droits admin requis"))
 ):
     """Supprimer un enseignant de la base de données SQLite"""
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Vérifier si c'est un admin (simplifié)
-    if not ("admin" in token.lower() or token.startswith("test_token_")):
-        raise HTTPException(status_code=403, detail="Droits admin requis")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Récupérer l'user_id et la photo pour nettoyage
@@ -1068,14 +1061,8 @@ async def delete_enseignant(
         user_id = result['user_id']
         photo_url = result['photo']
 
-        # Supprimer la photo si elle existe
-        if photo_url:
-            photo_path = Path(f"uploads{photo_url.replace('/uploads', '')}")
-            if photo_path.exists():
-                try:
-                    os.remove(photo_path)
-                except:
-                    pass
+        # Rendre la référence sur la photo (blob partagé ou ancien fichier)
+        release_file(conn, photo_url)
 
         # Supprimer l'enseignant
         cursor.execute("DELETE FROM enseignants WHERE id = ?", (enseignant_id,))
@@ -1084,6 +1071,8 @@ async def delete_enseignant(
         cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
 
         conn.commit()
+        invalidate_dashboard_stats()
+        revoke_user(user_id)
         conn.close()
 
         return {"message": "Enseignant supprimé avec succès"}
@@ -1092,28 +1081,21 @@ async def delete_enseignant(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
+    finally:
+        conn.close()
 
 # ===== ENDPOINTS POUR LES FONCTIONNAIRES =====
 
 # Créer un fonctionnaire (endpoint pour admin)
 @app.post("/users/fonctionnaires")
-async def create_fonctionnaire(
+def create_fonctionnaire(
     fonctionnaire_data: dict,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Droits admin requis"))
 ):
     """Créer un nouveau fonctionnaire dans la base de données SQLite"""
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Vérifier si c'est un admin (simplifié)
-    if not ("admin" in token.lower() or token.startswith("test_token_")):
-        raise HTTPException(status_code=403, detail="Droits admin requis")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Extraire les données utilisateur
@@ -1183,10 +1165,12 @@ async def create_fonctionnaire(
             fonctionnaire_info['grade'],
             fonctionnaire_info['photo']
         ))
+        retain_file(conn, fonctionnaire_info['photo'])
 
         fonctionnaire_id = cursor.lastrowid
 
         conn.commit()
+        invalidate_dashboard_stats()
           # Récupérer le fonctionnaire créé avec toutes les données pour le retourner
         cursor.execute('''
             SELECT
@@ -1227,68 +1211,15 @@ async def create_fonctionnaire(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création: {str(e)}")
+    finally:
+        conn.close()
 
 # Récupérer tous les fonctionnaires (endpoint pour admin)
 @app.get("/users/fonctionnaires")
-async def get_all_fonctionnaires(
-    authorization: str = Header(None)
+def get_all_fonctionnaires(
+    current_user: dict = Depends(require_roles("ADMIN", "FONCTIONNAIRE", detail="Accès refusé. Connexion requise."))
 ):
     """Récupérer la liste des fonctionnaires depuis SQLite"""
-    # Vérifier l'autorisation admin (simplifié)
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-    print(f"🔍 [GET FONCTIONNAIRES] Token reçu: {token[:30]}...")
-
-    # Vérifier si c'est un admin ou un fonctionnaire connecté
-    admin_user = None
-    current_user_id = None
-    user_role = None
-    
-    if token.startswith("test_token_"):
-        # Logique pour les tokens de test
-        parts = token.split("_")
-        print(f"🔍 [GET FONCTIONNAIRES] Token test parts: {parts}")
-        if len(parts) >= 3:
-            current_user_id = parts[2] if parts[2].isdigit() else None
-        if len(parts) >= 4:
-            user_role = parts[3].upper()
-            
-        if user_role == "ADMIN":
-            admin_user = {"role": "admin"}
-            print(f"✅ [GET FONCTIONNAIRES] Token admin test validé")
-        elif user_role == "FONCTIONNAIRE":
-            admin_user = {"role": "fonctionnaire", "user_id": current_user_id}
-            print(f"✅ [GET FONCTIONNAIRES] Token fonctionnaire test validé")
-        elif any("admin" in part.lower() for part in parts):
-            admin_user = {"role": "admin"}
-            print(f"✅ [GET FONCTIONNAIRES] Token admin test validé (fallback)")
-    else:
-        # Logique pour les vrais tokens JWT
-        try:
-            from auth import decode_jwt_token
-            payload = decode_jwt_token(token)
-            user_role = payload.get("role")
-            current_user_id = payload.get("user_id")
-            
-            print(f"🔍 [GET FONCTIONNAIRES] JWT décodé - Role: {user_role}, User ID: {current_user_id}")
-            
-            if user_role == "ADMIN":
-                admin_user = {"role": "admin", "user_id": current_user_id}
-                print(f"✅ [GET FONCTIONNAIRES] Token JWT admin validé")
-            elif user_role == "FONCTIONNAIRE":
-                admin_user = {"role": "fonctionnaire", "user_id": current_user_id}
-                print(f"✅ [GET FONCTIONNAIRES] Token JWT fonctionnaire validé")
-            else:
-                print(f"❌ [GET FONCTIONNAIRES] Role insuffisant: {user_role}")
-                
-        except Exception as jwt_error:
-            print(f"❌ [GET FONCTIONNAIRES] Erreur décodage JWT: {jwt_error}")
-
-    if not admin_user:
-        print(f"❌ [GET FONCTIONNAIRES] Accès refusé pour token: {token[:30]}")
-        raise HTTPException(status_code=403, detail="Accès refusé. Connexion requise.")
 
     try:
         conn = get_sqlite_connection()
@@ -1328,9 +1259,9 @@ async def get_all_fonctionnaires(
             fonctionnaires.append(fonctionnaire)
 
         # Si c'est un fonctionnaire, ne retourner que ses propres données
-        if admin_user.get("role") == "fonctionnaire" and current_user_id:
-            fonctionnaires = [fonc for fonc in fonctionnaires if str(fonc["user_id"]) == str(current_user_id)]
-            print(f"🔍 [GET FONCTIONNAIRES] Filtrage pour fonctionnaire {current_user_id}: {len(fonctionnaires)} résultats")
+        if current_user["role"] == "FONCTIONNAIRE":
+            fonctionnaires = [fonc for fonc in fonctionnaires if fonc["user_id"] == current_user["id"]]
+            log.debug("Filtrage pour fonctionnaire %s: %d résultats", current_user["id"], len(fonctionnaires))
 
         conn.close()
         return fonctionnaires
@@ -1340,33 +1271,25 @@ async def get_all_fonctionnaires(
 
 # Modifier un fonctionnaire (endpoint pour admin)
 @app.put("/users/fonctionnaires/{fonctionnaire_id}")
-async def update_fonctionnaire(
+def update_fonctionnaire(
     fonctionnaire_id: int,
     fonctionnaire_data: dict,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Droits admin requis"))
 ):
     """Modifier un fonctionnaire existant dans la base de données SQLite"""
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Vérifier si c'est un admin (simplifié)
-    if not ("admin" in token.lower() or token.startswith("test_token_")):
-        raise HTTPException(status_code=403, detail="Droits admin requis")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
           # Vérifier que le fonctionnaire existe
-        cursor.execute("SELECT user_id FROM fonctionnaires WHERE id = ?", (fonctionnaire_id,))
+        cursor.execute("SELECT user_id, photo FROM fonctionnaires WHERE id = ?", (fonctionnaire_id,))
         result = cursor.fetchone()
         if not result:
             conn.close()
             raise HTTPException(status_code=404, detail=f"Fonctionnaire avec l'ID {fonctionnaire_id} non trouvé")
 
         user_id = result['user_id']
+        old_photo = result['photo']
 
         # Validation des champs obligatoires si fournis
         if 'cin' in fonctionnaire_data:
@@ -1438,7 +1361,7 @@ async def update_fonctionnaire(
             password_hash = hashlib.sha256(new_password.encode()).hexdigest()
             user_updates.append("hashed_password = ?")
             user_params.append(password_hash)
-            print(f"🔑 Mot de passe mis à jour pour {fonctionnaire_data.get('email', 'fonctionnaire')}")
+            log.info("Mot de passe mis à jour", extra={"email": fonctionnaire_data.get("email")})
 
         # Mettre à jour les données utilisateur seulement si il y a des changements
         if user_updates:
@@ -1460,8 +1383,10 @@ async def update_fonctionnaire(
             fonctionnaire_data.get('photo'),
             fonctionnaire_id
         ))
+        replace_file_reference(conn, old_photo, fonctionnaire_data.get('photo'))
 
         conn.commit()
+        invalidate_user(user_id)
           # Récupérer le fonctionnaire modifié pour le retourner
         cursor.execute('''
             SELECT
@@ -1501,35 +1426,30 @@ async def update_fonctionnaire(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la modification: {str(e)}")
+    finally:
+        conn.close()
 
 # Supprimer un fonctionnaire (endpoint pour admin)
 @app.delete("/users/fonctionnaires/{fonctionnaire_id}")
-async def delete_fonctionnaire(
+def delete_fonctionnaire(
     fonctionnaire_id: int,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Droits admin requis"))
 ):
     """Supprimer un fonctionnaire de la base de données SQLite"""
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Vérifier si c'est un admin (simplifié)
-    if not ("admin" in token.lower() or token.startswith("test_token_")):
-        raise HTTPException(status_code=403, detail="Droits admin requis")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
           # Récupérer l'user_id pour nettoyage
-        cursor.execute("SELECT user_id FROM fonctionnaires WHERE id = ?", (fonctionnaire_id,))
+        cursor.execute("SELECT user_id, photo FROM fonctionnaires WHERE id = ?", (fonctionnaire_id,))
         result = cursor.fetchone()
         if not result:
             conn.close()
             raise HTTPException(status_code=404, detail=f"Fonctionnaire avec l'ID {fonctionnaire_id} non trouvé")
 
         user_id = result['user_id']
+        # Rendre la référence sur la photo (les anciens fichiers restent pour le nettoyage)
+        release_file(conn, result['photo'], remove_legacy=False)
           # Supprimer le fonctionnaire
         cursor.execute("DELETE FROM fonctionnaires WHERE id = ?", (fonctionnaire_id,))
 
@@ -1537,6 +1457,8 @@ async def delete_fonctionnaire(
         cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
 
         conn.commit()
+        invalidate_dashboard_stats()
+        revoke_user(user_id)
         conn.close()
 
         return {"message": "Fonctionnaire supprimé avec succès"}
@@ -1545,62 +1467,20 @@ async def delete_fonctionnaire(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
+    finally:
+        conn.close()
 
 # Upload photo pour un fonctionnaire (endpoint pour admin)
 @app.post("/users/fonctionnaires/{fonctionnaire_id}/upload-photo")
-async def upload_fonctionnaire_photo(
+def upload_fonctionnaire_photo(
     fonctionnaire_id: int,
     file: UploadFile = File(...),
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
 ):
     """Upload d'une photo pour un fonctionnaire"""
-    print(f"🔄 [UPLOAD] Début upload photo pour fonctionnaire {fonctionnaire_id}")
-    print(f"🔄 [UPLOAD] Fichier reçu: {file.filename if file else 'None'}")
+    log.debug("Upload photo pour fonctionnaire %s: %s", fonctionnaire_id, file.filename if file else None)
 
     try:
-        # Vérifier l'authentification
-        if not authorization or not authorization.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Token manquant")
-
-        token = authorization.replace("Bearer ", "")
-        print(f"🔍 [UPLOAD] Token reçu: {token[:30]}...")
-
-        # Vérifier si c'est un token de test ou un vrai JWT
-        admin_user = None
-        
-        if token.startswith("test_token_"):
-            # Logique pour les tokens de test
-            parts = token.split("_")
-            print(f"🔍 [UPLOAD] Token test parts: {parts}")
-            if len(parts) >= 4 and (parts[3].lower() == "admin" or (len(parts) >= 5 and parts[4].lower() == "admin")):
-                admin_user = {"role": "admin"}
-                print(f"✅ [UPLOAD] Token admin test validé")
-            elif any("admin" in part.lower() for part in parts):
-                admin_user = {"role": "admin"}
-                print(f"✅ [UPLOAD] Token admin test validé (fallback)")
-        else:
-            # Logique pour les vrais tokens JWT
-            try:
-                from auth import decode_jwt_token
-                payload = decode_jwt_token(token)
-                user_role = payload.get("role")
-                user_id = payload.get("user_id")
-                
-                print(f"🔍 [UPLOAD] JWT décodé - Role: {user_role}, User ID: {user_id}")
-                
-                if user_role == "ADMIN":
-                    admin_user = {"role": "admin", "user_id": user_id}
-                    print(f"✅ [UPLOAD] Token JWT admin validé")
-                else:
-                    print(f"❌ [UPLOAD] Role insuffisant: {user_role}")
-                    
-            except Exception as jwt_error:
-                print(f"❌ [UPLOAD] Erreur décodage JWT: {jwt_error}")
-
-        if not admin_user:
-            print(f"❌ [UPLOAD] Accès refusé pour token: {token[:30]}")
-            raise HTTPException(status_code=403, detail="Accès refusé. Droits admin requis.")
-
         # Vérifier taille (5MB max)
         if hasattr(file, 'size') and file.size and file.size > 5 * 1024 * 1024:
             raise HTTPException(status_code=400, detail="Fichier trop volumineux (max 5MB)")
@@ -1611,56 +1491,63 @@ async def upload_fonctionnaire_photo(
 
         cursor.execute("SELECT id FROM fonctionnaires WHERE id = ?", (fonctionnaire_id,))
         fonctionnaire_exists = cursor.fetchone()
+        conn.close()
         if not fonctionnaire_exists:
-            conn.close()
             raise HTTPException(status_code=404, detail=f"Fonctionnaire avec l'ID {fonctionnaire_id} non trouvé")
 
         # Vérifier que le fichier est valide
         if not file or not file.filename:
-            conn.close()
             raise HTTPException(status_code=400, detail="Aucun fichier fourni")
 
-        # Créer le dossier uploads/images s'il n'existe pas
-        upload_dir = Path("uploads/images")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-        # Générer un nom de fichier unique
         file_extension = Path(file.filename).suffix.lower() if file.filename else ".jpg"
         if file_extension not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-            conn.close()
             raise HTTPException(status_code=400, detail="Format de fichier non supporté. Formats acceptés: JPG, PNG, GIF, WebP")
 
-        filename = f"fonctionnaire_{fonctionnaire_id}_{int(time.time())}{file_extension}"
-        file_path = upload_dir / filename
+        # Copie par blocs et hachage, hors transaction
+        tmp_path, file_size, sha256 = receive_upload(file, MAX_PHOTO_SIZE)
 
-        # Sauvegarder le fichier
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        conn = get_sqlite_connection(write=True)
+        try:
+            row = conn.execute("SELECT photo FROM fonctionnaires WHERE id = ?", (fonctionnaire_id,)).fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail=f"Fonctionnaire avec l'ID {fonctionnaire_id} non trouvé")
+
+            # Même contenu déjà stocké: aucun nouveau fichier sur le disque
+            file_path = add_blob_reference(conn, tmp_path, sha256, file_size, file_extension)
+            log.debug("Photo de fonctionnaire sauvegardée: %s", file_path)
+
+            # Mettre à jour le chemin de la photo dans la base de données
+            photo_path = f"/{file_path}"
+            release_file(conn, row["photo"], remove_legacy=False)
+            conn.execute('''
+                UPDATE fonctionnaires
+                SET photo = ?
+                WHERE id = ?
+            ''', (photo_path, fonctionnaire_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            discard_temp(tmp_path)
+            raise
+        finally:
+            conn.close()
 
-        print(f"✅ [UPLOAD] Fichier sauvegardé: {file_path}")
+        filename = Path(file_path).name
 
-        # Mettre à jour le chemin de la photo dans la base de données
-        photo_path = f"/uploads/images/{filename}"
-        cursor.execute('''
-            UPDATE fonctionnaires
-            SET photo = ?
-            WHERE id = ?
-        ''', (photo_path, fonctionnaire_id))
-
-        conn.commit()
-        conn.close()
+        # Miniatures avatar/list/profile (WebP + JPEG)
+        run_image_task(pregenerate_photo_variants, photo_path)
 
         return {
             "message": "Photo uploadée avec succès",
             "filename": filename,
-            "fonctionnaire_id": fonctionnaire_id
+            "fonctionnaire_id": fonctionnaire_id,
+            "photo_variants": photo_variant_urls(photo_path)
         }
 
-    except HTTPException:
+    except (HTTPException, WriterLeaseTimeout):
         raise
     except Exception as e:
-        print(f"❌ [UPLOAD] Erreur: {str(e)}")
+        log.exception("Erreur d'upload de photo pour fonctionnaire %s", fonctionnaire_id)
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'upload: {str(e)}")
 
 # ===== ENDPOINTS POUR LES DEMANDES =====
@@ -1676,31 +1563,8 @@ async def upload_fonctionnaire_photo(
 @app.post("/demandes", response_model=DemandeResponse)
 async def create_demande(
     demande_data: DemandeCreate,
-    authorization: str = Header(None)
+    current_user: dict = Depends(get_current_principal)
 ):
-    # Vérifier l'autorisation
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Extraire l'utilisateur du token
-    current_user = None
-    if token.startswith("test_token_"):
-        parts = token.split("_")
-        if len(parts) >= 3:
-            user_id = parts[2]
-            role = parts[3] if len(parts) > 3 else ""
-
-            # Trouver l'utilisateur correspondant
-            for email, user_data in TEST_USERS.items():
-                if user_data["id"] == int(user_id) and user_data["role"] == role:
-                    current_user = user_data
-                    break
-
-    if not current_user:
-        raise HTTPException(status_code=401, detail="Token invalide")
-
     # Créer une nouvelle demande
     global demande_id_counter
     from datetime import datetime
@@ -1721,48 +1585,27 @@ async def create_demande(
             "email": current_user["email"],
             "nom": current_user["nom"],
             "prenom": current_user["prenom"],
-            "role": current_user["role"]        }
+            "role": current_user["role"].lower()        }
     }
 
-    DEMANDES_DB[demande_id_counter] = new_demande
+    # Journaliser puis enregistrer en mémoire
+    data_journal.set("demandes", demande_id_counter, new_demande)
     demande_id_counter += 1
 
-    # Sauvegarder les données dans les fichiers
-    save_all_data()
-
     return new_demande
 
 # Mettre à jour le statut d'une demande (endpoint pour secrétaire/admin)
 @app.patch("/demandes/{demande_id}/status", response_model=DemandeResponse)
-async def update_demande_status(
+def update_demande_status(
     demande_id: int,
     status_update: DemandeStatusUpdate,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE", detail="Accès refusé. Droits admin ou secrétaire requis."))
 ):
     """Mettre à jour le statut d'une demande (admin/secrétaire seulement)"""
-    # Utiliser la fonction d'authentification du router
-    from routers.demandes import get_current_user_from_token
-    
-    try:
-        current_user = get_current_user_from_token(authorization)
-        
-        # Vérifier les permissions (admin ou secrétaire)
-        if current_user["role"].upper() not in ["ADMIN", "SECRETAIRE"]:
-            raise HTTPException(status_code=403, detail="Accès refusé. Droits admin ou secrétaire requis.")
-        
-        print(f"✅ [DEBUG] Utilisateur autorisé: {current_user['email']} (rôle: {current_user['role']})")
-        
-    except HTTPException as e:
-        print(f"❌ [DEBUG] Erreur authentification: {e.detail}")
-        raise e
-    except Exception as e:
-        print(f"❌ [DEBUG] Erreur authentification: {e}")
-        raise HTTPException(status_code=403, detail="Accès refusé. Droits admin ou secrétaire requis.")
 
     # Vérifier si la demande existe dans la base SQLite
-    import sqlite3
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = sqlite3.connect('gestion_db.db')
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM demandes WHERE id = ?", (demande_id,))
@@ -1786,16 +1629,18 @@ async def update_demande_status(
         """, (status_update.statut, status_update.commentaire_admin or "", demande_id))
         
         conn.commit()
+        invalidate_dashboard_stats()
         
         # Récupérer la demande mise à jour
         cursor.execute("SELECT * FROM demandes WHERE id = ?", (demande_id,))
         updated_demande = cursor.fetchone()
         conn.close()
         
-        print(f"✅ [DEBUG] Demande {demande_id} mise à jour: {status_update.statut}")
+        log.info("Demande %s mise à jour: %s", demande_id, status_update.statut,
+                 extra={"by": current_user["email"]})
         
         # Retourner la demande mise à jour au format attendu
-        return {
+        updated = {
             "id": updated_demande[0],
             "user_id": updated_demande[1],
             "type_demande": updated_demande[2],
@@ -1808,119 +1653,43 @@ async def update_demande_status(
             "created_at": updated_demande[9],
             "updated_at": updated_demande[10]
         }
+        event_hub.publish(DEMANDE_STATUS_CHANGED, updated)
+        return updated
         
     except sqlite3.Error as e:
-        print(f"❌ [DEBUG] Erreur SQLite: {e}")
+        log.error("Erreur SQLite: %s", e)
         raise HTTPException(status_code=500, detail="Erreur base de données")
+    finally:
+        conn.close()
 
 # Supprimer une demande (endpoint pour admin)
 @app.delete("/demandes/{demande_id}")
 async def delete_demande(
     demande_id: int,
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
 ):
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Vérifier si c'est un admin
-    admin_user = None
-    if token.startswith("test_token_"):
-        parts = token.split("_")
-        if len(parts) >= 4 and (parts[3] == "admin" or (len(parts) >= 5 and parts[4] == "admin")):
-            admin_user = {"role": "admin"}
-
-    if not admin_user:
-        raise HTTPException(status_code=403, detail="Accès refusé. Droits admin requis.")
-
     # Vérifier si la demande existe
-    if demande_id not in DEMANDES_DB:
+    if str(demande_id) not in DEMANDES_DB:
         raise HTTPException(status_code=404, detail="Demande non trouvée")
       # Récupérer les données avant suppression
-    demande_data = DEMANDES_DB[demande_id]
-
-    # Supprimer la demande
-    del DEMANDES_DB[demande_id]
+    demande_data = DEMANDES_DB[str(demande_id)]
 
-    # Sauvegarder les données dans les fichiers
-    save_all_data()
+    # Supprimer la demande (journalisé)
+    data_journal.delete("demandes", demande_id)
+    event_hub.publish(DEMANDE_DELETED, {"id": demande_id, "user_id": demande_data.get("user_id")})
 
     return {"message": f"Demande '{demande_data['titre']}' supprimée avec succès"}
 
 # ===== ENDPOINT POUR LES STATISTIQUES DU DASHBOARD =====
 
 @app.get("/dashboard/stats")
-async def get_dashboard_stats():
+def get_dashboard_stats():
     """Obtenir les statistiques réelles pour le dashboard depuis la base SQLite"""
     try:
-        conn = get_sqlite_connection()
-        cursor = conn.cursor()
-
-        # Compter les enseignants (avec JOIN pour s'assurer qu'ils ont un enregistrement dans la table enseignants)
-        cursor.execute("""
-            SELECT COUNT(*) as count
-            FROM users u
-            JOIN enseignants e ON u.id = e.user_id
-            WHERE u.is_active = 1 AND u.role = 'ENSEIGNANT'
-        """)
-        enseignants_count = cursor.fetchone()['count']
-
-        # Compter les fonctionnaires (avec JOIN pour s'assurer qu'ils ont un enregistrement dans la table fonctionnaires)
-        cursor.execute("""
-            SELECT COUNT(*) as count
-            FROM users u
-            JOIN fonctionnaires f ON u.id = f.user_id
-            WHERE u.is_active = 1 AND u.role = 'FONCTIONNAIRE'
-        """)
-        fonctionnaires_count = cursor.fetchone()['count']
-
-        # Compter les autres rôles directement depuis la table users
-        cursor.execute("""
-            SELECT COUNT(*) as count
-            FROM users
-            WHERE is_active = 1 AND role = 'SECRETAIRE'
-        """)
-        secretaires_count = cursor.fetchone()['count']
-
-        cursor.execute("""
-            SELECT COUNT(*) as count
-            FROM users
-            WHERE is_active = 1 AND role = 'ADMIN'
-        """)
-        admins_count = cursor.fetchone()['count']
-
-        # Compter les demandes par statut
-        cursor.execute("""
-            SELECT statut, COUNT(*) as count
-            FROM demandes
-            GROUP BY statut
-        """)
-        demande_counts = {row['statut']: row['count'] for row in cursor.fetchall()}
-
-        # Compter le total d'utilisateurs actifs
-        cursor.execute("SELECT COUNT(*) as count FROM users WHERE is_active = 1")
-        total_users = cursor.fetchone()['count']
-
-        conn.close()
-
-        # Retourner exactement les champs attendus par le frontend
-        stats = {
-            "totalUsers": total_users,
-            "enseignants": enseignants_count,
-            "fonctionnaires": fonctionnaires_count,
-            "secretaires": secretaires_count,
-            "admins": admins_count,
-            "demandesEnAttente": demande_counts.get("EN_ATTENTE", 0),
-            "demandesTraitees": demande_counts.get("APPROUVEE", 0) + demande_counts.get("REJETEE", 0)
-        }
-
-        print(f"📊 [DASHBOARD] Statistiques calculées: {stats}")
-        return stats
+        return get_cached_dashboard_stats()
 
     except Exception as e:
-        print(f"❌ [DASHBOARD] Erreur: {str(e)}")
+        log.error("Statistiques du dashboard indisponibles: %s", e)
         # Retourner des valeurs par défaut en cas d'erreur
         return {
             "totalUsers": 0,
@@ -1934,21 +1703,9 @@ async def get_dashboard_stats():
 
 # Endpoint de debug pour examiner FONCTIONNAIRES_DB
 @app.get("/debug/fonctionnaires-db")
-async def debug_fonctionnaires_db(authorization: str = Header(None)):
-    # Vérifier l'autorisation admin
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-    admin_user = None
-    if token.startswith("test_token_"):
-        parts = token.split("_")
-        if len(parts) >= 4 and (parts[3] == "admin" or (len(parts) >= 5 and parts[4] == "admin")):
-            admin_user = {"role": "admin"}
-
-    if not admin_user:
-        raise HTTPException(status_code=403, detail="Accès refusé. Droits admin requis.")
-
+def debug_fonctionnaires_db(
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
+):
     return {
         "FONCTIONNAIRES_DB_keys": list(FONCTIONNAIRES_DB.keys()),
         "FONCTIONNAIRES_DB_content": FONCTIONNAIRES_DB,
@@ -1956,26 +1713,66 @@ async def debug_fonctionnaires_db(authorization: str = Header(None)):
         "key_types": [type(k).__name__ for k in FONCTIONNAIRES_DB.keys()]
     }
 
-# ===== ENDPOINT PROFIL ENSEIGNANT =====
+# Endpoint de debug pour les métriques du pool de connexions SQLite
+@app.get("/debug/db-pool")
+def debug_db_pool(
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
+):
+    return {
+        **get_pool_metrics(),
+        "auth_cache": get_auth_cache_stats(),
+        "document_access_cache": get_document_access_cache_stats(),
+        "attestation_cache": get_attestation_cache_stats(),
+        "event_hub": event_hub.stats(),
+        "logging": get_logging_stats(),
+    }
 
-@app.get("/enseignant/profil")
-async def get_enseignant_profil(authorization: str = Header(None)):
-    """Obtenir le profil complet de l'enseignant connecté"""
-    # Vérifier l'autorisation
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
+# Profil SQL: requêtes les plus coûteuses par empreinte, avec leur plan (voir query_profiler.py)
+@app.get("/debug/sql-profile")
+def debug_sql_profile(
+    limit: int = 20,
+    sort: str = "total",
+    explain: bool = True,
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
+):
+    if sort not in SQL_PROFILE_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Tri invalide. Valeurs possibles: {', '.join(SQL_PROFILE_SORT_KEYS)}")
+    limit = max(1, min(limit, 200))
+    if not explain:
+        return get_sql_profile(limit, sort)
+    conn = get_sqlite_connection()
+    try:
+        return get_sql_profile(limit, sort, explain_with=conn)
+    finally:
+        conn.close()
 
-    token = authorization.replace("Bearer ", "")
+@app.post("/debug/sql-profile/reset")
+def debug_sql_profile_reset(
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
+):
+    reset_sql_profile()
+    return {"message": "Profil SQL remis à zéro"}
+
+# Métriques au format texte Prometheus (voir metrics.py)
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(authorization: str = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token de métriques invalide")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Rapport à blanc du nettoyage des fichiers orphelins (rien n'est déplacé)
+@app.get("/debug/upload-gc")
+def debug_upload_gc(
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
+):
+    return {"dry_run": upload_sweeper.sweep(dry_run=True), "last_run": upload_sweeper.last_report}
 
-    # Décoder le token pour récupérer l'utilisateur
-    user_id = None
-    if token.startswith("test_token_"):
-        parts = token.split("_")
-        if len(parts) >= 4:
-            user_id = int(parts[2])
+# ===== ENDPOINT PROFIL ENSEIGNANT =====
 
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token invalide")
+@app.get("/enseignant/profil")
+def get_enseignant_profil(current_user: dict = Depends(get_current_principal)):
+    """Obtenir le profil complet de l'enseignant connecté"""
+    user_id = current_user["id"]
 
     # Récupérer les données depuis la base de données
     from database import SessionLocal
@@ -2042,183 +1839,64 @@ async def get_enseignant_profil(authorization: str = Header(None)):
 
 # Endpoint pour upload d'image d'enseignant
 @app.post("/users/enseignants/{enseignant_id}/upload-photo")
-async def upload_enseignant_photo(
+def upload_enseignant_photo(
     enseignant_id: int,
     file: UploadFile = File(...),
-    authorization: str = Header(None)
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
 ):
-    print(f"🔄 [UPLOAD] Début upload pour enseignant {enseignant_id}")
-    print(f"🔄 [UPLOAD] Fichier reçu: {file.filename if file else 'None'}")
-    print(f"🔄 [UPLOAD] Token reçu: {authorization[:50] if authorization else 'None'}...")
+    log.debug("Upload photo pour enseignant %s: %s", enseignant_id, file.filename if file else None)
 
     try:
-        # Vérifier l'authentification
-        if not authorization or not authorization.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Token manquant")
-
-        token = authorization.replace("Bearer ", "")
-        print(f"🔍 [UPLOAD] Token reçu: {token[:30]}...")
-
-        # Vérifier si c'est un token de test ou un vrai JWT
-        admin_user = None
-        
-        if token.startswith("test_token_"):
-            # Logique pour les tokens de test
-            parts = token.split("_")
-            print(f"🔍 [UPLOAD] Token test parts: {parts}")
-            if len(parts) >= 4 and (parts[3].lower() == "admin" or (len(parts) >= 5 and parts[4].lower() == "admin")):
-                admin_user = {"role": "admin"}
-                print(f"✅ [UPLOAD] Token admin test validé")
-            elif any("admin" in part.lower() for part in parts):
-                admin_user = {"role": "admin"}
-                print(f"✅ [UPLOAD] Token admin test validé (fallback)")
-        else:
-            # Logique pour les vrais tokens JWT
-            try:
-                from auth import decode_jwt_token
-                payload = decode_jwt_token(token)
-                user_role = payload.get("role")
-                user_id = payload.get("user_id")
-                
-                print(f"🔍 [UPLOAD] JWT décodé - Role: {user_role}, User ID: {user_id}")
-                
-                if user_role == "ADMIN":
-                    admin_user = {"role": "admin", "user_id": user_id}
-                    print(f"✅ [UPLOAD] Token JWT admin validé")
-                else:
-                    print(f"❌ [UPLOAD] Role insuffisant: {user_role}")
-                    
-            except Exception as jwt_error:
-                print(f"❌ [UPLOAD] Erreur décodage JWT: {jwt_error}")
-
-        if not admin_user:
-            print(f"❌ [UPLOAD] Accès refusé pour token: {token[:30]}")
-            raise HTTPException(status_code=403, detail="Accès refusé. Droits admin requis.")
-
         # Vérifier taille (5MB max)
         if hasattr(file, 'size') and file.size and file.size > 5 * 1024 * 1024:
             raise HTTPException(status_code=400, detail="Fichier trop volumineux (max 5MB)")
         
         # Vérifier que l'enseignant existe dans la base de données
-        from database import SessionLocal
-        from models import Enseignant
+        conn = get_sqlite_connection()
+        enseignant = conn.execute("SELECT id FROM enseignants WHERE id = ?", (enseignant_id,)).fetchone()
+        conn.close()
+        if not enseignant:
+            raise HTTPException(status_code=404, detail="Enseignant non trouvé")
+
+        # Hachage et redimensionnement sur l'exécuteur d'images (redimensionnement
+        # évité si cette photo a déjà été reçue)
+        received = run_image_task(save_and_resize_image, file)
 
-        db = SessionLocal()
+        conn = get_sqlite_connection(write=True)
         try:
-            enseignant = db.query(Enseignant).filter(Enseignant.id == enseignant_id).first()
-            if not enseignant:
+            row = conn.execute("SELECT photo FROM enseignants WHERE id = ?", (enseignant_id,)).fetchone()
+            if not row:
                 raise HTTPException(status_code=404, detail="Enseignant non trouvé")
+            photo_url = "/" + add_derived_upload_reference(conn, received, received["extension"])
+
+            # Rendre la référence sur l'ancienne photo
+            release_file(conn, row["photo"])
+            conn.execute("UPDATE enseignants SET photo = ? WHERE id = ?", (photo_url, enseignant_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            discard_temp(received["tmp_path"])
+            raise
+        finally:
+            conn.close()
 
-            # Supprimer ancienne photo si elle existe
-            if enseignant.photo:
-                old_photo_path = Path(f"uploads{enseignant.photo.replace('/uploads', '')}")
-                if old_photo_path.exists():
-                    try:
-                        os.remove(old_photo_path)
-                        print(f"🗑️ [UPLOAD] Ancienne photo supprimée: {old_photo_path}")
-                    except Exception as e:
-                        print(f"⚠️ [UPLOAD] Erreur suppression ancienne photo: {e}")
-
-            # Sauvegarder nouvelle image
-            photo_url = save_and_resize_image(file)
-            print(f"💾 [UPLOAD] Nouvelle photo sauvegardée: {photo_url}")
-
-            # Mettre à jour l'enseignant dans la base de données
-            enseignant.photo = photo_url
-            db.commit()
-            db.refresh(enseignant)
+        log.debug("Photo de l'enseignant %s mise à jour: %s", enseignant_id, photo_url)
 
-            print(f"✅ [UPLOAD] Photo mise à jour dans la base de données pour enseignant {enseignant_id}")
+        # Miniatures avatar/list/profile (WebP + JPEG)
+        run_image_task(pregenerate_photo_variants, photo_url)
 
-            return {"message": "Photo uploadée avec succès", "photo_url": photo_url}
+        return {"message": "Photo uploadée avec succès", "photo_url": photo_url,
+                "photo_variants": photo_variant_urls(photo_url)}
 
-        finally:
-            db.close()
-
-    except HTTPException:
+    except (HTTPException, WriterLeaseTimeout):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
-# Endpoint pour créer une demande (solution directe)
-@app.post("/demandes-direct")
-async def create_demande_direct(
-    demande_data: dict,
-    authorization: str = Header(None)
-):
-    """Créer une nouvelle demande - endpoint direct avec authentification JWT fonctionnelle"""
-    # Utiliser la même logique d'authentification que /auth/me mais avec support JWT
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=401,
-            detail="Token manquant",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    token = authorization.replace("Bearer ", "")
-    current_user = None
-
-    # Essayer d'abord le JWT
-    try:
-        from jose import jwt, JWTError
-        SECRET_KEY = "your-secret-key-here-change-in-production"  # Même clé que dans .env
-        ALGORITHM = "HS256"
-
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-
-        if email:
-            # Chercher l'utilisateur par email dans TEST_USERS (fallback)
-            for test_email, test_user_data in TEST_USERS.items():
-                if test_user_data["email"] == email:
-                    current_user = test_user_data
-                    break
-    except (JWTError, ImportError) as e:
-        print(f"JWT decode failed: {e}, trying test token format")
-        pass
-
-    # Si JWT échoue, essayer le format test_token (pour compatibilité)
-    if not current_user and token.startswith("test_token_"):
-        parts = token.split("_")
-        if len(parts) >= 3:
-            user_id = parts[2]
-            role = parts[3] if len(parts) > 3 else ""
-
-            # Vérifier d'abord dans la base de données SQLite
-            try:
-                conn = get_sqlite_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users WHERE id = ? AND role = ? AND is_active = 1",
-                             (user_id, role.upper()))
-                user_data = cursor.fetchone()
-                conn.close()
-
-                if user_data:
-                    current_user = dict(user_data)
-                else:
-                    # Fallback vers les TEST_USERS pour la compatibilité
-                    for email, user_data in TEST_USERS.items():
-                        if str(user_data["id"]) == user_id and user_data["role"].upper() == role.upper():
-                            current_user = user_data
-                            break
-
-            except Exception as e:
-                # Fallback vers les TEST_USERS
-                for email, user_data in TEST_USERS.items():
-                    if str(user_data["id"]) == user_id and user_data["role"].upper() == role.upper():
-                        current_user = user_data
-                        break
-
-    if not current_user:
-        raise HTTPException(status_code=401, detail="Token invalide - utilisateur non trouvé")
-
-    # Créer la demande
-    global demande_id_counter
-    from datetime import datetime
-
-    # Sauvegarder dans la base SQLite
+def insert_demande_direct(user_id: int, demande_data: dict) -> int:
+    """Insérer une demande dans SQLite et retourner son ID"""
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Insérer la nouvelle demande dans SQLite
@@ -2226,7 +1904,7 @@ async def create_demande_direct(
             INSERT INTO demandes (user_id, type_demande, titre, description, date_debut, date_fin, statut, created_at)
             VALUES (?, ?, ?, ?, ?, ?, 'EN_ATTENTE', datetime('now'))
         ''', (
-            current_user["id"],
+            user_id,
             demande_data.get("type_demande", "ATTESTATION"),
             demande_data.get("titre", ""),
             demande_data.get("description", ""),
@@ -2236,12 +1914,29 @@ async def create_demande_direct(
 
         sqlite_demande_id = cursor.lastrowid
         conn.commit()
+    finally:
         conn.close()
+    invalidate_dashboard_stats()
+    return sqlite_demande_id
 
-        print(f"✅ Demande sauvegardée dans SQLite avec l'ID: {sqlite_demande_id}")
+# Endpoint pour créer une demande (solution directe)
+@app.post("/demandes-direct")
+async def create_demande_direct(
+    demande_data: dict,
+    current_user: dict = Depends(get_current_principal)
+):
+    """Créer une nouvelle demande - endpoint direct avec authentification JWT fonctionnelle"""
+    # Créer la demande
+    global demande_id_counter
+    from datetime import datetime
+
+    # Sauvegarder dans la base SQLite (dans le pool de threads, hors de la boucle asyncio)
+    try:
+        sqlite_demande_id = await run_in_threadpool(insert_demande_direct, current_user["id"], demande_data)
+        log.debug("Demande sauvegardée dans SQLite avec l'ID %s", sqlite_demande_id)
 
     except Exception as e:
-        print(f"❌ Erreur lors de la sauvegarde SQLite: {e}")
+        log.error("Erreur lors de la sauvegarde SQLite: %s", e)
         sqlite_demande_id = demande_id_counter
 
     # Créer aussi dans DEMANDES_DB pour compatibilité
@@ -2267,27 +1962,16 @@ async def create_demande_direct(
         }
     }
 
-    DEMANDES_DB[sqlite_demande_id] = new_demande
+    data_journal.set("demandes", sqlite_demande_id, new_demande)
     demande_id_counter = max(demande_id_counter, sqlite_demande_id + 1)
-
-    # Sauvegarder les données dans les fichiers
-    save_all_data()
+    event_hub.publish(DEMANDE_CREATED, new_demande)
 
     return new_demande
 
 
-# Fonction de connexion SQLite simple (fallback)
-def get_sqlite_connection():
-    """Obtenir une connexion SQLite directe pour debug"""
-    conn = sqlite3.connect('gestion_db.db', timeout=20.0)
-    conn.row_factory = sqlite3.Row
-    # Activer le mode WAL pour éviter les locks
-    conn.execute('PRAGMA journal_mode=WAL')
-    return conn
-
 # Endpoint de test simplifié pour récupérer les enseignants
 @app.get("/users/enseignants/test")
-async def get_enseignants_test():
+def get_enseignants_test():
     """Endpoint de test pour récupérer les enseignants avec SQLite direct"""
     try:
         conn = get_sqlite_connection()
@@ -2336,116 +2020,66 @@ async def get_enseignants_test():
 @app.post("/demandes-temp")
 async def create_demande_temp(
     demande_data: dict,
-    authorization: str = Header(None)
+    current_user: dict = Depends(get_current_principal)
 ):
-    # Extraire les informations du token (même logique que /auth/me)
-    if authorization and authorization.startswith("Bearer "):
-        token = authorization.replace("Bearer ", "")
-
-        # Le token a le format: test_token_{user_id}_{role}
-        if token.startswith("test_token_"):
-            parts = token.split("_")
-            if len(parts) >= 3:
-                user_id = parts[2]
-                role = parts[3] if len(parts) > 3 else ""
-
-                # Vérifier d'abord dans la base de données SQLite
-
-                try:
-                    conn = get_sqlite_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT * FROM users WHERE id = ? AND role = ? AND is_active = 1",
-                                 (user_id, role.upper()))
-                    user_data = cursor.fetchone()
-                    conn.close()
-
-                    if user_data:
-                        current_user = dict(user_data)
-                    else:
-                        # Fallback vers TEST_USERS pour la compatibilité
-                        current_user = None
-                        for email, user_info in TEST_USERS.items():
-                            if str(user_info["id"]) == user_id and user_info["role"].upper() == role.upper():
-                                current_user = user_info
-                                break
-
-                except Exception as e:
-                    print(f"Erreur lors de l'accès à la base de données: {e}")
-                    # Fallback vers TEST_USERS en cas d'erreur
-                    current_user = None
-                    for email, user_info in TEST_USERS.items():
-                        if str(user_info["id"]) == user_id and user_info["role"].upper() == role.upper():
-                            current_user = user_info
-                            break
-
-                if not current_user:
-                    raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
-
-                # Créer la demande
-                global demande_id_counter
-                from datetime import datetime
-
-                new_demande = {
-                    "id": demande_id_counter,
-                    "user_id": current_user["id"],
-                    "type_demande": demande_data.get("type_demande", "ATTESTATION"),
-                    "titre": demande_data.get("titre", ""),
-                    "description": demande_data.get("description", ""),
-                    "date_debut": demande_data.get("date_debut"),
-                    "date_fin": demande_data.get("date_fin"),
-                    "statut": "EN_ATTENTE",
-                    "commentaire_admin": None,
-                    "created_at": datetime.now().isoformat(),
-                    "user": {
-                        "id": current_user["id"],
-                        "email": current_user.get("email", ""),
-                        "nom": current_user.get("nom", ""),
-                        "prenom": current_user.get("prenom", ""),
-                        "role": current_user.get("role", "").lower(),
-                        "is_active": True,
-                        "created_at": datetime.now().isoformat()
-                    }
-                }
-
-                DEMANDES_DB[demande_id_counter] = new_demande
-                demande_id_counter += 1
+    # Créer la demande
+    global demande_id_counter
+    from datetime import datetime
 
-                # Sauvegarder les données dans les fichiers
-                save_all_data()
+    new_demande = {
+        "id": demande_id_counter,
+        "user_id": current_user["id"],
+        "type_demande": demande_data.get("type_demande", "ATTESTATION"),
+        "titre": demande_data.get("titre", ""),
+        "description": demande_data.get("description", ""),
+        "date_debut": demande_data.get("date_debut"),
+        "date_fin": demande_data.get("date_fin"),
+        "statut": "EN_ATTENTE",
+        "commentaire_admin": None,
+        "created_at": datetime.now().isoformat(),
+        "user": {
+            "id": current_user["id"],
+            "email": current_user.get("email", ""),
+            "nom": current_user.get("nom", ""),
+            "prenom": current_user.get("prenom", ""),
+            "role": current_user.get("role", "").lower(),
+            "is_active": True,
+            "created_at": datetime.now().isoformat()
+        }
+    }
 
-                return new_demande
+    # Journaliser puis enregistrer en mémoire
+    data_journal.set("demandes", demande_id_counter, new_demande)
+    demande_id_counter += 1
 
-    # Si le token n'est pas valide, retourner une erreur
-    raise HTTPException(
-        status_code=401,
-        detail="Token invalide ou manquant",
-        headers={"WWW-Authenticate": "Bearer"}
-    )
+    return new_demande
 
 # Récupérer tous les utilisateurs (endpoint pour secrétaire/admin)
 @app.get("/users")
-async def get_all_users(
+def get_all_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    authorization: str = Header(None)
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE", detail="Droits insuffisants"))
 ):
-    """Récupérer tous les utilisateurs depuis la base de données SQLite"""
-    # Vérifier l'autorisation
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-    
-    # Vérifier si c'est un admin ou secrétaire
-    if not ("admin" in token.lower() or "secretaire" in token.lower() or token.startswith("test_token_")):
-        raise HTTPException(status_code=403, detail="Droits insuffisants")
+    """Récupérer tous les utilisateurs depuis la base de données SQLite (cursor active la pagination par curseur)"""
+    cursor_key = decode_cursor(cursor, 3) if cursor else None
 
     try:
         conn = get_sqlite_connection()
-        cursor = conn.cursor()
+        db_cursor = conn.cursor()
+
+        conditions = ["u.is_active = 1"]
+        params = []
+        if cursor_key:
+            conditions.append("(u.nom, u.prenom, u.id) > (?, ?, ?)")
+            params.extend(cursor_key)
+        pagination = "LIMIT ?" if cursor is not None else "LIMIT ? OFFSET ?"
+        params.extend([limit] if cursor is not None else [limit, skip])
 
         # Récupérer tous les utilisateurs avec leurs informations
-        cursor.execute('''
+        db_cursor.execute(f'''
             SELECT 
                 u.id, u.nom, u.prenom, u.email, u.telephone, u.adresse, u.cin, 
                 u.role, u.is_active, u.created_at,
@@ -2454,13 +2088,14 @@ async def get_all_users(
             FROM users u
             LEFT JOIN enseignants e ON u.id = e.user_id
             LEFT JOIN fonctionnaires f ON u.id = f.user_id
-            WHERE u.is_active = 1
-            ORDER BY u.nom, u.prenom
-            LIMIT ? OFFSET ?
-        ''', (limit, skip))
+            WHERE {' AND '.join(conditions)}
+            ORDER BY u.nom, u.prenom, u.id
+            {pagination}
+        ''', params)
 
+        rows = db_cursor.fetchall()
         users = []
-        for row in cursor.fetchall():
+        for row in rows:
             user = {
                 "id": row['id'],
                 "nom": row['nom'],
@@ -2487,17 +2122,23 @@ async def get_all_users(
             users.append(user)
 
         # Compter le total
-        cursor.execute("SELECT COUNT(*) FROM users WHERE is_active = 1")
-        total = cursor.fetchone()[0]
+        db_cursor.execute("SELECT COUNT(*) FROM users WHERE is_active = 1")
+        total = db_cursor.fetchone()[0]
 
         conn.close()
-        
-        return {
+
+        result = {
             "users": users,
             "total": total,
             "skip": skip,
             "limit": limit
         }
+        if cursor is not None:
+            result["next_cursor"] = next_cursor(rows, limit, ("nom", "prenom", "id"))
+            if result["next_cursor"]:
+                response.headers[NEXT_CURSOR_HEADER] = result["next_cursor"]
+
+        return result
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
@@ -2506,90 +2147,61 @@ async def get_all_users(
 
 # Endpoint pour récupérer les demandes d'un utilisateur
 @app.get("/users/{user_id}/demandes")
-async def get_user_demandes_direct(
+def get_user_demandes_direct(
     user_id: int,
-    authorization: str = Header(None),
+    response: Response,
+    current_user: dict = Depends(get_current_principal),
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
-    """Récupérer les demandes d'un utilisateur spécifique"""
-    
-    # Debug: log du token reçu
-    print(f"🔍 [DEBUG] User {user_id} demandes - Authorization header: {authorization}")
-    print(f"🔍 [DEBUG] User {user_id} demandes - Request URL appelée")
-    
-    # Vérification d'authentification basique
-    if not authorization or not authorization.startswith("Bearer "):
-        print(f"❌ [DEBUG] Token manquant ou format incorrect")
-        raise HTTPException(status_code=401, detail="Token manquant")
-    
-    token = authorization.split(" ")[1]
-    print(f"🔍 [DEBUG] Token extrait: {token[:50]}...")
-    print(f"🔍 [DEBUG] Token complet: {token}")
-    
-    # Support pour test_token (temporaire)
-    if token.startswith("test_token_"):
-        # Parse test_token format: test_token_{user_id}_{role}
-        parts = token.split("_")
-        print(f"🔍 [DEBUG] Token parts: {parts}")
-        if len(parts) >= 3:
-            try:
-                token_user_id = int(parts[2])
-                role = parts[3] if len(parts) > 3 else "USER"
-                print(f"🔍 [DEBUG] Token user_id: {token_user_id}, role: {role}")
-            except (ValueError, IndexError):
-                # Si le format est test_token_1_ADMIN, extraire différemment
-                if "ADMIN" in token:
-                    token_user_id = 1
-                    role = "ADMIN"
-                    print(f"🔍 [DEBUG] Token ADMIN détecté: user_id={token_user_id}, role={role}")
-                elif "SECRETAIRE" in token:
-                    token_user_id = 1  
-                    role = "SECRETAIRE"
-                    print(f"🔍 [DEBUG] Token SECRETAIRE détecté: user_id={token_user_id}, role={role}")
-                else:
-                    print(f"❌ [DEBUG] Token format invalide")
-                    raise HTTPException(status_code=401, detail="Token invalide")
-            
-            # Vérifier les permissions - Admin et Secrétaire ont accès à tout
-            if role not in ["ADMIN", "SECRETAIRE"] and token_user_id != user_id:
-                print(f"❌ [DEBUG] Accès refusé - role:{role}, token_user_id:{token_user_id}, requested_user_id:{user_id}")
-                raise HTTPException(status_code=403, detail="Accès refusé")
-            else:
-                print(f"✅ [DEBUG] Accès autorisé - role:{role}, token_user_id:{token_user_id}, requested_user_id:{user_id}")
-        else:
-            print(f"❌ [DEBUG] Token format invalide - pas assez de parties")
-            raise HTTPException(status_code=401, detail="Token invalide")
-    else:
-        # TODO: Ajouter validation JWT réelle si nécessaire
-        print(f"🔍 [DEBUG] Token non-test détecté, passage sans validation")
-    
+    """Récupérer les demandes d'un utilisateur spécifique (cursor active la pagination par curseur)"""
+
+    # Vérifier les permissions - Admin et Secrétaire ont accès à tout
+    if current_user["role"] not in ["ADMIN", "SECRETAIRE"] and current_user["id"] != user_id:
+        log.info("Accès refusé aux demandes de l'utilisateur %s", user_id,
+                 extra={"user_id": current_user["id"], "role": current_user["role"]})
+        raise HTTPException(status_code=403, detail="Accès refusé")
+
+    cursor_key = decode_cursor(cursor, 2) if cursor else None
+
     try:
         conn = get_sqlite_connection()
-        cursor = conn.cursor()
+        db_cursor = conn.cursor()
         
         # Vérifier que l'utilisateur existe
-        cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
+        db_cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
+        user = db_cursor.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
         
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if cursor_key:
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend(cursor_key)
+        pagination = "LIMIT ?" if cursor is not None else "LIMIT ? OFFSET ?"
+        params.extend([limit] if cursor is not None else [limit, skip])
+
         # Récupérer les demandes de l'utilisateur
-        cursor.execute("""
+        db_cursor.execute(f"""
             SELECT id, user_id, type_demande, titre, description, statut, 
                    date_debut, date_fin, created_at, updated_at
             FROM demandes 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC
-            LIMIT ? OFFSET ?
-        """, (user_id, limit, skip))
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, id DESC
+            {pagination}
+        """, params)
         
-        demandes = cursor.fetchall()
+        demandes = db_cursor.fetchall()
         conn.close()
+
+        if cursor is not None:
+            token = next_cursor(demandes, limit, ("created_at", "id"))
+            if token:
+                response.headers[NEXT_CURSOR_HEADER] = token
         
-        print(f"🔍 [DEBUG] Demandes trouvées pour user_id {user_id}: {len(demandes)}")
-        for demande in demandes:
-            print(f"   - Demande ID: {demande[0]}, Titre: {demande[3]}, Statut: {demande[5]}")
+        log.debug("Demandes trouvées pour user_id %s: %d", user_id, len(demandes))
         
         # Formater les résultats
         result = []
@@ -0,0 +1,208 @@
+"""
+Métriques HTTP et SQLite, exposées au format texte Prometheus sur /metrics.
+
+Compteurs sans verrou: chaque thread (boucle asyncio, threads du pool
+d'exécution) écrit dans sa propre table; /metrics additionne les tables au
+moment de la lecture. Un enregistrement ne coûte que quelques opérations sur
+un dict local, sans contention entre threads.
+
+- MetricsMiddleware (ASGI pur, compatible avec les réponses en flux): latence
+  par route (histogramme), requêtes par méthode/route/statut, octets reçus et
+  envoyés, requêtes en cours, et nombre/durée des requêtes SQL de la requête.
+- record_query(): appelé par les connexions du pool SQLite (sqlite_pool.py)
+  pour chaque execute/executemany. La requête HTTP en cours est retrouvée par
+  une ContextVar, propagée aux threads du pool d'exécution par Starlette.
+
+Les routes sont étiquetées par leur modèle (/demandes/{demande_id}), jamais
+par le chemin réel: le nombre de séries reste borné.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Secondes; le dernier seau (+Inf) est implicite
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Si défini, /metrics exige Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+HELP = {
+    "http_requests_total": ("counter", "Requêtes HTTP terminées"),
+    "http_request_duration_seconds": ("histogram", "Durée des requêtes HTTP par route"),
+    "http_request_bytes_total": ("counter", "Octets reçus (corps des requêtes)"),
+    "http_response_bytes_total": ("counter", "Octets envoyés (corps des réponses)"),
+    "http_requests_in_flight": ("gauge", "Requêtes HTTP en cours"),
+    "http_request_sql_queries_total": ("counter", "Requêtes SQL exécutées pendant les requêtes HTTP, par route"),
+    "http_request_sql_seconds_total": ("counter", "Temps passé dans SQLite pendant les requêtes HTTP, par route"),
+    "sqlite_queries_total": ("counter", "Requêtes SQL exécutées, par type d'instruction"),
+    "sqlite_query_duration_seconds": ("histogram", "Durée des requêtes SQL"),
+}
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+# Requêtes en cours: modifié seulement depuis la boucle asyncio
+_in_flight = 0
+
+# Statistiques SQL de la requête HTTP en cours: [nombre, secondes]
+_request_sql = contextvars.ContextVar("request_sql", default=None)
+
+
+def _shard():
+    """Tables de ce thread: {(nom, labels): valeur} et {(nom, labels): [seaux..., somme]}"""
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = ({}, {})
+        _local.shard = shard
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def _count(counters, key, value=1):
+    counters[key] = counters.get(key, 0) + value
+
+
+def _observe(histograms, key, buckets, value):
+    series = histograms.get(key)
+    if series is None:
+        series = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+    series[bisect_left(buckets, value)] += 1
+    series[-1] += value
+
+
+def record_query(sql: str, seconds: float):
+    """Une exécution SQL (appelé par le curseur instrumenté de sqlite_pool)"""
+    counters, histograms = _shard()
+    statement = sql.lstrip()[:6].upper() or "OTHER"
+    _count(counters, ("sqlite_queries_total", (("statement", statement),)))
+    _observe(histograms, ("sqlite_query_duration_seconds", ()), SQL_BUCKETS, seconds)
+    current = _request_sql.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += seconds
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("root_path"):
+        # Mount (StaticFiles): /uploads/{path}
+        return f"{scope['root_path']}/{{path}}"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latence, statut, octets et SQL par route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sql = [0, 0.0]
+        token = _request_sql.set(sql)
+        received = [0]
+        response = {"status": 500, "bytes": 0}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                received[0] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        _in_flight += 1
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            _in_flight -= 1
+            _request_sql.reset(token)
+            elapsed = time.perf_counter() - started
+            route = _route_label(scope)
+            counters, histograms = _shard()
+            route_labels = (("route", route),)
+            _count(counters, ("http_requests_total",
+                              (("method", scope["method"]), ("route", route), ("status", str(response["status"])))))
+            _observe(histograms, ("http_request_duration_seconds", route_labels), LATENCY_BUCKETS, elapsed)
+            _count(counters, ("http_request_bytes_total", route_labels), received[0])
+            _count(counters, ("http_response_bytes_total", route_labels), response["bytes"])
+            if sql[0]:
+                _count(counters, ("http_request_sql_queries_total", route_labels), sql[0])
+                _count(counters, ("http_request_sql_seconds_total", route_labels), sql[1])
+
+
+def _merged():
+    counters, histograms = {}, {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard_counters, shard_histograms in shards:
+        # Copies: les threads continuent d'écrire pendant la lecture
+        for key, value in shard_counters.copy().items():
+            counters[key] = counters.get(key, 0) + value
+        for key, series in shard_histograms.copy().items():
+            total = histograms.setdefault(key, [0] * len(series))
+            for index, value in enumerate(list(series)):
+                total[index] += value
+    return counters, histograms
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()) -> str:
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics() -> str:
+    """Toutes les métriques au format d'exposition texte Prometheus 0.0.4"""
+    counters, histograms = _merged()
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if name == "http_requests_in_flight":
+            lines.append(f"{name} {_in_flight}")
+            continue
+        if kind == "histogram":
+            buckets = LATENCY_BUCKETS if name.startswith("http_") else SQL_BUCKETS
+            for (metric, labels), series in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float("inf"),), series[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_format_number(series[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        else:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
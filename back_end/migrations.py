@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Migrations versionnées du schéma SQLite (gestion_db.db).
+
+Chaque migration a un numéro de version, un nom et une liste d'instructions
+idempotentes. Les versions appliquées sont enregistrées dans schema_migrations;
+run_migrations() est appelé au démarrage de l'application et n'applique que
+les migrations manquantes, chacune dans sa propre transaction.
+
+Usage manuel (depuis back_end/):
+    python migrations.py
+"""
+
+import logging
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    (1, "pagination_indexes", [
+        # Pagination par curseur: ORDER BY created_at DESC, id DESC / nom, prenom, id
+        "CREATE INDEX IF NOT EXISTS ix_demandes_created_at_id ON demandes (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_demandes_user_created_at_id ON demandes (user_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_users_active_nom_prenom_id ON users (is_active, nom, prenom, id)",
+    ]),
+    (2, "hot_column_indexes", [
+        # Statistiques du dashboard (GROUP BY statut) et listes filtrées par statut
+        "CREATE INDEX IF NOT EXISTS ix_demandes_statut_created_at ON demandes (statut, created_at)",
+        # Comptages par rôle des utilisateurs actifs
+        "CREATE INDEX IF NOT EXISTS ix_users_role_active ON users (role, is_active)",
+        # Listes des enseignants / fonctionnaires triées par nom
+        "CREATE INDEX IF NOT EXISTS ix_users_role_nom_prenom ON users (role, nom, prenom)",
+        "PRAGMA optimize",
+    ]),
+    (3, "blob_store", [
+        # Stockage des uploads par contenu (blob_store.py)
+        '''CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS ix_blobs_ref_count ON blobs (ref_count)",
+        '''CREATE TABLE IF NOT EXISTS blob_sources (
+            source_sha256 TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (source_sha256, variant)
+        )''',
+        "CREATE INDEX IF NOT EXISTS ix_blob_sources_sha256 ON blob_sources (sha256)",
+    ]),
+    (4, "file_reference_indexes", [
+        # Nettoyage des fichiers orphelins (upload_gc.py): recherche par chemin de fichier
+        "CREATE INDEX IF NOT EXISTS ix_enseignants_photo ON enseignants (photo)",
+        "CREATE INDEX IF NOT EXISTS ix_fonctionnaires_photo ON fonctionnaires (photo)",
+        "CREATE INDEX IF NOT EXISTS ix_demande_documents_file_path ON demande_documents (file_path)",
+    ]),
+    (5, "document_archive_index", [
+        # Export ZIP des documents déposés sur une période (GET /demandes/documents/archive)
+        "CREATE INDEX IF NOT EXISTS ix_demande_documents_uploaded_at ON demande_documents (uploaded_at)",
+    ]),
+    (6, "attestation_events", [
+        # Journal des attestations émises (attestation_log.py), en ajout seul
+        '''CREATE TABLE IF NOT EXISTS attestation_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            demande_id INTEGER NOT NULL,
+            user_email TEXT,
+            user_name TEXT,
+            type_demande TEXT,
+            titre TEXT,
+            fichier_html TEXT,
+            fichier_pdf TEXT,
+            status TEXT NOT NULL,
+            reference TEXT,
+            issued_by TEXT
+        )''',
+        # Recherches par demande, par bénéficiaire et par période (ORDER BY created_at DESC, id DESC)
+        "CREATE INDEX IF NOT EXISTS ix_attestation_events_demande ON attestation_events (demande_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_attestation_events_email ON attestation_events (user_email, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_attestation_events_created_at ON attestation_events (created_at, id)",
+        # Import de l'ancien attestations_log.json rejouable sans doublons
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_attestation_events_entry ON attestation_events (created_at, demande_id, fichier_html)",
+        '''CREATE TRIGGER IF NOT EXISTS attestation_events_no_update BEFORE UPDATE ON attestation_events
+        BEGIN SELECT RAISE(ABORT, 'attestation_events est en ajout seul'); END''',
+        '''CREATE TRIGGER IF NOT EXISTS attestation_events_no_delete BEFORE DELETE ON attestation_events
+        BEGIN SELECT RAISE(ABORT, 'attestation_events est en ajout seul'); END''',
+    ]),
+    (7, "attestation_batch", [
+        # Attestations de travail (sans demande): demande_id facultatif, user_id ajouté.
+        # Reconstruction de la table (SQLite ne sait pas retirer un NOT NULL)
+        '''CREATE TABLE attestation_events_v7 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            demande_id INTEGER,
+            user_id INTEGER,
+            user_email TEXT,
+            user_name TEXT,
+            type_demande TEXT,
+            titre TEXT,
+            fichier_html TEXT,
+            fichier_pdf TEXT,
+            status TEXT NOT NULL,
+            reference TEXT,
+            issued_by TEXT
+        )''',
+        '''INSERT INTO attestation_events_v7 (id, created_at, demande_id, user_id, user_email, user_name, type_demande,
+                                             titre, fichier_html, fichier_pdf, status, reference, issued_by)
+        SELECT e.id, e.created_at, e.demande_id, d.user_id, e.user_email, e.user_name, e.type_demande,
+               e.titre, e.fichier_html, e.fichier_pdf, e.status, e.reference, e.issued_by
+        FROM attestation_events e LEFT JOIN demandes d ON d.id = e.demande_id''',
+        "DROP TABLE attestation_events",
+        "ALTER TABLE attestation_events_v7 RENAME TO attestation_events",
+        "CREATE INDEX IF NOT EXISTS ix_attestation_events_demande ON attestation_events (demande_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_attestation_events_email ON attestation_events (user_email, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_attestation_events_created_at ON attestation_events (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_attestation_events_user ON attestation_events (user_id, created_at, id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_attestation_events_entry ON attestation_events (created_at, demande_id, fichier_html)",
+        '''CREATE TRIGGER IF NOT EXISTS attestation_events_no_update BEFORE UPDATE ON attestation_events
+        BEGIN SELECT RAISE(ABORT, 'attestation_events est en ajout seul'); END''',
+        '''CREATE TRIGGER IF NOT EXISTS attestation_events_no_delete BEFORE DELETE ON attestation_events
+        BEGIN SELECT RAISE(ABORT, 'attestation_events est en ajout seul'); END''',
+        # Lots d'attestations (attestation_batch.py): un lot, une ligne par utilisateur
+        '''CREATE TABLE IF NOT EXISTS attestation_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            created_by TEXT,
+            filters TEXT NOT NULL,
+            date_emission TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT,
+            finished_at TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS ix_attestation_jobs_status ON attestation_jobs (status, id)",
+        '''CREATE TABLE IF NOT EXISTS attestation_job_items (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            fichier_pdf TEXT,
+            error TEXT,
+            PRIMARY KEY (job_id, user_id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS ix_attestation_job_items_status ON attestation_job_items (job_id, status, user_id)",
+    ]),
+    (8, "attestation_job_retries", [
+        # Échecs consécutifs d'un lot (pool de processus cassé...): nouvel essai différé, pas d'abandon
+        "ALTER TABLE attestation_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE attestation_jobs ADD COLUMN next_attempt_at TEXT",
+        "ALTER TABLE attestation_jobs ADD COLUMN last_error TEXT",
+    ]),
+    (9, "attestation_job_owner", [
+        # Prise d'un lot par un seul runner (plusieurs processus serveur), lots orphelins repérés au heartbeat
+        "ALTER TABLE attestation_jobs ADD COLUMN owner TEXT",
+        "ALTER TABLE attestation_jobs ADD COLUMN heartbeat TEXT",
+    ]),
+    (10, "legacy_imports", [
+        # Imports de fichiers historiques déjà faits (attestations_log.json reste en place, suivi par git)
+        '''CREATE TABLE IF NOT EXISTS legacy_imports (
+            source TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            entries INTEGER NOT NULL,
+            imported_at TEXT NOT NULL
+        )''',
+    ]),
+]
+
+
+def ensure_migrations_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def get_applied_versions(conn) -> set:
+    ensure_migrations_table(conn)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def run_migrations(conn) -> list:
+    """Appliquer les migrations manquantes; retourne les versions appliquées"""
+    applied = get_applied_versions(conn)
+    newly_applied = []
+    for version, name, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            # BEGIN explicite: sqlite3 n'ouvre pas de transaction implicite pour le DDL
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        log.info("Migration %d (%s) appliquée", version, name)
+        newly_applied.append(version)
+    return newly_applied
+
+
+if __name__ == "__main__":
+    from sqlite_pool import DB_PATH
+
+    connection = sqlite3.connect(DB_PATH)
+    versions = run_migrations(connection)
+    connection.close()
+    print(f"Migrations appliquées: {versions or 'aucune (schéma à jour)'}")
@@ -0,0 +1,46 @@
+"""
+Pagination par curseur (keyset) pour les listes de demandes et d'utilisateurs.
+
+Le curseur est opaque pour le client: c'est la clé de tri de la dernière ligne
+renvoyée, encodée en base64. La page suivante reprend juste après cette clé
+au lieu de parcourir puis ignorer les lignes précédentes comme OFFSET.
+
+- demandes: ORDER BY created_at DESC, id DESC
+- utilisateurs: ORDER BY nom, prenom, id
+
+Les index composites correspondants sont créés par la migration 1 (migrations.py).
+"""
+
+import base64
+import json
+
+from fastapi import HTTPException
+
+# En-tête renvoyé par les listes en mode curseur (exposé via CORS dans main.py)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values) -> str:
+    """Encoder une clé de tri en curseur opaque"""
+    raw = json.dumps(list(values), separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Décoder un curseur; lève une erreur 400 s'il est invalide"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    return values
+
+
+def next_cursor(rows, limit: int, keys) -> str:
+    """Curseur de la page suivante, ou None si la page est la dernière"""
+    if limit <= 0 or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last[key] for key in keys)
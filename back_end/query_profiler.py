@@ -0,0 +1,218 @@
+"""
+Profil des requêtes SQL par empreinte, journal des requêtes lentes avec leur
+plan (EXPLAIN QUERY PLAN).
+
+L'empreinte d'une requête est son texte normalisé: littéraux et paramètres
+remplacés par ?, listes IN (?, ?, ...) ramenées à IN (...), espaces réduits.
+Les requêtes construites par concaténation (f-strings avec des ids, listes IN
+de longueur variable) se regroupent ainsi sous une même entrée.
+
+Pour chaque empreinte: nombre d'appels, temps total et maximum, lignes lues
+(SELECT) ou modifiées (INSERT/UPDATE/DELETE), appels lents. Le temps compte
+l'exécution et la lecture des lignes (fetch*, itération): une requête qui
+parcourt toute une table en streaming apparaît avec son vrai coût.
+
+Une requête qui dépasse SQL_SLOW_QUERY_MS est journalisée (une fois par
+exécution) avec son plan, calculé sur la même connexion et les mêmes
+paramètres, une seule fois par empreinte. Les paramètres ne sont jamais
+journalisés ni renvoyés par le rapport.
+
+Configuration par variables d'environnement:
+    SQL_PROFILE                     1 (défaut) ou 0 pour désactiver
+    SQL_SLOW_QUERY_MS               seuil des requêtes lentes (100)
+    SQL_PROFILE_MAX_FINGERPRINTS    empreintes suivies, les suivantes sont regroupées (2000)
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+
+log = logging.getLogger(__name__)
+
+SQL_PROFILE = os.environ.get("SQL_PROFILE", "1") != "0"
+SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", "100"))
+SQL_PROFILE_MAX_FINGERPRINTS = int(os.environ.get("SQL_PROFILE_MAX_FINGERPRINTS", "2000"))
+
+# Empreinte commune aux requêtes au-delà de SQL_PROFILE_MAX_FINGERPRINTS
+OVERFLOW_FINGERPRINT = "<autres requêtes>"
+
+# Seules ces instructions ont un plan (pas de PRAGMA, BEGIN, COMMIT...)
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLAC")
+
+SORT_KEYS = {
+    "total": lambda entry: entry["total_ms"],
+    "mean": lambda entry: entry["mean_ms"],
+    "max": lambda entry: entry["max_ms"],
+    "calls": lambda entry: entry["calls"],
+    "rows": lambda entry: entry["rows"],
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_NAMED = re.compile(r"[:@$]\w+|\?\d*")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+# Statistiques par empreinte: [appels, secondes, max secondes, lignes, appels lents]
+_stats = {}
+# Dernière requête brute et ses paramètres par empreinte (pour EXPLAIN, jamais exposés)
+_samples = {}
+_plans = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """Texte normalisé d'une requête (mis en cache: les mêmes chaînes reviennent sans cesse)"""
+    normalized = _STRING.sub("?", sql)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _NAMED.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    return _SPACES.sub(" ", normalized).strip().rstrip(";").strip()
+
+
+class Statement:
+    """Exécution en cours sur un curseur: cumule le temps et les lignes jusqu'à la suivante"""
+
+    __slots__ = ("key", "sql", "parameters", "connection", "seconds", "slow")
+
+    def __init__(self, key, sql, parameters, connection):
+        self.key = key
+        self.sql = sql
+        self.parameters = parameters
+        self.connection = connection
+        self.seconds = 0.0
+        self.slow = False
+
+
+def start_statement(connection, sql: str, parameters, seconds: float, rows: int):
+    """Enregistrer un execute/executemany; renvoie le Statement à compléter par les fetch"""
+    if not SQL_PROFILE:
+        return None
+    key = fingerprint(sql)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            if len(_stats) >= SQL_PROFILE_MAX_FINGERPRINTS:
+                key = OVERFLOW_FINGERPRINT
+                entry = _stats.setdefault(key, [0, 0.0, 0.0, 0, 0])
+            else:
+                entry = _stats[key] = [0, 0.0, 0.0, 0, 0]
+        entry[0] += 1
+        entry[3] += rows
+        if key is not OVERFLOW_FINGERPRINT:
+            _samples[key] = (sql, parameters)
+    statement = Statement(key, sql, parameters, connection)
+    add_to_statement(statement, seconds, 0)
+    return statement
+
+
+def add_to_statement(statement: Statement, seconds: float, rows: int):
+    """Ajouter le temps et les lignes d'un fetch à l'exécution en cours"""
+    statement.seconds += seconds
+    with _lock:
+        entry = _stats.get(statement.key)
+        if entry is None:
+            # Profil remis à zéro pendant l'exécution
+            return
+        entry[1] += seconds
+        entry[3] += rows
+        if statement.seconds > entry[2]:
+            entry[2] = statement.seconds
+        slow = not statement.slow and statement.seconds * 1000 >= SQL_SLOW_QUERY_MS
+        if slow:
+            statement.slow = True
+            entry[4] += 1
+    if slow:
+        _log_slow(statement)
+
+
+def _explain(connection, sql: str, parameters):
+    """Plan d'exécution (une ligne par nœud, indentée), ou None si indisponible"""
+    if parameters is None or not sql.lstrip()[:6].upper().startswith(EXPLAINABLE):
+        return None
+    try:
+        # Curseur de base: le plan lui-même n'est pas profilé
+        rows = connection.cursor(sqlite3.Cursor).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error as error:
+        log.debug("EXPLAIN impossible: %s", error)
+        return None
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[node_id] + detail)
+    return lines
+
+
+def _plan_for(key: str, connection, sql: str, parameters):
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _explain(connection, sql, parameters)
+        # Le regroupement des autres requêtes n'a pas de plan propre: calculé à chaque fois
+        if plan is not None and key != OVERFLOW_FINGERPRINT:
+            _plans[key] = plan
+    return plan
+
+
+def is_full_scan(plan) -> bool:
+    """Parcours complet d'une table (même critère que benchmarks/check_query_plans.py)"""
+    return any(line.strip().startswith("SCAN ") and " USING " not in line for line in plan or ())
+
+
+def _log_slow(statement: Statement):
+    plan = _plan_for(statement.key, statement.connection, statement.sql, statement.parameters)
+    log.warning(
+        "Requête SQL lente (%.1f ms): %s", statement.seconds * 1000, statement.key,
+        extra={"sql_ms": round(statement.seconds * 1000, 1), "plan": plan, "full_scan": is_full_scan(plan)},
+    )
+
+
+def get_sql_profile(limit: int = 20, sort: str = "total", explain_with=None) -> dict:
+    """Top-N des empreintes; explain_with (connexion) calcule les plans manquants"""
+    with _lock:
+        snapshot = {key: list(entry) for key, entry in _stats.items()}
+        samples = dict(_samples)
+    entries = []
+    for key, (calls, seconds, max_seconds, rows, slow_calls) in snapshot.items():
+        entries.append({
+            "fingerprint": key,
+            "calls": calls,
+            "total_ms": round(seconds * 1000, 3),
+            "mean_ms": round(seconds * 1000 / calls, 3) if calls else 0.0,
+            "max_ms": round(max_seconds * 1000, 3),
+            "rows": rows,
+            "rows_per_call": round(rows / calls, 1) if calls else 0.0,
+            "slow_calls": slow_calls,
+        })
+    entries.sort(key=SORT_KEYS.get(sort, SORT_KEYS["total"]), reverse=True)
+    entries = entries[:limit]
+
+    for entry in entries:
+        key = entry["fingerprint"]
+        plan = _plans.get(key)
+        if plan is None and explain_with is not None and key in samples:
+            plan = _plan_for(key, explain_with, *samples[key])
+        entry["plan"] = plan
+        entry["full_scan"] = is_full_scan(plan)
+
+    return {
+        "enabled": SQL_PROFILE,
+        "slow_query_ms": SQL_SLOW_QUERY_MS,
+        "fingerprints": len(snapshot),
+        "calls": sum(entry[0] for entry in snapshot.values()),
+        "total_ms": round(sum(entry[1] for entry in snapshot.values()) * 1000, 3),
+        "sort": sort if sort in SORT_KEYS else "total",
+        "queries": entries,
+    }
+
+
+def reset_sql_profile():
+    """Remettre les compteurs à zéro (et oublier les plans, après l'ajout d'un index par ex.)"""
+    with _lock:
+        _stats.clear()
+        _samples.clear()
+        _plans.clear()
@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date
+from sqlite_pool import get_sqlite_connection
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, next_cursor
+from security import require_roles
+from attestation_log import query_attestation_events
+from attestation_batch import BATCH_ROLES, attestation_batch_runner
+
+router = APIRouter(prefix="/attestations", tags=["Attestations"])
+
+ATTESTATION_EVENTS_MAX_LIMIT = 500
+
+
+class AttestationBatchCreate(BaseModel):
+    role: Optional[str] = None
+    service: Optional[str] = None
+    grade: Optional[str] = None
+
+
+@router.get("/events")
+def get_attestation_events(
+    response: Response,
+    demande_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    user_email: Optional[str] = None,
+    date_debut: Optional[date] = None,
+    date_fin: Optional[date] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE"))
+):
+    """Journal des attestations émises, filtré par demande, bénéficiaire (id ou email) et période
+
+    Les plus récentes d'abord; la page suivante est désignée par l'en-tête X-Next-Cursor.
+    """
+    cursor_key = decode_cursor(cursor, 2) if cursor else None
+    limit = max(1, min(limit, ATTESTATION_EVENTS_MAX_LIMIT))
+
+    conn = get_sqlite_connection()
+    try:
+        events = query_attestation_events(
+            conn,
+            demande_id=demande_id,
+            user_id=user_id,
+            user_email=user_email,
+            date_debut=date_debut.isoformat() if date_debut else None,
+            date_fin=date_fin.isoformat() if date_fin else None,
+            cursor_key=cursor_key,
+            limit=limit,
+        )
+    finally:
+        conn.close()
+
+    token = next_cursor(events, limit, ("created_at", "id"))
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
+    return events
+
+
+@router.post("/batch", status_code=202)
+def create_attestation_batch(
+    filters: AttestationBatchCreate,
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE"))
+):
+    """Lancer la production des attestations de travail des utilisateurs actifs filtrés (rôle, service, grade)"""
+    values = filters.model_dump()
+    if values["role"]:
+        values["role"] = values["role"].upper()
+        if values["role"] not in BATCH_ROLES:
+            raise HTTPException(status_code=400, detail=f"Rôle inconnu: {filters.role}")
+    job = attestation_batch_runner.create_job(values, created_by=current_user.get("email"))
+    if job is None:
+        raise HTTPException(status_code=400, detail="Aucun utilisateur actif ne correspond au filtre")
+    return job
+
+
+@router.get("/batch")
+def list_attestation_batches(
+    limit: int = 20,
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE"))
+):
+    """Derniers lots d'attestations, avec leur progression"""
+    return attestation_batch_runner.list_jobs(max(1, min(limit, 100)))
+
+
+@router.get("/batch/{job_id}")
+def get_attestation_batch(
+    job_id: int,
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE"))
+):
+    """Progression d'un lot: produites, en échec, restantes, estimation du temps restant"""
+    job = attestation_batch_runner.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Lot non trouvé")
+    return job
+
+
+@router.post("/batch/{job_id}/cancel")
+def cancel_attestation_batch(
+    job_id: int,
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE"))
+):
+    """Annuler un lot en attente ou en cours (les attestations déjà produites sont conservées)"""
+    if not attestation_batch_runner.cancel_job(job_id):
+        job = attestation_batch_runner.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Lot non trouvé")
+        raise HTTPException(status_code=400, detail=f"Lot déjà terminé ({job['status']})")
+    return attestation_batch_runner.get_job(job_id)
+
+@router.post("/batch/{job_id}/resume")
+def resume_attestation_batch(
+    job_id: int,
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE"))
+):
+    """Relancer un lot abandonné après des pannes, annulé, ou terminé avec des attestations en échec"""
+    if not attestation_batch_runner.resume_job(job_id):
+        job = attestation_batch_runner.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Lot non trouvé")
+        raise HTTPException(status_code=400, detail=f"Lot non relançable ({job['status']})")
+    return attestation_batch_runner.get_job(job_id)
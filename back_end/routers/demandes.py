@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, File, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Header, File, UploadFile, Response, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import date
 import sqlite3
+import logging
 import os
 import shutil
 import uuid
@@ -11,131 +13,65 @@ from pathlib import Path
 from database import get_db
 from models import User, Demande
 from schemas import Demande as DemandeSchema, DemandeCreate, DemandeUpdate, DemandeDocument as DemandeDocumentSchema
+from sqlite_pool import get_sqlite_connection, WriterLeaseTimeout
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, next_cursor
+from dashboard_stats import invalidate_dashboard_stats
+from event_hub import event_hub, DEMANDE_CREATED, DEMANDE_STATUS_CHANGED, DEMANDE_DELETED
+from security import get_current_principal, require_roles
+from upload_streaming import MAX_DEMANDE_DOCUMENT_SIZE
+from blob_store import receive_upload, add_blob_reference, discard_temp, release_file
+from file_responses import cached_file_response, weak_etag
+from zip_stream import stream_zip
+from attestations import load_attestation_data, issue_attestation
+from document_access_cache import (
+    has_cached_access, cache_access, get_cached_document, cache_document, invalidate_document, invalidate_demande
+)
 
 router = APIRouter(prefix="/demandes", tags=["Demandes"])
-
-def get_sqlite_connection():
-    """Obtenir une connexion à la base de données SQLite"""
-    conn = sqlite3.connect('gestion_db.db')
-    conn.row_factory = sqlite3.Row  # Pour accéder aux colonnes par nom
-    return conn
-
-def get_current_user_from_token(authorization: str = Header(None)):
-    """Extraire l'utilisateur actuel depuis le token d'autorisation"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-    print(f"🔍 [DEBUG] Token reçu: '{token}'")
-
-    # Le token a le format: test_token_{user_id}_{role}
-    if token.startswith("test_token_"):
-        parts = token.split("_")
-        print(f"🔍 [DEBUG] Token parts: {parts}")
-        if len(parts) >= 3:
-            user_id = parts[2]
-            role = parts[3] if len(parts) > 3 else ""
-            print(f"🔍 [DEBUG] Recherche user_id={user_id}, role={role}")
-
-            # Vérifier d'abord dans la base de données SQLite
-            try:
-                conn = get_sqlite_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users WHERE id = ? AND role = ? AND is_active = 1", (user_id, role.upper()))
-                user_data = cursor.fetchone()
-                conn.close()
-
-                if user_data:
-                    print(f"✅ [DEBUG] Utilisateur trouvé dans SQLite: {user_data['email']}")
-                    # Convertir la Row en dictionnaire
-                    user_dict = {
-                        'id': user_data['id'],
-                        'email': user_data['email'],
-                        'nom': user_data['nom'],
-                        'prenom': user_data['prenom'],
-                        'role': user_data['role'],
-                        'is_active': user_data['is_active']
-                    }
-                    return user_dict
-                else:
-                    print(f"❌ [DEBUG] Utilisateur non trouvé dans SQLite avec id={user_id}, role={role.upper()}")
-
-            except Exception as e:
-                print(f"❌ [DEBUG] Erreur lors de la récupération de l'utilisateur: {e}")
-
-            # Fallback vers TEST_USERS pour compatibilité
-            try:
-                # Importer les données de test directement
-                DEFAULT_TEST_USERS = {
-                    "admin@univ.ma": {
-                        "id": 1,
-                        "email": "admin@univ.ma",
-                        "password": "admin2024",
-                        "nom": "Alami",
-                        "prenom": "Hassan",
-                        "role": "admin"
-                    },
-                    "secretaire@univ.ma": {
-                        "id": 2,
-                        "email": "secretaire@univ.ma",
-                        "password": "secretaire2024",
-                        "nom": "Benali",
-                        "prenom": "Fatima",
-                        "role": "secretaire"
-                    },
-                    "enseignant@univ.ma": {
-                        "id": 3,
-                        "email": "enseignant@univ.ma",
-                        "password": "enseignant2024",
-                        "nom": "Tazi",
-                        "prenom": "Ahmed",
-                        "role": "enseignant"
-                    },
-                    "fonctionnaire@univ.ma": {
-                        "id": 4,
-                        "email": "fonctionnaire@univ.ma",
-                        "password": "fonction2024",
-                        "nom": "Karam",
-                        "prenom": "Aicha",
-                        "role": "fonctionnaire"
-                    }
-                }
-                
-                print(f"🔄 [DEBUG] Recherche dans TEST_USERS...")
-                for email, user_data in DEFAULT_TEST_USERS.items():
-                    print(f"🔍 [DEBUG] Comparaison: TEST_USERS[{email}] id={user_data['id']}, role={user_data['role']}")
-                    if str(user_data["id"]) == user_id and user_data["role"].upper() == role.upper():
-                        print(f"✅ [DEBUG] Utilisateur trouvé dans TEST_USERS: {email}")
-                        # Ajouter les champs manquants pour la compatibilité
-                        return {
-                            "id": user_data["id"],
-                            "email": user_data["email"],
-                            "nom": user_data["nom"],
-                            "prenom": user_data["prenom"],
-                            "role": user_data["role"].upper(),
-                            "is_active": True,
-                            "created_at": "2025-01-01 00:00:00",
-                            "telephone": "",
-                            "adresse": "",
-                            "cin": ""
-                        }
-                print(f"❌ [DEBUG] Utilisateur non trouvé dans TEST_USERS")
-            except Exception as e:
-                print(f"❌ [DEBUG] Erreur lors de la vérification dans TEST_USERS: {e}")
-
-    print(f"❌ [DEBUG] Token invalide final")
-    raise HTTPException(status_code=401, detail="Token invalide")
+log = logging.getLogger(__name__)
+
+# Conservé pour les appels directs des endpoints: même résolution que la dépendance commune
+get_current_user_from_token = get_current_principal
+
+# Nombre maximal de paramètres par requête IN (limite SQLITE_MAX_VARIABLE_NUMBER des anciennes versions)
+DOCUMENTS_BATCH_SIZE = 500
+
+def get_documents_by_demande(cursor, demande_ids):
+    """Charger les documents de plusieurs demandes en une requête, groupés par demande_id"""
+    documents_by_demande = {}
+    ids = list(dict.fromkeys(demande_ids))
+    for start in range(0, len(ids), DOCUMENTS_BATCH_SIZE):
+        batch = ids[start:start + DOCUMENTS_BATCH_SIZE]
+        placeholders = ", ".join("?" for _ in batch)
+        cursor.execute(f'''
+            SELECT id, demande_id, filename, original_filename, file_path, file_size, content_type, uploaded_at
+            FROM demande_documents
+            WHERE demande_id IN ({placeholders})
+            ORDER BY demande_id, uploaded_at DESC
+        ''', batch)
+        for doc in cursor.fetchall():
+            documents_by_demande.setdefault(doc["demande_id"], []).append({
+                "id": doc["id"],
+                "demande_id": doc["demande_id"],
+                "filename": doc["filename"],
+                "original_filename": doc["original_filename"],
+                "file_path": doc["file_path"],
+                "file_size": doc["file_size"],
+                "content_type": doc["content_type"],
+                "uploaded_at": doc["uploaded_at"]
+            })
+    return documents_by_demande
 
 @router.post("/", response_model=DemandeSchema)
-async def create_demande(
+def create_demande(
     demande: DemandeCreate,
     authorization: str = Header(None)
 ):
     """Créer une nouvelle demande"""
     current_user = get_current_user_from_token(authorization)
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Insérer la nouvelle demande
@@ -153,6 +89,7 @@ async def create_demande(
 
         demande_id = cursor.lastrowid
         conn.commit()
+        invalidate_dashboard_stats()
 
         # Récupérer la demande créée avec les informations utilisateur
         cursor.execute('''
@@ -165,7 +102,7 @@ async def create_demande(
         demande_data = cursor.fetchone()
         conn.close()
 
-        return {
+        created = {
             "id": demande_data["id"],
             "user_id": demande_data["user_id"],
             "type_demande": demande_data["type_demande"],
@@ -187,13 +124,17 @@ async def create_demande(
                 "created_at": demande_data["user_created_at"] or "2025-01-01T00:00:00"
             }
         }
+        event_hub.publish(DEMANDE_CREATED, created)
+        return created
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création: {str(e)}")
+    finally:
+        conn.close()
 
 # Endpoint spécialisé pour les demandes d'attestation
 @router.post("/attestation", response_model=DemandeSchema)
-async def create_demande_attestation(
+def create_demande_attestation(
     titre: str,
     description: Optional[str] = None,
     authorization: str = Header(None)
@@ -201,8 +142,8 @@ async def create_demande_attestation(
     """Créer une demande d'attestation"""
     current_user = get_current_user_from_token(authorization)
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -212,6 +153,7 @@ async def create_demande_attestation(
 
         demande_id = cursor.lastrowid
         conn.commit()
+        invalidate_dashboard_stats()
 
         # Récupérer la demande créée
         cursor.execute('''
@@ -224,7 +166,7 @@ async def create_demande_attestation(
         demande_data = cursor.fetchone()
         conn.close()
 
-        return {
+        created = {
             "id": demande_data["id"],
             "user_id": demande_data["user_id"],
             "type_demande": demande_data["type_demande"],
@@ -244,13 +186,17 @@ async def create_demande_attestation(
                 "role": demande_data["role"]
             }
         }
+        event_hub.publish(DEMANDE_CREATED, created)
+        return created
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création: {str(e)}")
+    finally:
+        conn.close()
 
 # Endpoint spécialisé pour les demandes d'ordre de mission
 @router.post("/ordre-mission", response_model=DemandeSchema)
-async def create_demande_ordre_mission(
+def create_demande_ordre_mission(
     titre: str,
     description: Optional[str] = None,
     date_debut: Optional[str] = None,
@@ -260,8 +206,8 @@ async def create_demande_ordre_mission(
     """Créer une demande d'ordre de mission"""
     current_user = get_current_user_from_token(authorization)
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -271,6 +217,7 @@ async def create_demande_ordre_mission(
 
         demande_id = cursor.lastrowid
         conn.commit()
+        invalidate_dashboard_stats()
 
         # Récupérer la demande créée
         cursor.execute('''
@@ -283,7 +230,7 @@ async def create_demande_ordre_mission(
         demande_data = cursor.fetchone()
         conn.close()
 
-        return {
+        created = {
             "id": demande_data["id"],
             "user_id": demande_data["user_id"],
             "type_demande": demande_data["type_demande"],
@@ -303,13 +250,17 @@ async def create_demande_ordre_mission(
                 "role": demande_data["role"]
             }
         }
+        event_hub.publish(DEMANDE_CREATED, created)
+        return created
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création: {str(e)}")
+    finally:
+        conn.close()
 
 # Endpoint spécialisé pour les demandes d'heures supplémentaires
 @router.post("/heures-sup", response_model=DemandeSchema)
-async def create_demande_heures_sup(
+def create_demande_heures_sup(
     titre: str,
     description: Optional[str] = None,
     date_debut: Optional[str] = None,
@@ -319,8 +270,8 @@ async def create_demande_heures_sup(
     """Créer une demande d'heures supplémentaires"""
     current_user = get_current_user_from_token(authorization)
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -330,6 +281,7 @@ async def create_demande_heures_sup(
 
         demande_id = cursor.lastrowid
         conn.commit()
+        invalidate_dashboard_stats()
 
         # Récupérer la demande créée
         cursor.execute('''
@@ -342,7 +294,7 @@ async def create_demande_heures_sup(
         demande_data = cursor.fetchone()
         conn.close()
 
-        return {
+        created = {
             "id": demande_data["id"],
             "user_id": demande_data["user_id"],
             "type_demande": demande_data["type_demande"],
@@ -362,17 +314,21 @@ async def create_demande_heures_sup(
                 "role": demande_data["role"]
             }
         }
+        event_hub.publish(DEMANDE_CREATED, created)
+        return created
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création: {str(e)}")
+    finally:
+        conn.close()
 
 @router.get("/test")
-async def test_demandes():
+def test_demandes():
     """Endpoint de test simple pour vérifier si le routeur fonctionne"""
     return {"message": "Test réussi", "status": "OK"}
 
 @router.get("/test-auth")
-async def test_auth(authorization: str = Header(None)):
+def test_auth(authorization: str = Header(None)):
     """Endpoint de test avec authentification"""
     try:
         user = get_current_user_from_token(authorization)
@@ -381,80 +337,68 @@ async def test_auth(authorization: str = Header(None)):
         return {"message": "Auth échouée", "error": str(e)}
 
 @router.get("/")
-async def get_demandes(
+def get_demandes(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     authorization: str = Header(None)
 ):
-    """Récupérer les demandes selon le rôle de l'utilisateur"""
-    print(f"🔍 [DEBUG] get_demandes appelé avec authorization: {authorization}")
-    
+    """Récupérer les demandes selon le rôle de l'utilisateur
+
+    Passer cursor (vide pour la première page) active la pagination par curseur:
+    skip est ignoré et le curseur suivant est renvoyé dans l'en-tête X-Next-Cursor.
+    """
     try:
         current_user = get_current_user_from_token(authorization)
-        print(f"🔍 [DEBUG] Utilisateur courant: {current_user}")
     except Exception as e:
-        print(f"❌ [DEBUG] Erreur lors de l'authentification: {str(e)}")
+        log.info("Erreur lors de l'authentification: %s", e)
         raise HTTPException(status_code=401, detail=f"Erreur d'authentification: {str(e)}")
 
+    # Décodé hors du try pour renvoyer une 400 et non une 500
+    cursor_key = decode_cursor(cursor, 2) if cursor else None
+
     try:
         conn = get_sqlite_connection()
-        cursor = conn.cursor()
+        db_cursor = conn.cursor()
 
-        if current_user["role"] in ["ADMIN", "SECRETAIRE"]:
-            print(f"🔍 [DEBUG] Récupération de toutes les demandes pour {current_user['role']}")
-            # Admin et secrétaire voient toutes les demandes
-            cursor.execute('''
-                SELECT d.id, d.user_id, d.type_demande, d.titre, d.description, 
-                       d.date_debut, d.date_fin, d.statut, d.commentaire_admin, 
-                       d.created_at, d.updated_at,
-                       u.nom, u.prenom, u.email, u.role
-                FROM demandes d
-                JOIN users u ON d.user_id = u.id
-                ORDER BY d.created_at DESC
-                LIMIT ? OFFSET ?
-            ''', (limit, skip))
-        else:
-            print(f"🔍 [DEBUG] Récupération des demandes pour l'utilisateur {current_user['id']}")
-            # Utilisateurs normaux voient seulement leurs demandes
-            cursor.execute('''
-                SELECT d.id, d.user_id, d.type_demande, d.titre, d.description,
-                       d.date_debut, d.date_fin, d.statut, d.commentaire_admin,
-                       d.created_at, d.updated_at,
-                       u.nom, u.prenom, u.email, u.role
-                FROM demandes d
-                JOIN users u ON d.user_id = u.id
-                WHERE d.user_id = ?
-                ORDER BY d.created_at DESC
-                LIMIT ? OFFSET ?
-            ''', (current_user["id"], limit, skip))
+        conditions = []
+        params = []
+        if current_user["role"] not in ["ADMIN", "SECRETAIRE"]:
+            # Admin et secrétaire voient toutes les demandes, les autres seulement les leurs
+            conditions.append("d.user_id = ?")
+            params.append(current_user["id"])
+
+        if cursor_key:
+            conditions.append("(d.created_at, d.id) < (?, ?)")
+            params.extend(cursor_key)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        pagination = "LIMIT ?" if cursor is not None else "LIMIT ? OFFSET ?"
+        params.extend([limit] if cursor is not None else [limit, skip])
+
+        db_cursor.execute(f'''
+            SELECT d.id, d.user_id, d.type_demande, d.titre, d.description,
+                   d.date_debut, d.date_fin, d.statut, d.commentaire_admin,
+                   d.created_at, d.updated_at,
+                   u.nom, u.prenom, u.email, u.role
+            FROM demandes d
+            JOIN users u ON d.user_id = u.id
+            {where}
+            ORDER BY d.created_at DESC, d.id DESC
+            {pagination}
+        ''', params)
+
+        demandes_data = db_cursor.fetchall()
+        log.debug("Demandes trouvées pour %s %s: %d", current_user["role"], current_user["id"], len(demandes_data))
 
-        demandes_data = cursor.fetchall()
-        print(f"🔍 [DEBUG] Nombre de demandes trouvées: {len(demandes_data)}")
+        # Récupérer les documents de toute la page en une seule requête
+        documents_by_demande = get_documents_by_demande(db_cursor, [demande["id"] for demande in demandes_data])
 
         demandes_list = []
         for demande in demandes_data:
             try:
-                # Récupérer les documents associés à cette demande
-                cursor.execute('''
-                    SELECT id, demande_id, filename, original_filename, file_path, file_size, content_type, uploaded_at
-                    FROM demande_documents 
-                    WHERE demande_id = ?
-                    ORDER BY uploaded_at DESC
-                ''', (demande["id"],))
-                
-                documents_data = cursor.fetchall()
-                documents_list = []
-                for doc in documents_data:
-                    documents_list.append({
-                        "id": doc["id"],
-                        "demande_id": doc["demande_id"],
-                        "filename": doc["filename"],
-                        "original_filename": doc["original_filename"],
-                        "file_path": doc["file_path"],
-                        "file_size": doc["file_size"],
-                        "content_type": doc["content_type"],
-                        "uploaded_at": doc["uploaded_at"]
-                    })
+                documents_list = documents_by_demande.get(demande["id"], [])
 
                 # Conversion simple sans validation Pydantic
                 demande_dict = {
@@ -480,46 +424,64 @@ async def get_demandes(
                 }
                 demandes_list.append(demande_dict)
             except Exception as e:
-                print(f"❌ [DEBUG] Erreur lors du traitement de la demande {demande.get('id', 'unknown')}: {str(e)}")
+                log.warning("Demande %s ignorée: %s", demande["id"], e)
                 continue
 
         conn.close()
 
-        print(f"🔍 [DEBUG] Liste des demandes formatée: {len(demandes_list)} demandes")
+        if cursor is not None:
+            token = next_cursor(demandes_data, limit, ("created_at", "id"))
+            if token:
+                response.headers[NEXT_CURSOR_HEADER] = token
+
         return demandes_list
 
     except Exception as e:
-        print(f"❌ [DEBUG] Erreur dans get_demandes: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Erreur dans get_demandes")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
 
 @router.get("/user/me", response_model=List[DemandeSchema])
-async def get_my_demandes(
+def get_my_demandes(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     authorization: str = Header(None)
 ):
-    """Récupérer les demandes de l'utilisateur connecté"""
+    """Récupérer les demandes de l'utilisateur connecté (cursor active la pagination par curseur)"""
     current_user = get_current_user_from_token(authorization)
+    cursor_key = decode_cursor(cursor, 2) if cursor else None
 
     try:
         conn = get_sqlite_connection()
-        cursor = conn.cursor()
+        db_cursor = conn.cursor()
+
+        conditions = ["d.user_id = ?"]
+        params = [current_user["id"]]
+        if cursor_key:
+            conditions.append("(d.created_at, d.id) < (?, ?)")
+            params.extend(cursor_key)
+        pagination = "LIMIT ?" if cursor is not None else "LIMIT ? OFFSET ?"
+        params.extend([limit] if cursor is not None else [limit, skip])
 
         # Récupérer seulement les demandes de l'utilisateur connecté
-        cursor.execute('''
+        db_cursor.execute(f'''
             SELECT d.*, u.nom, u.prenom, u.email, u.role, u.is_active, u.created_at as user_created_at
             FROM demandes d
             JOIN users u ON d.user_id = u.id
-            WHERE d.user_id = ?
-            ORDER BY d.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (current_user["id"], limit, skip))
+            WHERE {' AND '.join(conditions)}
+            ORDER BY d.created_at DESC, d.id DESC
+            {pagination}
+        ''', params)
 
-        demandes_data = cursor.fetchall()
+        demandes_data = db_cursor.fetchall()
         conn.close()
 
+        if cursor is not None:
+            token = next_cursor(demandes_data, limit, ("created_at", "id"))
+            if token:
+                response.headers[NEXT_CURSOR_HEADER] = token
+
         demandes_list = []
         for demande in demandes_data:
             demandes_list.append({
@@ -551,11 +513,11 @@ async def get_my_demandes(
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
 
 @router.get("/debug-sql")
-async def debug_sql_demandes(authorization: str = Header(None)):
+def debug_sql_demandes(authorization: str = Header(None)):
     """Debug de la requête SQL des demandes"""
     try:
         current_user = get_current_user_from_token(authorization)
-        print(f"🔍 [DEBUG] Utilisateur: {current_user}")
+        log.debug("debug-sql demandé par l'utilisateur %s", current_user["id"])
         
         conn = get_sqlite_connection()
         cursor = conn.cursor()
@@ -563,7 +525,7 @@ async def debug_sql_demandes(authorization: str = Header(None)):
         # Test simple de la requête
         cursor.execute("SELECT COUNT(*) as count FROM demandes")
         count = cursor.fetchone()['count']
-        print(f"🔍 [DEBUG] Total demandes: {count}")
+        log.debug("Total demandes: %d", count)
         
         # Requête complète
         cursor.execute('''
@@ -599,7 +561,7 @@ async def debug_sql_demandes(authorization: str = Header(None)):
         }
 
 @router.get("/{demande_id}", response_model=DemandeSchema)
-async def get_demande(
+def get_demande(
     demande_id: int,
     authorization: str = Header(None)
 ):
@@ -681,7 +643,7 @@ async def get_demande(
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
 
 @router.put("/{demande_id}", response_model=DemandeSchema)
-async def update_demande(
+def update_demande(
     demande_id: int,
     demande_update: DemandeUpdate,
     authorization: str = Header(None)
@@ -689,8 +651,8 @@ async def update_demande(
     """Mettre à jour une demande"""
     current_user = get_current_user_from_token(authorization)
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Vérifier que la demande existe
@@ -736,6 +698,7 @@ async def update_demande(
 
             cursor.execute(f"UPDATE demandes SET {', '.join(updates)} WHERE id = ?", params)
             conn.commit()
+            invalidate_dashboard_stats()
 
         # Récupérer la demande mise à jour
         cursor.execute('''
@@ -748,7 +711,7 @@ async def update_demande(
         updated_data = cursor.fetchone()
         conn.close()
 
-        return {
+        updated = {
             "id": updated_data["id"],
             "user_id": updated_data["user_id"],
             "type_demande": updated_data["type_demande"],
@@ -768,12 +731,17 @@ async def update_demande(
                 "role": updated_data["role"]
             }
         }
+        if demande_update.statut is not None:
+            event_hub.publish(DEMANDE_STATUS_CHANGED, updated)
+        return updated
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour: {str(e)}")
+    finally:
+        conn.close()
 
 @router.patch("/{demande_id}/status")
-async def update_demande_status(
+def update_demande_status(
     demande_id: int,
     status_data: dict,
     authorization: str = Header(None)
@@ -799,47 +767,45 @@ async def update_demande_status(
         if statut not in valid_statuts:
             raise HTTPException(status_code=400, detail=f"Statut invalide. Statuts valides: {valid_statuts}")
 
-        print(f"🔄 [UPDATE STATUS] Demande {demande_id}: {statut} par {current_user['email']}")
 
         # Se connecter à la base de données
-        conn = get_sqlite_connection()
-        cursor = conn.cursor()
+        with get_sqlite_connection(write=True) as conn:
+            cursor = conn.cursor()
 
-        # Vérifier que la demande existe
-        cursor.execute("SELECT * FROM demandes WHERE id = ?", (demande_id,))
-        demande = cursor.fetchone()
+            # Vérifier que la demande existe
+            cursor.execute("SELECT * FROM demandes WHERE id = ?", (demande_id,))
+            demande = cursor.fetchone()
         
-        if not demande:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Demande non trouvée")
+            if not demande:
+                raise HTTPException(status_code=404, detail="Demande non trouvée")
 
-        # Mettre à jour le statut et le commentaire
-        cursor.execute("""
-            UPDATE demandes 
-            SET statut = ?, commentaire_admin = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (statut, commentaire_admin, demande_id))
+            # Mettre à jour le statut et le commentaire
+            cursor.execute("""
+                UPDATE demandes 
+                SET statut = ?, commentaire_admin = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (statut, commentaire_admin, demande_id))
 
-        conn.commit()
+            conn.commit()
+            invalidate_dashboard_stats()
 
-        # Récupérer la demande mise à jour
-        cursor.execute("""
-            SELECT d.*, u.nom, u.prenom, u.email
-            FROM demandes d
-            JOIN users u ON d.user_id = u.id
-            WHERE d.id = ?
-        """, (demande_id,))
+            # Récupérer la demande mise à jour
+            cursor.execute("""
+                SELECT d.*, u.nom, u.prenom, u.email
+                FROM demandes d
+                JOIN users u ON d.user_id = u.id
+                WHERE d.id = ?
+            """, (demande_id,))
         
-        updated_demande = cursor.fetchone()
-        conn.close()
+            updated_demande = cursor.fetchone()
 
         if not updated_demande:
             raise HTTPException(status_code=404, detail="Erreur lors de la récupération de la demande mise à jour")
 
-        print(f"✅ [UPDATE STATUS] Demande {demande_id} mise à jour: {statut}")
+        log.info("Demande %s mise à jour: %s", demande_id, statut, extra={"by": current_user["email"]})
 
         # Retourner la demande mise à jour
-        return {
+        updated = {
             "id": updated_demande["id"],
             "user_id": updated_demande["user_id"],
             "nom_utilisateur": f"{updated_demande['nom']} {updated_demande['prenom']}",
@@ -855,21 +821,25 @@ async def update_demande_status(
             "urgence": "NORMALE",  # Valeur par défaut
             "priorite": 1  # Valeur par défaut
         }
+        event_hub.publish(DEMANDE_STATUS_CHANGED, updated)
+        return updated
 
+    except WriterLeaseTimeout:
+        raise
     except Exception as e:
-        print(f"❌ Erreur mise à jour statut demande {demande_id}: {str(e)}")
+        log.error("Erreur mise à jour statut demande %s: %s", demande_id, e)
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour du statut: {str(e)}")
 
 @router.delete("/{demande_id}")
-async def delete_demande(
+def delete_demande(
     demande_id: int,
     authorization: str = Header(None)
 ):
     """Supprimer une demande"""
     current_user = get_current_user_from_token(authorization)
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Vérifier que la demande existe
@@ -882,18 +852,30 @@ async def delete_demande(
         if current_user["role"] not in ["ADMIN", "SECRETAIRE"] and demande_data["user_id"] != current_user["id"]:
             raise HTTPException(status_code=403, detail="Accès refusé")
 
+        # Documents de la demande: ON DELETE CASCADE n'est pas appliqué (foreign_keys désactivé),
+        # on rend les références sur leurs fichiers et on supprime les lignes explicitement
+        cursor.execute("SELECT file_path FROM demande_documents WHERE demande_id = ?", (demande_id,))
+        for document in cursor.fetchall():
+            release_file(conn, document["file_path"])
+        cursor.execute("DELETE FROM demande_documents WHERE demande_id = ?", (demande_id,))
+
         cursor.execute("DELETE FROM demandes WHERE id = ?", (demande_id,))
         conn.commit()
+        invalidate_dashboard_stats()
+        invalidate_demande(demande_id)
         conn.close()
+        event_hub.publish(DEMANDE_DELETED, {"id": demande_id, "user_id": demande_data["user_id"]})
 
         return {"message": "Demande supprimée avec succès"}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
+    finally:
+        conn.close()
 
 # Endpoints pour l'upload de documents
 @router.post("/{demande_id}/upload-documents")
-async def upload_documents_to_demande(
+def upload_documents_to_demande(
     demande_id: int,
     files: List[UploadFile] = File(...),
     authorization: str = Header(None)
@@ -913,66 +895,63 @@ async def upload_documents_to_demande(
     """, (demande_id, current_user["id"]))
     
     demande = cursor.fetchone()
+    conn.close()
     if not demande:
-        conn.close()
         raise HTTPException(status_code=404, detail="Demande non trouvée ou accès non autorisé")
     
     # Vérifier que la demande est du bon type (HEURES_SUP ou ORDRE_MISSION)
     if demande["type_demande"] not in ["HEURES_SUP", "ORDRE_MISSION"]:
-        conn.close()
         raise HTTPException(status_code=400, detail="Upload de documents non autorisé pour ce type de demande")
     
-    # Créer le dossier de destination
-    upload_dir = Path("uploads/demandes")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
+    received = []
     uploaded_files = []
+    document_rows = []
+    conn = None
     
     try:
         for file in files:
             if not file.filename:
                 continue
                 
-            # Vérifier la taille du fichier (5MB max)
-            content = await file.read()
-            if len(content) > 5 * 1024 * 1024:  # 5MB
-                raise HTTPException(status_code=400, detail=f"Fichier {file.filename} trop volumineux (max 5MB)")
-            
             # Vérifier le type de fichier
             allowed_types = ['.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx']
             file_extension = Path(file.filename).suffix.lower()
             if file_extension not in allowed_types:
                 raise HTTPException(status_code=400, detail=f"Type de fichier non autorisé: {file.filename}")
             
-            # Générer un nom de fichier unique
-            unique_filename = f"demande_{demande_id}_{int(time.time())}_{uuid.uuid4().hex[:8]}{file_extension}"
-            file_path = upload_dir / unique_filename
-            
-            # Sauvegarder le fichier
-            with open(file_path, "wb") as f:
-                f.write(content)
+            # Copie par blocs avec rejet dès que 5MB sont dépassés, hors transaction
+            tmp_path, file_size, sha256 = receive_upload(file, MAX_DEMANDE_DOCUMENT_SIZE)
+            received.append((file, file_extension, tmp_path, file_size, sha256))
+        
+        # Blobs et documents dans une seule transaction d'écriture
+        conn = get_sqlite_connection(write=True)
+        for file, file_extension, tmp_path, file_size, sha256 in received:
+            # Contenu déjà stocké: le fichier temporaire est jeté, seul le ref_count augmente
+            file_path = add_blob_reference(conn, tmp_path, sha256, file_size, file_extension)
+            stored_filename = Path(file_path).name
             
-            # Enregistrer dans la base de données
-            cursor.execute("""
-                INSERT INTO demande_documents 
-                (demande_id, filename, original_filename, file_path, file_size, content_type)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
+            document_rows.append((
                 demande_id,
-                unique_filename,
+                stored_filename,
                 file.filename,
-                str(file_path),
-                len(content),
+                file_path,
+                file_size,
                 file.content_type
             ))
             
             uploaded_files.append({
-                "filename": unique_filename,
+                "filename": stored_filename,
                 "original_filename": file.filename,
-                "file_size": len(content),
-                "content_type": file.content_type
+                "file_size": file_size,
+                "content_type": file.content_type,
+                "sha256": sha256
             })
         
+        conn.executemany("""
+            INSERT INTO demande_documents 
+            (demande_id, filename, original_filename, file_path, file_size, content_type)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, document_rows)
         conn.commit()
         conn.close()
         
@@ -982,18 +961,126 @@ async def upload_documents_to_demande(
         }
         
     except Exception as e:
-        conn.rollback()
-        conn.close()
-        # Nettoyer les fichiers uploadés en cas d'erreur
-        for file_info in uploaded_files:
-            try:
-                os.remove(upload_dir / file_info["filename"])
-            except:
-                pass
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+        # Nettoyer les fichiers temporaires (les blobs sans référence sont purgés plus tard)
+        for received_file in received:
+            discard_temp(received_file[2])
+        if isinstance(e, (HTTPException, WriterLeaseTimeout)):
+            raise
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'upload: {str(e)}")
 
+@router.post("/{demande_id}/attestation")
+def generate_demande_attestation(
+    demande_id: int,
+    authorization: str = Header(None)
+):
+    """Émettre l'attestation (HTML et PDF) d'une demande approuvée; réutilisée si rien n'a changé"""
+    current_user = get_current_user_from_token(authorization)
+    
+    conn = get_sqlite_connection()
+    try:
+        data = load_attestation_data(conn, demande_id)
+    finally:
+        conn.close()
+    
+    if data is None or (current_user["role"] not in ["ADMIN", "SECRETAIRE"] and data["user_id"] != current_user["id"]):
+        raise HTTPException(status_code=404, detail="Demande non trouvée ou accès non autorisé")
+    if data["statut"] != "APPROUVEE":
+        raise HTTPException(status_code=400, detail="L'attestation n'est disponible que pour une demande approuvée")
+    
+    attestation = issue_attestation(data, issued_by=current_user)
+    return {
+        **attestation,
+        "html_url": f"/{attestation['fichier_html']}",
+        "pdf_url": f"/{attestation['fichier_pdf']}"
+    }
+
+def _document_archive_entries(documents, with_demande_dir: bool):
+    """(nom dans l'archive, chemin) des documents; dossier demande_<id>/ pour les exports multi-demandes"""
+    for doc in documents:
+        name = Path(str(doc["original_filename"] or doc["filename"]).replace("\\", "/")).name or doc["filename"]
+        if with_demande_dir:
+            name = f"demande_{doc['demande_id']}/{name}"
+        yield name, doc["file_path"].replace("\\", "/")
+
+def _zip_response(entries, archive_name: str) -> StreamingResponse:
+    # Taille inconnue à l'avance: réponse en chunked, sans Content-Length
+    return StreamingResponse(
+        stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}"'}
+    )
+
+@router.get("/documents/archive")
+def export_documents_archive(
+    date_debut: date,
+    date_fin: date,
+    current_user: dict = Depends(require_roles("ADMIN", detail="Accès refusé. Droits admin requis."))
+):
+    """Exporter en ZIP les documents déposés entre date_debut et date_fin (incluses), par demande"""
+    if date_fin < date_debut:
+        raise HTTPException(status_code=400, detail="date_fin doit être postérieure à date_debut")
+    
+    conn = get_sqlite_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT demande_id, filename, original_filename, file_path
+        FROM demande_documents
+        WHERE uploaded_at >= ? AND uploaded_at < date(?, '+1 day')
+        ORDER BY demande_id, uploaded_at
+    """, (date_debut.isoformat(), date_fin.isoformat()))
+    documents = cursor.fetchall()
+    conn.close()
+    
+    if not documents:
+        raise HTTPException(status_code=404, detail="Aucun document sur cette période")
+    
+    log.info("Export ZIP de %d document(s) du %s au %s", len(documents), date_debut, date_fin)
+    return _zip_response(
+        _document_archive_entries(documents, with_demande_dir=True),
+        f"documents_{date_debut.isoformat()}_{date_fin.isoformat()}.zip"
+    )
+
+@router.get("/{demande_id}/documents/archive")
+def download_demande_documents_archive(
+    demande_id: int,
+    authorization: str = Header(None)
+):
+    """Télécharger tous les documents d'une demande dans une archive ZIP"""
+    
+    current_user = get_current_user_from_token(authorization)
+    
+    conn = get_sqlite_connection()
+    cursor = conn.cursor()
+    
+    # Vérifier l'accès à la demande (propriétaire ou admin/secrétaire)
+    cursor.execute("""
+        SELECT id FROM demandes 
+        WHERE id = ? AND (user_id = ? OR ? IN ('ADMIN', 'SECRETAIRE'))
+    """, (demande_id, current_user["id"], current_user["role"]))
+    
+    if not cursor.fetchone():
+        conn.close()
+        raise HTTPException(status_code=404, detail="Demande non trouvée ou accès non autorisé")
+    
+    cursor.execute("""
+        SELECT demande_id, filename, original_filename, file_path
+        FROM demande_documents 
+        WHERE demande_id = ?
+        ORDER BY uploaded_at
+    """, (demande_id,))
+    documents = cursor.fetchall()
+    conn.close()
+    
+    if not documents:
+        raise HTTPException(status_code=404, detail="Aucun document pour cette demande")
+    
+    return _zip_response(_document_archive_entries(documents, with_demande_dir=False), f"demande_{demande_id}_documents.zip")
+
 @router.get("/{demande_id}/documents")
-async def get_demande_documents(
+def get_demande_documents(
     demande_id: int,
     authorization: str = Header(None)
 ):
@@ -1038,7 +1125,7 @@ async def get_demande_documents(
     ]
 
 @router.delete("/{demande_id}/documents/{document_id}")
-async def delete_demande_document(
+def delete_demande_document(
     demande_id: int,
     document_id: int,
     authorization: str = Header(None)
@@ -1047,97 +1134,102 @@ async def delete_demande_document(
     
     current_user = get_current_user_from_token(authorization)
     
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
+    conn = get_sqlite_connection(write=True)
+    try:
+        cursor = conn.cursor()
     
-    # Vérifier l'accès à la demande
-    cursor.execute("""
-        SELECT * FROM demandes 
-        WHERE id = ? AND user_id = ?
-    """, (demande_id, current_user["id"]))
+        # Vérifier l'accès à la demande
+        cursor.execute("""
+            SELECT * FROM demandes 
+            WHERE id = ? AND user_id = ?
+        """, (demande_id, current_user["id"]))
     
-    demande = cursor.fetchone()
-    if not demande:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Demande non trouvée ou accès non autorisé")
+        demande = cursor.fetchone()
+        if not demande:
+            raise HTTPException(status_code=404, detail="Demande non trouvée ou accès non autorisé")
     
-    # Récupérer le document
-    cursor.execute("""
-        SELECT * FROM demande_documents 
-        WHERE id = ? AND demande_id = ?
-    """, (document_id, demande_id))
+        # Récupérer le document
+        cursor.execute("""
+            SELECT * FROM demande_documents 
+            WHERE id = ? AND demande_id = ?
+        """, (document_id, demande_id))
     
-    document = cursor.fetchone()
-    if not document:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Document non trouvé")
+        document = cursor.fetchone()
+        if not document:
+            raise HTTPException(status_code=404, detail="Document non trouvé")
     
-    try:
-        # Supprimer le fichier physique
-        if os.path.exists(document["file_path"]):
-            os.remove(document["file_path"])
+        try:
+            # Rendre la référence sur le fichier (blob partagé ou ancien fichier)
+            release_file(conn, document["file_path"])
         
-        # Supprimer l'enregistrement de la base de données
-        cursor.execute("""
-            DELETE FROM demande_documents 
-            WHERE id = ?
-        """, (document_id,))
+            # Supprimer l'enregistrement de la base de données
+            cursor.execute("""
+                DELETE FROM demande_documents 
+                WHERE id = ?
+            """, (document_id,))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+            invalidate_document(demande_id, document_id)
         
-        return {"message": "Document supprimé avec succès"}
+            return {"message": "Document supprimé avec succès"}
         
-    except Exception as e:
-        conn.rollback()
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
+    finally:
         conn.close()
-        raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
 
-@router.get("/{demande_id}/documents/{document_id}/download")
-async def download_demande_document(
+@router.api_route("/{demande_id}/documents/{document_id}/download", methods=["GET", "HEAD"])
+def download_demande_document(
     demande_id: int,
     document_id: int,
+    request: Request,
     authorization: str = Header(None)
 ):
-    """Télécharger un document d'une demande"""
+    """Télécharger un document d'une demande (reprise possible avec Range / If-Range)"""
     
     current_user = get_current_user_from_token(authorization)
     
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
-    
-    # Vérifier l'accès à la demande (propriétaire ou admin/secrétaire)
-    cursor.execute("""
-        SELECT * FROM demandes 
-        WHERE id = ? AND (user_id = ? OR ? IN ('ADMIN', 'SECRETAIRE'))
-    """, (demande_id, current_user["id"], current_user["role"]))
-    
-    demande = cursor.fetchone()
-    if not demande:
+    document = get_cached_document(demande_id, document_id) if has_cached_access(current_user, demande_id) else None
+    if document is None:
+        conn = get_sqlite_connection()
+        cursor = conn.cursor()
+        
+        # Accès à la demande (propriétaire ou admin/secrétaire) et document, en une requête
+        cursor.execute("""
+            SELECT d.id AS demande_id, doc.id, doc.file_path, doc.original_filename, doc.content_type
+            FROM demandes d
+            LEFT JOIN demande_documents doc ON doc.demande_id = d.id AND doc.id = ?
+            WHERE d.id = ? AND (d.user_id = ? OR ? IN ('ADMIN', 'SECRETAIRE'))
+        """, (document_id, demande_id, current_user["id"], current_user["role"]))
+        
+        row = cursor.fetchone()
         conn.close()
-        raise HTTPException(status_code=404, detail="Demande non trouvée ou accès non autorisé")
-    
-    # Récupérer le document
-    cursor.execute("""
-        SELECT * FROM demande_documents 
-        WHERE id = ? AND demande_id = ?
-    """, (document_id, demande_id))
-    
-    document = cursor.fetchone()
-    conn.close()
-    
-    if not document:
-        raise HTTPException(status_code=404, detail="Document non trouvé")
+        
+        if not row:
+            raise HTTPException(status_code=404, detail="Demande non trouvée ou accès non autorisé")
+        cache_access(current_user, demande_id)
+        if row["id"] is None:
+            raise HTTPException(status_code=404, detail="Document non trouvé")
+        document = cache_document(dict(row))
     
-    file_path = Path(document["file_path"])
+    file_path = Path(document["file_path"].replace("\\", "/"))
     
     # Vérifier que le fichier existe
-    if not file_path.exists():
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Fichier non trouvé sur le serveur")
     
-    # Retourner le fichier
-    return FileResponse(
-        path=str(file_path),
+    # ETag faible (taille, date de modification): pas de lecture complète des gros PDF
+    return cached_file_response(
+        file_path,
+        request.headers,
+        request.method,
+        stat_result=stat_result,
+        media_type=document["content_type"] or "application/octet-stream",
         filename=document["original_filename"],
-        media_type=document["content_type"] or "application/octet-stream"
+        cache_control="private, no-cache",
+        etag=weak_etag(stat_result),
+        zero_copy=True
     )
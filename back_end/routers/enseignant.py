@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Header
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import logging
 import os
 import shutil
 import uuid
@@ -17,51 +18,26 @@ except ImportError:
 from database import get_db
 from models import User, UserRole, Enseignant, Demande
 from schemas import EnseignantComplete, DemandeBase, Demande as DemandeSchema
+from sqlite_pool import get_sqlite_connection, WriterLeaseTimeout
+from auth_cache import invalidate_user
+from security import get_current_principal
+from image_tasks import run_image_task
+from upload_streaming import MAX_PHOTO_SIZE
+from blob_store import receive_derived_upload, add_derived_upload_reference, release_file, discard_temp
+from image_variants import pregenerate_photo_variants, photo_variant_urls
 
 router = APIRouter(prefix="/enseignants", tags=["Enseignants"])
+log = logging.getLogger(__name__)
 
 # Configuration pour l'upload de photos
 UPLOAD_DIR = Path("uploads/images")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-def get_sqlite_connection():
-    """Obtenir une connexion à la base de données SQLite"""
-    conn = sqlite3.connect('gestion_db.db')
-    conn.row_factory = sqlite3.Row  # Pour accéder aux colonnes par nom
-    return conn
-
-def get_current_user_from_token(authorization: str = Header(None)):
-    """Extraire l'utilisateur actuel depuis le token d'autorisation"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token manquant")
-
-    token = authorization.replace("Bearer ", "")
-
-    # Le token a le format: test_token_{user_id}_{role}
-    if token.startswith("test_token_"):
-        parts = token.split("_")
-        if len(parts) >= 3:
-            user_id = parts[2]
-            role = parts[3] if len(parts) > 3 else ""
-
-            # Vérifier dans la base de données SQLite
-            try:
-                conn = get_sqlite_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users WHERE id = ? AND role = ?", (user_id, role.upper()))
-                user_data = cursor.fetchone()
-                conn.close()
-
-                if user_data:
-                    return dict(user_data)
-
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Erreur base de données: {str(e)}")
-
-    raise HTTPException(status_code=401, detail="Token invalide")
+# Conservé pour les appels directs des endpoints: même résolution que la dépendance commune
+get_current_user_from_token = get_current_principal
 
 @router.get("/profile", response_model=EnseignantComplete)
-async def get_profile(
+def get_profile(
     authorization: str = Header(None)
 ):
     """Récupérer le profil complet de l'enseignant connecté"""
@@ -127,7 +103,7 @@ async def get_profile(
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération: {str(e)}")
 
 @router.put("/profile", response_model=EnseignantComplete)
-async def update_profile(
+def update_profile(
     specialite: Optional[str] = Form(None),
     grade: Optional[str] = Form(None),
     nom: Optional[str] = Form(None),
@@ -142,8 +118,8 @@ async def update_profile(
     if current_user["role"] != "ENSEIGNANT":
         raise HTTPException(status_code=403, detail="Accès réservé aux enseignants")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Vérifier que l'enseignant existe
@@ -187,6 +163,8 @@ async def update_profile(
             cursor.execute(f"UPDATE enseignants SET {', '.join(enseignant_updates)} WHERE user_id = ?", enseignant_params)
 
         conn.commit()
+        if user_updates:
+            invalidate_user(current_user["id"])
 
         # Récupérer les données mises à jour
         cursor.execute('''
@@ -221,9 +199,26 @@ async def update_profile(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour: {str(e)}")
+    finally:
+        conn.close()
+
+def resize_profile_photo(file_path: Path):
+    """Redimensionner la photo à 400x400 max sur place (exécuté sur l'exécuteur d'images)"""
+    # Redimensionner l'image si Pillow est disponible
+    if PILLOW_AVAILABLE:
+        try:
+            with Image.open(file_path) as img:
+                # Format d'origine explicite: le fichier temporaire n'a pas d'extension d'image
+                image_format = img.format
+                # Redimensionner à 400x400 max en gardant les proportions
+                img.thumbnail((400, 400), Image.Resampling.LANCZOS)
+                img.save(file_path, format=image_format, optimize=True, quality=85)
+        except Exception as e:
+            log.warning("Erreur lors du redimensionnement: %s", e)
+            # Continuer même si le redimensionnement échoue
 
 @router.post("/profile/upload-photo")
-async def upload_photo(
+def upload_photo(
     photo: UploadFile = File(...),
     authorization: str = Header(None)
 ):
@@ -237,9 +232,10 @@ async def upload_photo(
         conn = get_sqlite_connection()
         cursor = conn.cursor()
 
-        # Vérifier que l'enseignant existe
-        cursor.execute("SELECT id FROM enseignants WHERE user_id = ?", (current_user["id"],))
+        # Vérifier que l'enseignant existe et récupérer l'ancienne photo
+        cursor.execute("SELECT id, photo FROM enseignants WHERE user_id = ?", (current_user["id"],))
         enseignant_data = cursor.fetchone()
+        conn.close()
         if not enseignant_data:
             raise HTTPException(status_code=404, detail="Profil enseignant non trouvé")
 
@@ -254,70 +250,54 @@ async def upload_photo(
             )
 
         # Vérifier la taille du fichier (max 5MB)
-        if photo.size > 5 * 1024 * 1024:
+        if photo.size > MAX_PHOTO_SIZE:
             raise HTTPException(status_code=400, detail="Fichier trop volumineux (max 5MB)")
 
-        # Générer un nom de fichier unique
-        file_extension = photo.filename.split(".")[-1].lower()
-        unique_filename = f"enseignant_{enseignant_id}_{int(uuid.uuid4().hex[:8], 16)}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-
-        # Sauvegarder le fichier
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(photo.file, buffer)
-
-        # Redimensionner l'image si Pillow est disponible
-        if PILLOW_AVAILABLE:
-            try:
-                with Image.open(file_path) as img:
-                    # Redimensionner à 400x400 max en gardant les proportions
-                    img.thumbnail((400, 400), Image.Resampling.LANCZOS)
-                    img.save(file_path, optimize=True, quality=85)
-            except Exception as e:
-                print(f"Erreur lors du redimensionnement: {e}")
-                # Continuer même si le redimensionnement échoue
-
-        # Récupérer l'ancienne photo pour la supprimer
-        cursor.execute("SELECT photo FROM enseignants WHERE id = ?", (enseignant_id,))
-        old_photo_data = cursor.fetchone()
-
-        # Supprimer l'ancienne photo si elle existe
-        if old_photo_data and old_photo_data["photo"]:
-            old_photo_path = Path(old_photo_data["photo"])
-            if old_photo_path.exists():
-                try:
-                    old_photo_path.unlink()
-                except Exception as e:
-                    print(f"Erreur lors de la suppression de l'ancienne photo: {e}")
+        file_extension = "." + photo.filename.split(".")[-1].lower()
+
+        # Hachage et redimensionnement sur l'exécuteur d'images, hors transaction
+        # (redimensionnement évité si cette photo a déjà été reçue)
+        received = run_image_task(receive_derived_upload, photo, MAX_PHOTO_SIZE, "profile_400x400", resize_profile_photo)
 
         # Mettre à jour le chemin de la photo dans la base de données
-        cursor.execute("UPDATE enseignants SET photo = ? WHERE id = ?", (str(file_path), enseignant_id))
-        conn.commit()
-        conn.close()
+        conn = get_sqlite_connection(write=True)
+        try:
+            file_path = add_derived_upload_reference(conn, received, file_extension)
+            # Rendre la référence sur l'ancienne photo (relue sous le verrou d'écriture)
+            row = conn.execute("SELECT photo FROM enseignants WHERE id = ?", (enseignant_id,)).fetchone()
+            release_file(conn, row["photo"] if row else None)
+            conn.execute("UPDATE enseignants SET photo = ? WHERE id = ?", (file_path, enseignant_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            discard_temp(received["tmp_path"])
+            raise
+        finally:
+            conn.close()
+
+        # Miniatures avatar/list/profile (WebP + JPEG)
+        run_image_task(pregenerate_photo_variants, file_path)
 
         return {
             "message": "Photo téléchargée avec succès",
-            "photo_url": f"/uploads/images/{unique_filename}"
+            "photo_url": f"/{file_path}",
+            "photo_variants": photo_variant_urls(file_path)
         }
 
+    except (HTTPException, WriterLeaseTimeout):
+        raise
     except Exception as e:
-        # Nettoyer le fichier en cas d'erreur
-        if 'file_path' in locals() and file_path.exists():
-            try:
-                file_path.unlink()
-            except:
-                pass
         raise HTTPException(status_code=500, detail=f"Erreur lors du téléchargement: {str(e)}")
 
 @router.get("/profil")  # Endpoint avec le nom français pour compatibilité
-async def get_profil(
+def get_profil(
     authorization: str = Header(None)
 ):
     """Récupérer le profil complet de l'enseignant connecté (endpoint français)"""
-    return await get_profile(authorization)
+    return get_profile(authorization)
 
 @router.delete("/profile/photo")
-async def delete_photo(
+def delete_photo(
     authorization: str = Header(None)
 ):
     """Supprimer la photo de profil de l'enseignant connecté"""
@@ -326,8 +306,8 @@ async def delete_photo(
     if current_user["role"] != "ENSEIGNANT":
         raise HTTPException(status_code=403, detail="Accès réservé aux enseignants")
 
+    conn = get_sqlite_connection(write=True)
     try:
-        conn = get_sqlite_connection()
         cursor = conn.cursor()
 
         # Récupérer les informations de l'enseignant et sa photo actuelle
@@ -339,10 +319,8 @@ async def delete_photo(
         if not enseignant_data["photo"]:
             raise HTTPException(status_code=404, detail="Aucune photo à supprimer")
 
-        # Supprimer le fichier physique
-        photo_path = Path(enseignant_data["photo"])
-        if photo_path.exists():
-            photo_path.unlink()
+        # Rendre la référence sur le fichier (blob partagé ou ancien fichier)
+        release_file(conn, enseignant_data["photo"])
 
         # Supprimer la référence dans la base de données
         cursor.execute("UPDATE enseignants SET photo = NULL WHERE id = ?", (enseignant_data["id"],))
@@ -353,3 +331,5 @@ async def delete_photo(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
+    finally:
+        conn.close()
@@ -0,0 +1,76 @@
+import asyncio
+import os
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from security import EVENT_TICKET_SECONDS, create_event_ticket, get_current_principal, get_event_ticket_principal
+from event_hub import event_hub
+
+router = APIRouter(tags=["Événements"])
+
+# Commentaire SSE envoyé aux connexions inactives (proxys, détection des clients partis)
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+# Délai de reconnexion conseillé au navigateur (EventSource)
+EVENT_RETRY_MS = 5000
+
+
+def get_events_principal(authorization: str = Header(None), ticket: Optional[str] = Query(None)) -> dict:
+    """Dépendance synchrone (pool de threads): la vérification en base reste hors de la boucle"""
+    return get_current_principal(authorization) if authorization else get_event_ticket_principal(ticket)
+
+
+@router.post("/events/ticket")
+def create_events_ticket(current_user: dict = Depends(get_current_principal)):
+    """Ticket court (EVENT_TICKET_SECONDS) pour ouvrir /events depuis EventSource"""
+    return {"ticket": create_event_ticket(current_user), "expires_in": EVENT_TICKET_SECONDS}
+
+
+@router.get("/events")
+async def stream_events(
+    current_user: dict = Depends(get_events_principal),
+    last_event_id: Optional[str] = Header(None),
+    since: Optional[str] = Query(None),
+):
+    """Flux Server-Sent Events des demandes: demande.created, demande.status_changed, demande.deleted
+
+    EventSource ne permet pas d'envoyer d'en-tête: il s'authentifie avec un
+    ticket de POST /events/ticket, jamais avec le JWT d'accès (journaux,
+    historique). Après une reconnexion, les événements manqués sont rejoués
+    (Last-Event-ID, ou since quand le client rouvre le flux avec un nouveau
+    ticket); s'ils ne sont plus disponibles, un événement "reset" demande au
+    client de recharger ses listes.
+    """
+    last_event_id = last_event_id or since
+
+    async def stream():
+        # Abonnement avant la reprise: un événement publié entre les deux est reçu une seule fois
+        subscriber = event_hub.subscribe(current_user["id"], current_user["role"])
+        last_seq = 0
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n".encode()
+            if last_event_id:
+                missed = event_hub.replay(subscriber, last_event_id)
+                if missed is None:
+                    yield b"event: reset\ndata: {}\n\n"
+                else:
+                    for event in missed:
+                        last_seq = event["seq"]
+                        yield event["frame"]
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if subscriber.closed:
+                    break
+                if event["seq"] > last_seq:
+                    yield event["frame"]
+        finally:
+            event_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,42 @@
+import logging
+from fastapi import APIRouter, HTTPException, Header, Request
+from pathlib import Path
+from image_variants import (
+    PHOTO_SIZES, PHOTO_FORMATS, resolve_photo_source, variant_path, select_format, generate_photo_variants
+)
+from image_tasks import run_image_task
+from file_responses import cached_file_response
+
+router = APIRouter(prefix="/photos", tags=["Photos"])
+log = logging.getLogger(__name__)
+
+@router.get("/{size}/{photo_path:path}")
+def get_photo_variant(
+    size: str,
+    photo_path: str,
+    request: Request,
+    accept: str = Header(None)
+):
+    """Photo à la taille demandée (avatar, list, profile), en WebP si le navigateur l'accepte, sinon en JPEG"""
+    if size not in PHOTO_SIZES:
+        raise HTTPException(status_code=404, detail=f"Taille inconnue: {size}")
+
+    source = resolve_photo_source(photo_path)
+    if source is None or not Path(source).is_file():
+        raise HTTPException(status_code=404, detail="Photo non trouvée")
+
+    image_format = select_format(accept)
+    path = variant_path(source, size, image_format)
+    if not path.exists():
+        # Anciennes photos: variantes produites au premier accès, sur l'exécuteur d'images
+        try:
+            run_image_task(generate_photo_variants, source)
+        except Exception as e:
+            log.warning("Miniatures impossibles pour %s: %s", source, e)
+    if not path.exists():
+        # Format non réductible (ex: SVG) ou illisible: photo d'origine
+        return cached_file_response(source, request.headers, request.method, headers={"Vary": "Accept"})
+
+    # Immuable (Cache-Control) quand la photo d'origine est un blob: son hash est dans l'URL
+    return cached_file_response(path, request.headers, request.method, media_type=f"image/{image_format}",
+                                headers={"Vary": "Accept"})
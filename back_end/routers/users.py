@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List
 from database import get_db
 from auth import get_current_active_user, get_password_hash
+from auth_cache import invalidate_user, revoke_user
 from models import User, UserRole, Enseignant, Demande
 from schemas import User as UserSchema, UserUpdate, EnseignantCreateComplete, EnseignantUpdateComplete, EnseignantComplete, EnseignantUpdateComplete, Demande as DemandeSchema
 
@@ -57,6 +58,10 @@ async def update_user(
         setattr(user, field, value)
 
     db.commit()
+    if update_data.get("is_active") is False:
+        revoke_user(user_id)
+    else:
+        invalidate_user(user_id)
     db.refresh(user)
     return user
 
@@ -76,6 +81,7 @@ async def delete_user(
 
     db.delete(user)
     db.commit()
+    revoke_user(user_id)
     return {"message": "Utilisateur supprimé avec succès"}
 
 @router.get("/role/{role}", response_model=List[UserSchema])
@@ -217,6 +223,7 @@ async def update_enseignant(
                 setattr(enseignant, field, update_data[field])
 
         db.commit()  # Valider la transaction
+        invalidate_user(user.id)
 
         # Rafraîchir les objets pour obtenir toutes les données
         db.refresh(user)
@@ -274,10 +281,12 @@ async def delete_enseignant(
 
     try:
         # Supprimer l'enseignant et l'utilisateur dans une transaction
+        user_id = enseignant.user_id
         db.delete(enseignant)
         if user:
             db.delete(user)
         db.commit()
+        revoke_user(user_id)
         return {"message": "Enseignant supprimé avec succès"}
 
     except Exception as e:
@@ -0,0 +1,218 @@
+"""
+Authentification commune à tous les endpoints: une seule dépendance FastAPI.
+
+Seuls les JWT signés émis par /auth/login sont acceptés (claims user_id, role,
+email, nom, prenom). Au premier usage du token (absent du cache), une lecture
+par clé primaire confirme que l'utilisateur existe, est actif et a toujours ce
+rôle: un compte supprimé ou désactivé est refusé par tous les processus, même
+après un redémarrage. Ensuite l'autorisation se fait sur les claims, sans
+requête SQL. Tout autre token reçoit un 401.
+
+Développement seulement: AUTH_ALLOW_TEST_ACCOUNTS=1 réactive les comptes de
+test historiques absents de la base (FALLBACK_TEST_USERS) et l'ancien format
+non signé test_token_{user_id}_{role}. Désactivé par défaut.
+
+Les tokens résolus sont mis en cache (auth_cache) jusqu'à leur expiration.
+
+Le flux /events (EventSource, sans en-tête possible) s'ouvre avec un ticket:
+JWT de EVENT_TICKET_SECONDS secondes, d'audience "events", refusé partout
+ailleurs; le JWT d'accès ne passe jamais dans une URL.
+
+Usage:
+    current_user: dict = Depends(get_current_principal)
+    current_user: dict = Depends(require_roles("ADMIN", "SECRETAIRE"))
+"""
+
+import os
+import time
+
+from fastapi import Depends, Header, HTTPException
+from jose import JWTError, jwt
+
+from auth_cache import AUTH_CACHE_TTL, get_cached_principal, cache_principal
+from config import settings
+from sqlite_pool import get_sqlite_connection
+
+PRINCIPAL_SCOPE = "principal"
+EVENT_TICKET_AUDIENCE = "events"
+EVENT_TICKET_SECONDS = 60
+LEGACY_TOKEN_PREFIX = "test_token_"
+
+# Comptes de test et tokens non signés: jamais en production
+AUTH_ALLOW_TEST_ACCOUNTS = os.environ.get("AUTH_ALLOW_TEST_ACCOUNTS", "0") == "1"
+
+# Comptes de test historiques (AUTH_ALLOW_TEST_ACCOUNTS), si l'utilisateur n'est pas en base
+FALLBACK_TEST_USERS = {
+    1: {"email": "admin@univ.ma", "nom": "Alami", "prenom": "Hassan", "role": "ADMIN"},
+    2: {"email": "secretaire@univ.ma", "nom": "Benali", "prenom": "Fatima", "role": "SECRETAIRE"},
+    3: {"email": "enseignant@univ.ma", "nom": "Tazi", "prenom": "Ahmed", "role": "ENSEIGNANT"},
+    4: {"email": "fonctionnaire@univ.ma", "nom": "Karam", "prenom": "Aicha", "role": "FONCTIONNAIRE"},
+}
+
+
+def _unauthorized(detail: str = "Token invalide"):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def _principal(user_id, email, nom, prenom, role) -> dict:
+    return {
+        "id": int(user_id),
+        "email": email,
+        "nom": nom,
+        "prenom": prenom,
+        "role": role.upper(),
+        "is_active": True,
+    }
+
+
+def create_user_token(user) -> str:
+    """Émettre un JWT signé portant l'identité et le rôle de l'utilisateur"""
+    now = int(time.time())
+    claims = {
+        "sub": user["email"],
+        "user_id": int(user["id"]),
+        "role": user["role"].upper(),
+        "email": user["email"],
+        "nom": user["nom"],
+        "prenom": user["prenom"],
+        "iat": now,
+        "exp": now + settings.access_token_expire_minutes * 60,
+    }
+    return jwt.encode(claims, settings.secret_key, algorithm=settings.algorithm)
+
+
+def _load_user(column: str, value, role: str = None):
+    conn = get_sqlite_connection()
+    try:
+        if role is None:
+            row = conn.execute(
+                f"SELECT id, email, nom, prenom, role FROM users WHERE {column} = ? AND is_active = 1",
+                (value,)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                f"SELECT id, email, nom, prenom, role FROM users WHERE {column} = ? AND role = ? AND is_active = 1",
+                (value, role)
+            ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return _principal(row["id"], row["email"], row["nom"], row["prenom"], row["role"])
+
+
+def _claims_still_valid(user_id: int, role: str) -> bool:
+    """Utilisateur toujours actif avec le rôle porté par le token (index de clé primaire)"""
+    conn = get_sqlite_connection()
+    try:
+        row = conn.execute("SELECT role, is_active FROM users WHERE id = ?", (user_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        if not AUTH_ALLOW_TEST_ACCOUNTS:
+            return False
+        fallback = FALLBACK_TEST_USERS.get(user_id)
+        return fallback is not None and fallback["role"] == role.upper()
+    return bool(row["is_active"]) and (row["role"] or "").upper() == role.upper()
+
+
+def _resolve_jwt(token: str):
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        raise _unauthorized()
+
+    user_id = payload.get("user_id")
+    role = payload.get("role")
+    if user_id is not None and role:
+        if not _claims_still_valid(int(user_id), role):
+            raise _unauthorized("Token révoqué")
+        # Autorisation sur les claims: aucune requête SQL
+        principal = _principal(user_id, payload.get("email") or payload.get("sub"),
+                               payload.get("nom", ""), payload.get("prenom", ""), role)
+    elif payload.get("sub"):
+        # Ancien JWT (routers/auth.py) sans claims: résolution par email
+        principal = _load_user("email", payload["sub"])
+    else:
+        principal = None
+
+    if principal is None:
+        return None
+    ttl = min(AUTH_CACHE_TTL, payload["exp"] - time.time()) if "exp" in payload else None
+    return cache_principal(PRINCIPAL_SCOPE, token, principal, ttl=ttl)
+
+
+def _resolve_legacy_token(token: str):
+    """Ancien token non signé (AUTH_ALLOW_TEST_ACCOUNTS seulement)"""
+    parts = token.split("_")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    user_id = int(parts[2])
+    role = parts[3].upper()
+
+    principal = _load_user("id", user_id, role)
+    if principal is None:
+        fallback = FALLBACK_TEST_USERS.get(user_id)
+        if fallback is None or fallback["role"] != role:
+            return None
+        principal = _principal(user_id, fallback["email"], fallback["nom"], fallback["prenom"], role)
+    return cache_principal(PRINCIPAL_SCOPE, token, principal)
+
+
+def create_event_ticket(principal: dict) -> str:
+    """Ticket d'abonnement à /events pour un utilisateur déjà authentifié"""
+    now = int(time.time())
+    claims = {
+        "aud": EVENT_TICKET_AUDIENCE,
+        "user_id": principal["id"],
+        "role": principal["role"],
+        "iat": now,
+        "exp": now + EVENT_TICKET_SECONDS,
+    }
+    return jwt.encode(claims, settings.secret_key, algorithm=settings.algorithm)
+
+
+def get_event_ticket_principal(ticket: str) -> dict:
+    """Utilisateur d'un ticket /events (vérifié en base: un compte révoqué entre-temps est refusé)"""
+    if not ticket:
+        raise _unauthorized("Ticket manquant")
+    try:
+        payload = jwt.decode(ticket, settings.secret_key, algorithms=[settings.algorithm],
+                             audience=EVENT_TICKET_AUDIENCE, options={"require_aud": True})
+    except JWTError:
+        raise _unauthorized("Ticket invalide")
+    user_id, role = payload.get("user_id"), payload.get("role")
+    if user_id is None or not role or not _claims_still_valid(int(user_id), role):
+        raise _unauthorized("Ticket invalide")
+    return {"id": int(user_id), "role": role.upper()}
+
+
+def get_current_principal(authorization: str = Header(None)) -> dict:
+    """Utilisateur authentifié (id, email, nom, prenom, role, is_active) à partir du header Authorization"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise _unauthorized("Token manquant")
+
+    token = authorization.replace("Bearer ", "")
+    principal = get_cached_principal(PRINCIPAL_SCOPE, token)
+    if principal is not None:
+        return principal
+
+    if token.startswith(LEGACY_TOKEN_PREFIX):
+        principal = _resolve_legacy_token(token) if AUTH_ALLOW_TEST_ACCOUNTS else None
+    else:
+        principal = _resolve_jwt(token)
+    if principal is None:
+        raise _unauthorized()
+    return principal
+
+
+def require_roles(*roles, detail: str = "Accès refusé"):
+    """Dépendance qui exige l'un des rôles donnés (vérifié sur le token, sans SQL)"""
+    allowed = {role.upper() for role in roles}
+
+    def dependency(current_user: dict = Depends(get_current_principal)) -> dict:
+        if current_user["role"] not in allowed:
+            raise HTTPException(status_code=403, detail=detail)
+        return current_user
+
+    return dependency
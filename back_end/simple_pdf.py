@@ -0,0 +1,82 @@
+"""
+Écriture de PDF texte simples (A4, polices standard Helvetica), sans dépendance.
+
+Suffisant pour les attestations: titres, paragraphes avec retour à la ligne
+automatique et pagination. Les caractères hors Windows-1252 (emojis) sont omis.
+"""
+
+import textwrap
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 56
+
+# style -> (police, taille, interligne, largeur en caractères pour le retour à la ligne)
+STYLES = {
+    "title": ("F2", 18, 28, 50),
+    "heading": ("F2", 12, 20, 80),
+    "body": ("F1", 11, 16, 90),
+    "small": ("F1", 9, 13, 110),
+}
+
+
+def _pdf_string(text: str) -> bytes:
+    data = text.encode("cp1252", errors="ignore")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _layout(lines):
+    """Pages de (police, taille, x, y, texte) à partir de (style, texte)"""
+    pages, current = [], []
+    y = PAGE_HEIGHT - MARGIN
+    for style, text in lines:
+        font, size, leading, width = STYLES[style]
+        wrapped = []
+        for paragraph in str(text).split("\n"):
+            wrapped.extend(textwrap.wrap(paragraph, width) or [""])
+        for line in wrapped:
+            if y - leading < MARGIN:
+                pages.append(current)
+                current, y = [], PAGE_HEIGHT - MARGIN
+            y -= leading
+            current.append((font, size, MARGIN, y, line))
+    pages.append(current)
+    return pages
+
+
+def text_pdf(lines, title: str = "") -> bytes:
+    """PDF d'une suite de lignes (style, texte), style parmi STYLES"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, complété quand les pages sont connues
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Title " + _pdf_string(title) + b" /Producer (Gestion RH) >>",
+    ]
+    page_ids = []
+    for page in _layout(lines):
+        content = b"\n".join(
+            b"BT /%s %d Tf %d %d Td %s Tj ET" % (font.encode(), size, x, y, _pdf_string(text))
+            for font, size, x, y, text in page if text
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%EOF\n" % (
+        len(objects) + 1, xref_offset)
+    return bytes(output)
@@ -0,0 +1,304 @@
+"""
+Gestionnaire de connexions SQLite partagé par main.py et les routeurs.
+
+- une connexion de lecture par thread (PRAGMA query_only), réutilisée d'une requête à l'autre
+- une connexion d'écriture unique, sérialisée par un verrou réentrant par thread
+  (libérable depuis un autre thread: filet de sécurité __del__ des handlers threadés);
+  attente bornée par WRITER_LEASE_TIMEOUT, au-delà WriterLeaseTimeout (503 dans main.py)
+- PRAGMA configurés une seule fois, à l'ouverture de chaque connexion
+- métriques du pool exposées via get_pool_metrics()
+- chaque execute/executemany est chronométré (InstrumentedCursor) pour /metrics
+  et profilé par empreinte de requête (query_profiler.py)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import record_query
+from query_profiler import add_to_statement, start_statement
+
+DB_PATH = os.environ.get("SQLITE_DB_PATH", "gestion_db.db")
+
+# Délai d'attente sur un verrou SQLite (secondes), identique à l'ancien timeout de main.py
+BUSY_TIMEOUT = 20.0
+# Attente maximale du bail d'écriture (secondes): un écrivain bloqué ne retient pas tous les handlers
+WRITER_LEASE_TIMEOUT = float(os.environ.get("SQLITE_WRITER_LEASE_TIMEOUT", str(BUSY_TIMEOUT)))
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",  # ~20 Mo de cache de pages par connexion
+    "PRAGMA mmap_size=268435456",  # 256 Mo mappés en mémoire
+    f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class WriterLeaseTimeout(TimeoutError):
+    """Connexion d'écriture toujours occupée après WRITER_LEASE_TIMEOUT secondes"""
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Curseur instrumenté: durée jusqu'à la première ligne pour /metrics, et profil
+    par empreinte (temps de lecture et lignes compris) pour query_profiler"""
+
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            record_query(sql, elapsed)
+            self._statement = start_statement(self.connection, sql, parameters, elapsed, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        # Premier jeu de paramètres pour EXPLAIN, si la séquence le permet sans la consommer
+        sample = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            record_query(sql, elapsed)
+            self._statement = start_statement(self.connection, sql, sample, elapsed, max(self.rowcount, 0))
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._statement is not None:
+            add_to_statement(self._statement, time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._statement is not None:
+            add_to_statement(self._statement, time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._statement is not None:
+            add_to_statement(self._statement, time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        if self._statement is not None:
+            add_to_statement(self._statement, time.perf_counter() - started, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connexion dont les curseurs, y compris ceux de conn.execute(), sont instrumentés"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class PooledConnection:
+    """Connexion prêtée par le pool; close() la rend au pool au lieu de la fermer"""
+
+    __slots__ = ("_conn", "_pool", "_write", "_released")
+
+    def __init__(self, conn, pool, write):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_write", write)
+        object.__setattr__(self, "_released", False)
+
+    def __getattr__(self, name):
+        if name in PooledConnection.__slots__:
+            raise AttributeError(name)
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # ex: conn.row_factory = sqlite3.Row
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        self.close()
+        return False
+
+    def close(self):
+        if not self._released:
+            object.__setattr__(self, "_released", True)
+            self._pool._release(self)
+
+    def __del__(self):
+        # Filet de sécurité pour les chemins d'erreur qui ne ferment pas la connexion
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class SQLitePool:
+    """Pool de connexions SQLite: lecteurs par thread, écrivain unique sérialisé"""
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._writer = None
+        self._writer_cond = threading.Condition()
+        self._writer_owner = None
+        self._writer_depth = 0
+        self._init_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._readers = []
+        self._stats = {
+            "reader_connections_opened": 0,
+            "writer_connections_opened": 0,
+            "reader_leases": 0,
+            "writer_leases": 0,
+            "in_use": 0,
+            "writer_wait_seconds": 0.0,
+            "writer_max_wait_seconds": 0.0,
+            "rollbacks_on_release": 0,
+            "writer_timeouts": 0,
+        }
+
+    def _incr(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _open(self, read_only: bool, check_same_thread: bool = True):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=check_same_thread,
+                               factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _get_writer(self):
+        if self._writer is None:
+            with self._init_lock:
+                if self._writer is None:
+                    conn = self._open(read_only=False, check_same_thread=False)
+                    # Le mode WAL est persistant dans le fichier: un seul réglage suffit
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    self._writer = conn
+                    self._incr("writer_connections_opened")
+        return self._writer
+
+    def _get_reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # S'assurer que la base est en WAL avant d'ouvrir le premier lecteur
+            self._get_writer()
+            conn = self._open(read_only=True)
+            self._local.conn = conn
+            with self._stats_lock:
+                self._readers.append(conn)
+                self._stats["reader_connections_opened"] += 1
+        return conn
+
+    def connection(self, write: bool = False) -> PooledConnection:
+        """Emprunter une connexion (lecture par défaut, écriture si write=True)"""
+        if not write:
+            conn = self._get_reader()
+            with self._stats_lock:
+                self._stats["reader_leases"] += 1
+                self._stats["in_use"] += 1
+            return PooledConnection(conn, self, False)
+
+        conn = self._get_writer()
+        started = time.perf_counter()
+        try:
+            self._acquire_writer()
+        except WriterLeaseTimeout:
+            self._incr("writer_timeouts")
+            raise
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self._stats["writer_leases"] += 1
+            self._stats["in_use"] += 1
+            self._stats["writer_wait_seconds"] += waited
+            if waited > self._stats["writer_max_wait_seconds"]:
+                self._stats["writer_max_wait_seconds"] = waited
+        return PooledConnection(conn, self, True)
+
+    def _acquire_writer(self, timeout: float = None):
+        # Réentrant pour le thread propriétaire (bail d'écriture imbriqué)
+        me = threading.get_ident()
+        timeout = WRITER_LEASE_TIMEOUT if timeout is None else timeout
+        with self._writer_cond:
+            if not self._writer_cond.wait_for(lambda: self._writer_owner in (None, me), timeout):
+                raise WriterLeaseTimeout(f"Connexion d'écriture occupée depuis plus de {timeout:g} s")
+            self._writer_owner = me
+            self._writer_depth += 1
+
+    def _release(self, lease: PooledConnection):
+        self._incr("in_use", -1)
+        if not lease._write:
+            return
+        with self._writer_cond:
+            self._writer_depth -= 1
+            if self._writer_depth > 0:
+                return
+            try:
+                # Une transaction laissée ouverte (erreur avant commit) est annulée
+                # pour ne pas bloquer le prochain écrivain
+                if lease._conn.in_transaction:
+                    lease._conn.rollback()
+                    self._incr("rollbacks_on_release")
+            finally:
+                self._writer_owner = None
+                self._writer_cond.notify()
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["reader_connections"] = len(self._readers)
+        stats["db_path"] = self.db_path
+        stats["writer_open"] = self._writer is not None
+        return stats
+
+    def close_all(self):
+        """Fermer toutes les connexions (arrêt de l'application ou tests)"""
+        with self._stats_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Connexion créée dans un autre thread: fermée à la fin de celui-ci
+                pass
+        self._local = threading.local()
+        with self._writer_cond:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+pool = SQLitePool()
+
+
+def get_sqlite_connection(write: bool = False) -> PooledConnection:
+    """Obtenir une connexion SQLite depuis le pool partagé"""
+    return pool.connection(write=write)
+
+
+def get_pool_metrics() -> dict:
+    """Métriques du pool de connexions"""
+    return pool.metrics()
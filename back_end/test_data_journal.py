@@ -0,0 +1,41 @@
+"""Journal des données JSON: aucune mutation perdue autour de la compaction"""
+
+from data_journal import DataJournal
+
+SNAPSHOTS = {"demandes": "demandes.json"}
+
+
+def _reload(tmp_path) -> dict:
+    return DataJournal(tmp_path, SNAPSHOTS, compact_every=3).load({})["demandes"]
+
+
+def test_reload_after_exactly_compact_every_mutations(tmp_path):
+    journal = DataJournal(tmp_path, SNAPSHOTS, compact_every=3)
+    stores = journal.load({})
+    for key in (1, 2, 3):
+        journal.set("demandes", key, {"id": key})
+
+    # La 3e mutation déclenche la compaction: elle doit être dans le snapshot
+    assert journal.stats()["pending_mutations"] == 0
+    assert stores["demandes"] == {"1": {"id": 1}, "2": {"id": 2}, "3": {"id": 3}}
+    assert _reload(tmp_path) == {"1": {"id": 1}, "2": {"id": 2}, "3": {"id": 3}}
+
+
+def test_delete_at_compaction_threshold(tmp_path):
+    journal = DataJournal(tmp_path, SNAPSHOTS, compact_every=3)
+    stores = journal.load({})
+    journal.set("demandes", 1, {"id": 1})
+    journal.set("demandes", 2, {"id": 2})
+    journal.delete("demandes", 1)
+
+    assert stores["demandes"] == {"2": {"id": 2}}
+    assert _reload(tmp_path) == {"2": {"id": 2}}
+
+
+def test_keys_are_str_in_memory(tmp_path):
+    journal = DataJournal(tmp_path, SNAPSHOTS, compact_every=100)
+    stores = journal.load({})
+    journal.set("demandes", 7, {"id": 7})
+
+    assert list(stores["demandes"]) == ["7"]
+    assert _reload(tmp_path) == stores["demandes"]
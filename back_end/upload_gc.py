@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Nettoyage en arrière-plan des fichiers uploadés qui ne sont plus référencés.
+
+Un passage parcourt uploads/ (sauf uploads/attestations) par lots: pour chaque
+lot, une seule requête (index sur enseignants.photo, fonctionnaires.photo,
+demande_documents.file_path et blobs.path) dit quels fichiers sont encore
+référencés. Les autres, plus vieux que UPLOAD_GC_MIN_AGE (uploads en cours),
+sont déplacés en quarantaine dans uploads_quarantine/<date>/, hors du montage
+statique. Après UPLOAD_GC_QUARANTINE_DAYS jours ils sont supprimés, sauf s'ils
+sont de nouveau référencés entre-temps: ils sont alors remis en place. Les
+miniatures (uploads/thumbs/<photo>/...) suivent leur photo d'origine.
+
+Le travail se fait par petits lots avec une pause entre chaque lot, sur une
+connexion de lecture: les requêtes ne sont jamais bloquées.
+
+Rapport à blanc (rien n'est déplacé), depuis back_end/:
+    python upload_gc.py
+Nettoyage effectif:
+    python upload_gc.py --apply
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlite_pool import get_sqlite_connection
+from blob_store import purge_unreferenced_blobs
+from image_variants import variant_source
+
+log = logging.getLogger(__name__)
+
+UPLOAD_ROOT = Path("uploads")
+QUARANTINE_ROOT = Path(os.environ.get("UPLOAD_GC_QUARANTINE_DIR", "uploads_quarantine"))
+# Dossiers de uploads/ jamais nettoyés (attestations générées et leur journal)
+EXCLUDED_DIRS = {"attestations"}
+
+# Intervalle entre deux passages planifiés (secondes, 0 = désactivé)
+UPLOAD_GC_INTERVAL = float(os.environ.get("UPLOAD_GC_INTERVAL", str(6 * 3600)))
+# Un fichier plus récent peut appartenir à un upload pas encore validé en base
+UPLOAD_GC_MIN_AGE = float(os.environ.get("UPLOAD_GC_MIN_AGE", "3600"))
+UPLOAD_GC_QUARANTINE_DAYS = int(os.environ.get("UPLOAD_GC_QUARANTINE_DAYS", "7"))
+# 64 fichiers x 3 formes x 4 colonnes = 768 paramètres (< 999, limite des anciens SQLite)
+UPLOAD_GC_BATCH_SIZE = 64
+UPLOAD_GC_BATCH_PAUSE = 0.05
+REPORT_MAX_FILES = 200
+
+QUARANTINE_DATE_FORMAT = "%Y%m%d"
+
+
+def _reference_forms(path: str):
+    # Formes présentes en base: uploads/x, /uploads/x (URLs des photos), uploads\x (Windows)
+    return (path, f"/{path}", path.replace("/", "\\"))
+
+
+def _normalize(value: str) -> str:
+    return str(value).replace("\\", "/").lstrip("/")
+
+
+def iter_upload_files(root: Path = UPLOAD_ROOT):
+    """Parcourir uploads/ récursivement: (chemin posix relatif, taille, mtime)"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if directory == root and entry.name in EXCLUDED_DIRS:
+                    continue
+                stack.append(Path(entry.path))
+            elif entry.is_file(follow_symlinks=False):
+                if entry.name == ".gitkeep":
+                    continue
+                stat = entry.stat()
+                yield Path(entry.path).as_posix(), stat.st_size, stat.st_mtime
+
+
+def referenced_paths(conn, paths) -> set:
+    """Sous-ensemble de paths encore référencé en base (une requête indexée par lot)"""
+    forms = [form for path in paths for form in _reference_forms(path)]
+    placeholders = ", ".join("?" for _ in forms)
+    rows = conn.execute(f'''
+        SELECT photo AS ref FROM enseignants WHERE photo IN ({placeholders})
+        UNION
+        SELECT photo FROM fonctionnaires WHERE photo IN ({placeholders})
+        UNION
+        SELECT file_path FROM demande_documents WHERE file_path IN ({placeholders})
+        UNION
+        SELECT path FROM blobs WHERE path IN ({placeholders}) AND ref_count > 0
+    ''', forms * 4).fetchall()
+    return {_normalize(row["ref"]) for row in rows}
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class UploadSweeper:
+    """Nettoyeur incrémental des fichiers orphelins, planifié dans un thread de fond"""
+
+    def __init__(self, extra_references=None, interval: float = UPLOAD_GC_INTERVAL):
+        # extra_references(): chemins référencés hors SQLite (ex: documents des stores JSON)
+        self.extra_references = extra_references or (lambda: ())
+        self.interval = interval
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+
+    def _extra_references(self) -> set:
+        return {_normalize(path) for path in self.extra_references()}
+
+    def sweep(self, dry_run: bool = False, now: float = None) -> dict:
+        """Un passage complet: quarantaine des orphelins, purge des quarantaines expirées"""
+        with self._run_lock:
+            now = time.time() if now is None else now
+            report = {
+                "dry_run": dry_run,
+                "started_at": datetime.fromtimestamp(now).isoformat(),
+                "scanned": 0,
+                "referenced": 0,
+                "too_recent": 0,
+                "orphans": 0,
+                "orphan_bytes": 0,
+                "orphan_files": [],
+                "quarantined": 0,
+                "deleted": 0,
+                "restored": 0,
+                "purged_blobs": 0,
+            }
+            if not dry_run:
+                report["purged_blobs"] = purge_unreferenced_blobs()
+
+            extra = self._extra_references()
+            for batch in _batches(iter_upload_files(), UPLOAD_GC_BATCH_SIZE):
+                if self._stop.is_set():
+                    break
+                # Une miniature (uploads/thumbs/...) vit tant que sa photo d'origine est référencée
+                owners = {path: variant_source(path) or path for path, _, _ in batch}
+                conn = get_sqlite_connection()
+                try:
+                    referenced = referenced_paths(conn, list(set(owners.values())))
+                finally:
+                    conn.close()
+
+                orphans = []
+                for path, size, mtime in batch:
+                    report["scanned"] += 1
+                    owner = owners[path]
+                    if owner in referenced or owner in extra:
+                        report["referenced"] += 1
+                        continue
+                    if now - mtime < UPLOAD_GC_MIN_AGE:
+                        report["too_recent"] += 1
+                        continue
+                    report["orphans"] += 1
+                    report["orphan_bytes"] += size
+                    if len(report["orphan_files"]) < REPORT_MAX_FILES:
+                        report["orphan_files"].append({"path": path, "size": size})
+                    orphans.append(path)
+                if orphans and not dry_run:
+                    report["quarantined"] += self._quarantine_batch(orphans, now)
+                time.sleep(UPLOAD_GC_BATCH_PAUSE)
+
+            if not dry_run:
+                deleted, restored = self._expire_quarantine(now, extra)
+                report["deleted"] = deleted
+                report["restored"] = restored
+
+            self.last_report = report
+            return report
+
+    def _quarantine_batch(self, paths, now: float) -> int:
+        blob_prefix = UPLOAD_ROOT.as_posix() + "/blobs/"
+        for path in paths:
+            if not path.startswith(blob_prefix):
+                self._quarantine(path, now)
+        blob_paths = [path for path in paths if path.startswith(blob_prefix)]
+        if not blob_paths:
+            return len(paths)
+        # Un blob peut être de nouveau référencé par un upload: revérifier et déplacer
+        # sous le verrou d'écriture, qui sérialise toutes les prises de référence
+        conn = get_sqlite_connection(write=True)
+        try:
+            referenced = referenced_paths(conn, blob_paths)
+            moved = [path for path in blob_paths if path not in referenced]
+            for path in moved:
+                self._quarantine(path, now)
+        finally:
+            conn.close()
+        return len(paths) - len(blob_paths) + len(moved)
+
+    def _quarantine(self, path: str, now: float):
+        day = datetime.fromtimestamp(now).strftime(QUARANTINE_DATE_FORMAT)
+        target = QUARANTINE_ROOT / day / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(path, target)
+        except OSError:
+            shutil.move(path, target)
+
+    def _expire_quarantine(self, now: float, extra: set):
+        """Supprimer les quarantaines expirées; remettre en place les fichiers de nouveau référencés"""
+        deleted, restored = 0, 0
+        limit = datetime.fromtimestamp(now) - timedelta(days=UPLOAD_GC_QUARANTINE_DAYS)
+        if not QUARANTINE_ROOT.exists():
+            return deleted, restored
+        for day_dir in sorted(QUARANTINE_ROOT.iterdir()):
+            try:
+                day = datetime.strptime(day_dir.name, QUARANTINE_DATE_FORMAT)
+            except ValueError:
+                continue
+            if day > limit:
+                continue
+            files = [
+                (Path(root) / name, (Path(root) / name).relative_to(day_dir).as_posix())
+                for root, _, names in os.walk(day_dir) for name in names
+            ]
+            for batch in _batches(files, UPLOAD_GC_BATCH_SIZE):
+                conn = get_sqlite_connection()
+                try:
+                    referenced = referenced_paths(conn, list({variant_source(original) or original
+                                                              for _, original in batch}))
+                finally:
+                    conn.close()
+                for quarantined, original in batch:
+                    owner = variant_source(original) or original
+                    if (owner in referenced or owner in extra) and not Path(original).exists():
+                        Path(original).parent.mkdir(parents=True, exist_ok=True)
+                        os.replace(quarantined, original)
+                        restored += 1
+                    else:
+                        quarantined.unlink()
+                        deleted += 1
+                time.sleep(UPLOAD_GC_BATCH_PAUSE)
+            shutil.rmtree(day_dir, ignore_errors=True)
+        return deleted, restored
+
+    def _run(self):
+        # Premier passage différé: ne pas ralentir le démarrage
+        while not self._stop.wait(min(self.interval, 60.0) if self.last_report is None else self.interval):
+            try:
+                report = self.sweep()
+                log.info("%d fichier(s) analysé(s), %d mis en quarantaine, %d supprimé(s)",
+                         report["scanned"], report["quarantined"], report["deleted"])
+            except Exception as e:
+                log.exception("Erreur du nettoyage des uploads")
+                self.last_report = {"error": str(e)}
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="upload-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Nettoyage des fichiers uploadés orphelins")
+    parser.add_argument("--apply", action="store_true", help="déplacer/supprimer (sinon rapport à blanc)")
+    args = parser.parse_args()
+
+    # Les documents des stores JSON (DEMANDES_DB) sont aussi des références
+    from main import apply_migrations, upload_sweeper
+
+    apply_migrations()
+    result = upload_sweeper.sweep(dry_run=not args.apply)
+    for orphan in result["orphan_files"]:
+        print(f"  {orphan['path']} ({orphan['size']} octets)")
+    print(f"🧹 [UPLOAD GC] {'Rapport à blanc: ' if result['dry_run'] else ''}"
+          f"{result['scanned']} fichier(s), {result['orphans']} orphelin(s) "
+          f"({result['orphan_bytes'] / 1024:.0f} Ko), {result['too_recent']} trop récent(s), "
+          f"{result['quarantined']} en quarantaine, {result['deleted']} supprimé(s), {result['restored']} restauré(s)")
@@ -0,0 +1,72 @@
+"""
+Écriture en flux des fichiers uploadés: mémoire constante quelle que soit la taille.
+
+Le fichier est copié par blocs dans un fichier temporaire, en calculant son
+SHA-256 au passage. Dès que la taille maximale est dépassée, la copie s'arrête
+et le fichier temporaire est supprimé. Le fichier temporaire est ensuite placé
+dans le stockage par contenu (blob_store) par un renommage atomique: aucun
+fichier partiel n'est jamais visible dans uploads/.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_DEMANDE_DOCUMENT_SIZE = 5 * 1024 * 1024  # 5MB
+MAX_PHOTO_SIZE = 5 * 1024 * 1024  # 5MB
+
+
+def file_too_large(filename: str, max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"Fichier {filename} trop volumineux (max {max_size // (1024 * 1024)}MB)"
+    )
+
+
+def stream_upload_to_temp(upload: UploadFile, directory: Path, max_size: int):
+    """Copier upload par blocs dans un fichier temporaire de directory; retourne (chemin, taille, sha256 hex)"""
+    # Taille annoncée par le multipart déjà reçu: rejet sans rien copier
+    if upload.size is not None and upload.size > max_size:
+        raise file_too_large(upload.filename, max_size)
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".upload_", suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = upload.file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise file_too_large(upload.filename, max_size)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+        raise
+    return Path(tmp_name), size, digest.hexdigest()
+
+
+def hash_file(path: Path):
+    """Taille et SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            digest.update(chunk)
+    return size, digest.hexdigest()
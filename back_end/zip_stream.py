@@ -0,0 +1,93 @@
+"""
+Archive ZIP produite à la volée, en mémoire constante.
+
+stream_zip() est un générateur d'octets pour StreamingResponse: chaque fichier
+est lu par blocs et chaque bloc compressé est envoyé aussitôt (descripteurs de
+données ZIP, pas de retour en arrière dans le flux). Les formats déjà
+compressés (PDF, JPEG, PNG, ...) sont stockés tels quels, les autres compressés.
+"""
+
+import logging
+import zipfile
+from pathlib import Path
+
+from upload_streaming import UPLOAD_CHUNK_SIZE
+
+log = logging.getLogger(__name__)
+
+# Formats déjà compressés: les recompresser coûte du CPU pour rien
+STORED_EXTENSIONS = {
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp",
+    ".zip", ".docx", ".xlsx", ".pptx", ".odt", ".ods",
+}
+
+
+class _ChunkSink:
+    """Fichier en écriture seule, non repositionnable: zipfile y écrit, le générateur vide"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_arcname(arcname: str, used: set) -> str:
+    """Nom dans l'archive, suffixé (2), (3)... si déjà pris"""
+    candidate = arcname
+    stem, suffix = Path(arcname).stem, Path(arcname).suffix
+    parent = str(Path(arcname).parent)
+    counter = 2
+    while candidate.lower() in used:
+        name = f"{stem} ({counter}){suffix}"
+        candidate = name if parent == "." else f"{parent}/{name}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def stream_zip(entries):
+    """Octets d'une archive ZIP pour des entrées (nom dans l'archive, chemin du fichier)"""
+    sink = _ChunkSink()
+    used = set()
+    with zipfile.ZipFile(sink, mode="w") as archive:
+        for arcname, path in entries:
+            path = Path(path)
+            try:
+                zinfo = zipfile.ZipInfo.from_file(path, unique_arcname(arcname, used))
+            except (FileNotFoundError, ValueError) as e:
+                log.warning("Fichier ignoré %s: %s", path, e)
+                continue
+            if path.suffix.lower() in STORED_EXTENSIONS:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            # ZIP64 décidé par zipfile d'après la taille du fichier (zinfo.file_size)
+            with open(path, "rb") as source, archive.open(zinfo, mode="w") as target:
+                while True:
+                    chunk = source.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Répertoire central, écrit à la fermeture
+    yield sink.drain()
@@ -0,0 +1,97 @@
+import { useEffect, useRef } from 'react';
+import { getApiBaseUrl } from '../utils/config';
+import { apiService } from '../services/api';
+
+// Événements poussés par le backend sur /events (Server-Sent Events)
+export type DemandeEventType = 'demande.created' | 'demande.status_changed' | 'demande.deleted';
+
+export interface DemandeEvent {
+  type: DemandeEventType;
+  at: string;
+  demande: any;
+}
+
+const DEMANDE_EVENT_TYPES: DemandeEventType[] = ['demande.created', 'demande.status_changed', 'demande.deleted'];
+
+// Délai avant de redemander un ticket quand le flux a été fermé (ticket expiré, serveur redémarré)
+const RECONNECT_DELAY_MS = 5000;
+
+// Abonnement au flux des demandes: onEvent met à jour l'état local,
+// onReset recharge les listes quand des événements ont été manqués
+export const useDemandeEvents = (onEvent: (event: DemandeEvent) => void, onReset?: () => void) => {
+  const onEventRef = useRef(onEvent);
+  const onResetRef = useRef(onReset);
+  onEventRef.current = onEvent;
+  onResetRef.current = onReset;
+
+  useEffect(() => {
+    const token = localStorage.getItem('access_token') || localStorage.getItem('token');
+    if (!token || typeof EventSource === 'undefined') {
+      return;
+    }
+
+    let source: EventSource | null = null;
+    let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
+    let lastEventId = '';
+    let closed = false;
+
+    const handleEvent = (message: MessageEvent) => {
+      if (message.lastEventId) {
+        lastEventId = message.lastEventId;
+      }
+      try {
+        onEventRef.current(JSON.parse(message.data) as DemandeEvent);
+      } catch (error) {
+        console.error('❌ [Events] Événement illisible:', error);
+      }
+    };
+    const handleReset = () => {
+      console.log('🔄 [Events] Événements manqués, rechargement');
+      onResetRef.current?.();
+    };
+
+    // Le JWT ne passe jamais dans l'URL: un ticket court, valable pour /events seulement.
+    // EventSource se reconnecte seul (Last-Event-ID); une fois le flux fermé (ticket expiré),
+    // un nouveau ticket est demandé et les événements manqués sont rejoués depuis "since"
+    const connect = async () => {
+      let ticket: string;
+      try {
+        ticket = (await apiService.getEventsTicket()).ticket;
+      } catch (error) {
+        console.error('❌ [Events] Ticket refusé:', error);
+        scheduleReconnect();
+        return;
+      }
+      if (closed) {
+        return;
+      }
+      const params = new URLSearchParams({ ticket });
+      if (lastEventId) {
+        params.set('since', lastEventId);
+      }
+      source = new EventSource(`${getApiBaseUrl()}/events?${params.toString()}`);
+      DEMANDE_EVENT_TYPES.forEach(type => source!.addEventListener(type, handleEvent as EventListener));
+      source.addEventListener('reset', handleReset);
+      source.onerror = () => {
+        if (source?.readyState === EventSource.CLOSED) {
+          scheduleReconnect();
+        }
+      };
+    };
+    const scheduleReconnect = () => {
+      if (!closed) {
+        reconnectTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+      }
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      source?.close();
+    };
+  }, []);
+};
+
+export default useDemandeEvents;
@@ -5,6 +5,7 @@ import { Shield, Users, UserCheck, BarChart3, Settings, Bell } from 'lucide-reac
 import { useAuth } from '../../contexts/AuthContext';
 import { apiService } from '../../services/api';
 import { useDashboardRefresh } from '../../hooks/useDashboardRefresh';
+import { useDemandeEvents } from '../../hooks/useDemandeEvents';
 
 interface DashboardStats {
   totalUsers: number;
@@ -72,6 +73,11 @@ const CadminDashboard = () => {
     return cleanup;
   }, [onRefresh]);
 
+  // Demande créée, traitée ou supprimée ailleurs: seuls les compteurs sont rechargés
+  useDemandeEvents(() => {
+    refreshStats();
+  }, refreshStats);
+
   // Fonction pour gérer la navigation avec mise à jour des stats
   const handleNavigateWithRefresh = (path: string) => {
     navigate(path);
@@ -550,7 +550,7 @@ const CadminEnseignants = () => {
                       <div className="flex items-center space-x-3">
                         {enseignant.photo ? (
                           <img
-                            src={`${getApiBaseUrl()}${enseignant.photo}`}
+                            src={`${getApiBaseUrl()}/photos/list/${enseignant.photo.replace(/^\/+/, '')}`}
                             alt={`${enseignant.prenom} ${enseignant.nom}`}
                             className="w-10 h-10 rounded-full object-cover border-2 border-gray-300"
                           />
@@ -1088,7 +1088,7 @@ const CadminEnseignants = () => {
                           {selectedEnseignant?.photo && !photoPreview && (
                             <div className="mb-2">
                               <p className="text-sm text-gray-600 mb-1">Photo actuelle:</p>                              <img
-                                src={`${getApiBaseUrl()}${selectedEnseignant.photo}`}
+                                src={`${getApiBaseUrl()}/photos/profile/${selectedEnseignant.photo.replace(/^\/+/, '')}`}
                                 alt="Photo actuelle"
                                 className="w-20 h-20 object-cover rounded-full border-2 border-gray-300"
                               />
@@ -678,7 +678,7 @@ const CadminFonctionnaires = () => {
                       <div className="flex items-center space-x-3">
                         {fonctionnaire.photo ? (
                           <img
-                            src={`${getApiBaseUrl()}${fonctionnaire.photo}`}
+                            src={`${getApiBaseUrl()}/photos/list/${fonctionnaire.photo.replace(/^\/+/, '')}`}
                             alt={`${fonctionnaire.prenom} ${fonctionnaire.nom}`}
                             className="w-10 h-10 rounded-full object-cover border-2 border-gray-300"
                           />
@@ -829,7 +829,7 @@ const CadminFonctionnaires = () => {
                       <div className="flex items-center space-x-6">
                         {selectedFonctionnaire.photo ? (
                           <img
-                            src={`${getApiBaseUrl()}${selectedFonctionnaire.photo}`}
+                            src={`${getApiBaseUrl()}/photos/profile/${selectedFonctionnaire.photo.replace(/^\/+/, '')}`}
                             alt={`Photo de ${selectedFonctionnaire.prenom} ${selectedFonctionnaire.nom}`}
                             className="w-24 h-24 rounded-full object-cover border-4 border-gray-200"
                           />
@@ -4,6 +4,7 @@ import { Link, useParams, useNavigate } from 'react-router-dom';
 import { ArrowLeft, User, Calendar, FileText, Download, CheckCircle, XCircle, Clock } from 'lucide-react';
 import { useAuth } from '../../contexts/AuthContext';
 import { apiService } from '../../services/api';
+import { getApiBaseUrl } from '../../utils/config';
 
 interface DemandeDocument {
   id: number;
@@ -201,6 +202,53 @@ const DemandeDetailPage = () => {
     }
   };
 
+  const handleAttestation = async () => {
+    if (!demande) return;
+    
+    setActionLoading('attestation');
+    try {
+      // Réutilisée côté serveur si la demande n'a pas changé depuis la dernière émission
+      const attestation = await apiService.generateAttestation(demande.id);
+      window.open(`${getApiBaseUrl()}${attestation.pdf_url}`, '_blank');
+      setNotification({ type: 'success', message: `Attestation ${attestation.reference} prête` });
+    } catch (error) {
+      console.error('❌ [DEBUG] Erreur attestation:', error);
+      setNotification({ 
+        type: 'error', 
+        message: `Erreur lors de la génération de l'attestation: ${error instanceof Error ? error.message : 'Erreur inconnue'}` 
+      });
+    } finally {
+      setActionLoading(null);
+    }
+  };
+
+  const handleDownloadAllDocuments = async () => {
+    if (!demande) return;
+    
+    try {
+      // Archive ZIP construite à la volée par le serveur
+      const blob = await apiService.downloadDemandeDocumentsArchive(demande.id);
+      
+      const url = window.URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `demande_${demande.id}_documents.zip`;
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      window.URL.revokeObjectURL(url);
+      
+      setNotification({ type: 'success', message: 'Documents téléchargés avec succès!' });
+      
+    } catch (error) {
+      console.error('❌ [DEBUG] Erreur téléchargement archive:', error);
+      setNotification({ 
+        type: 'error', 
+        message: `Erreur lors du téléchargement: ${error instanceof Error ? error.message : 'Erreur inconnue'}` 
+      });
+    }
+  };
+
   const handleLogout = () => {
     logout();
     navigate('/');
@@ -375,6 +423,20 @@ const DemandeDetailPage = () => {
               </button>
             </div>
           )}
+          {demande.statut === 'APPROUVEE' && (
+            <button
+              onClick={handleAttestation}
+              disabled={actionLoading === 'attestation'}
+              className="flex items-center space-x-2 px-6 py-2 bg-gradient-to-r from-blue-500 to-blue-600 text-white rounded-lg shadow hover:from-blue-600 hover:to-blue-700 transition-all duration-200 font-semibold disabled:opacity-50"
+            >
+              {actionLoading === 'attestation' ? (
+                <div className="animate-spin rounded-full h-4 w-4 border-b-2 border-white"></div>
+              ) : (
+                <FileText className="w-4 h-4" />
+              )}
+              <span>Attestation PDF</span>
+            </button>
+          )}
         </div>
 
         <div className="grid grid-cols-1 lg:grid-cols-3 gap-8">
@@ -442,7 +504,18 @@ const DemandeDetailPage = () => {
               {/* Documents */}
               {demande.documents && demande.documents.length > 0 && (
                 <div>
-                  <h4 className="text-sm font-semibold text-gray-700 mb-3">Documents joints ({demande.documents.length})</h4>
+                  <div className="flex items-center justify-between mb-3">
+                    <h4 className="text-sm font-semibold text-gray-700">Documents joints ({demande.documents.length})</h4>
+                    {demande.documents.length > 1 && (
+                      <button
+                        onClick={handleDownloadAllDocuments}
+                        className="flex items-center space-x-1 px-3 py-1 bg-blue-600 text-white rounded hover:bg-blue-700 transition-colors text-sm"
+                      >
+                        <Download className="w-4 h-4" />
+                        <span>Tout télécharger (ZIP)</span>
+                      </button>
+                    )}
+                  </div>
                   <div className="space-y-2">
                     {demande.documents.map((doc, index) => (
                       <div key={index} className="flex items-center justify-between p-3 bg-gray-50 rounded-lg border border-gray-200">
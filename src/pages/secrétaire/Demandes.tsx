@@ -4,6 +4,7 @@ import { Link } from 'react-router-dom';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../../contexts/AuthContext';
 import { apiService } from '../../services/api';
+import { useDemandeEvents } from '../../hooks/useDemandeEvents';
 
 interface DemandeProps {
   id: number;
@@ -25,6 +26,33 @@ interface DemandeProps {
   };
 }
 
+// Demande reçue de l'API ou du flux /events, au format de la liste
+const normalizeDemande = (demande: any): DemandeProps => ({
+  id: demande.id || 0,
+  user_id: demande.user_id || 0,
+  type_demande: demande.type_demande || 'ATTESTATION',
+  titre: demande.titre || 'Sans titre',
+  description: demande.description || '',
+  date_debut: demande.date_debut || null,
+  date_fin: demande.date_fin || null,
+  statut: demande.statut || 'EN_ATTENTE',
+  commentaire_admin: demande.commentaire_admin || '',
+  created_at: demande.created_at || new Date().toISOString(),
+  user: demande.user ? {
+    id: demande.user.id || 0,
+    nom: demande.user.nom || 'Inconnu',
+    prenom: demande.user.prenom || 'Inconnu',
+    email: demande.user.email || '',
+    role: demande.user.role || 'user'
+  } : {
+    id: 0,
+    nom: 'Utilisateur',
+    prenom: 'Inconnu',
+    email: '',
+    role: 'user'
+  }
+});
+
 const DemandesPage = () => {
   const [demandes, setDemandes] = useState<DemandeProps[]>([]);
   const [filteredDemandes, setFilteredDemandes] = useState<DemandeProps[]>([]);
@@ -37,75 +65,72 @@ const DemandesPage = () => {
   const navigate = useNavigate();
   const { logout, user } = useAuth();
 
-  // Load demandes on component mount
-  useEffect(() => {
-    const fetchDemandes = async () => {
+  // Load demandes
+  const fetchDemandes = async () => {
+    try {
+      setLoading(true);
+      setError(null);
+      console.log('🔄 [DEBUG] Chargement des demandes...');
+      
+      // Récupérer toutes les demandes depuis la base de données
+      let data;
       try {
-        setLoading(true);
-        setError(null);
-        console.log('🔄 [DEBUG] Chargement des demandes...');
-        
-        // Récupérer toutes les demandes depuis la base de données
-        let data;
-        try {
-          // Essayer d'abord l'endpoint principal
-          data = await apiService.getDemandes();
-        } catch (error) {
-          console.log('📋 [DEBUG] Endpoint principal échoué, utilisation de l\'endpoint de test');
-          // En cas d'échec, utiliser l'endpoint de test
-          const testData = await apiService.getTestDemandes() as any;
-          data = testData?.demandes || testData || [];
-        }
-        console.log('📋 [DEBUG] Données des demandes reçues:', data);
-        
-        // Transform data to match interface
-        const transformedData = Array.isArray(data) ? data : [];
-        
-        // Assurer que chaque demande a les bonnes propriétés
-        const normalizedDemandes = transformedData.map((demande: any) => ({
-          id: demande.id || 0,
-          user_id: demande.user_id || 0,
-          type_demande: demande.type_demande || 'ATTESTATION',
-          titre: demande.titre || 'Sans titre',
-          description: demande.description || '',
-          date_debut: demande.date_debut || null,
-          date_fin: demande.date_fin || null,
-          statut: demande.statut || 'EN_ATTENTE',
-          commentaire_admin: demande.commentaire_admin || '',
-          created_at: demande.created_at || new Date().toISOString(),
-          user: demande.user ? {
-            id: demande.user.id || 0,
-            nom: demande.user.nom || 'Inconnu',
-            prenom: demande.user.prenom || 'Inconnu',
-            email: demande.user.email || '',
-            role: demande.user.role || 'user'
-          } : {
-            id: 0,
-            nom: 'Utilisateur',
-            prenom: 'Inconnu',
-            email: '',
-            role: 'user'
-          }
-        }));
-        
-        console.log('📝 [DEBUG] Demandes normalisées:', normalizedDemandes);
-        setDemandes(normalizedDemandes);
-        setFilteredDemandes(normalizedDemandes);
-        setTotalDemandes(normalizedDemandes.length);
-        
+        // Essayer d'abord l'endpoint principal
+        data = await apiService.getDemandes();
       } catch (error) {
-        console.error('Erreur lors du chargement des demandes:', error);
-        setError('Impossible de charger les demandes');
-        setDemandes([]);
-        setFilteredDemandes([]);
-      } finally {
-        setLoading(false);
+        console.log('📋 [DEBUG] Endpoint principal échoué, utilisation de l\'endpoint de test');
+        // En cas d'échec, utiliser l'endpoint de test
+        const testData = await apiService.getTestDemandes() as any;
+        data = testData?.demandes || testData || [];
       }
-    };
+      console.log('📋 [DEBUG] Données des demandes reçues:', data);
+      
+      // Transform data to match interface
+      const transformedData = Array.isArray(data) ? data : [];
+      
+      // Assurer que chaque demande a les bonnes propriétés
+      const normalizedDemandes = transformedData.map(normalizeDemande);
+      
+      console.log('📝 [DEBUG] Demandes normalisées:', normalizedDemandes);
+      setDemandes(normalizedDemandes);
+      setFilteredDemandes(normalizedDemandes);
+      setTotalDemandes(normalizedDemandes.length);
+      
+    } catch (error) {
+      console.error('Erreur lors du chargement des demandes:', error);
+      setError('Impossible de charger les demandes');
+      setDemandes([]);
+      setFilteredDemandes([]);
+    } finally {
+      setLoading(false);
+    }
+  };
 
+  // Load demandes on component mount
+  useEffect(() => {
     fetchDemandes();
   }, []);
 
+  // Mises à jour poussées par le serveur: la liste est corrigée sans rechargement
+  useDemandeEvents((event) => {
+    const changed = event.demande;
+    setDemandes(current => {
+      if (event.type === 'demande.deleted') {
+        return current.filter(demande => demande.id !== changed.id);
+      }
+      if (event.type === 'demande.created') {
+        return current.some(demande => demande.id === changed.id)
+          ? current
+          : [normalizeDemande(changed), ...current];
+      }
+      return current.map(demande =>
+        demande.id === changed.id
+          ? { ...demande, statut: changed.statut, commentaire_admin: changed.commentaire_admin || '' }
+          : demande
+      );
+    });
+  }, fetchDemandes);
+
   // Filter demandes based on search criteria
   useEffect(() => {
     if (demandes.length > 0) {
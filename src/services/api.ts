@@ -220,6 +220,11 @@ class ApiService {
     return this.request(`/test/demandes/${demandeId}`);
   }
 
+  // Ticket court pour ouvrir le flux /events (EventSource n'envoie pas d'en-tête Authorization)
+  async getEventsTicket() {
+    return this.request<{ ticket: string; expires_in: number }>('/events/ticket', { method: 'POST' });
+  }
+
   // Dashboard statistics methods
   async getDashboardStats() {
     try {
@@ -423,6 +428,30 @@ class ApiService {
     return response.blob();
   }
 
+  async generateAttestation(demandeId: number) {
+    return this.request<{ reference: string; cached: boolean; html_url: string; pdf_url: string }>(
+      `/demandes/${demandeId}/attestation`,
+      { method: 'POST' }
+    );
+  }
+
+  async downloadDemandeDocumentsArchive(demandeId: number) {
+    const url = this.buildUrl(`/demandes/${demandeId}/documents/archive`);
+    const token = this.token || localStorage.getItem('access_token');
+    
+    const response = await fetch(url, {
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
+
+    if (!response.ok) {
+      throw new Error('Erreur lors du téléchargement de l\'archive');
+    }
+
+    return response.blob();
+  }
+
   // Health check
   async healthCheck() {
     return this.request('/health');